@@ -0,0 +1,196 @@
+import math
+import threading
+import time
+from typing import Dict, List, Optional
+
+from flask import request
+
+from app.constants import ErrorMessages, HttpStatus
+from app.exceptions import ServiceOverloaded
+
+
+READ_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS'))
+
+# Ручки вне контроля: мониторинг должен отвечать и под нагрузкой.
+EXEMPT_ENDPOINTS = frozenset(('metrics', 'static'))
+
+SLOTS_KEY = 'bookstore.admission_slots'
+
+
+class TokenBucket:
+    __slots__ = ('tokens', 'updated_at')
+
+    def __init__(self, burst: float, now: float):
+        self.tokens = burst
+        self.updated_at = now
+
+    def take(self, rate: float, burst: float, now: float) -> float:
+        """Забирает токен; если его нет, возвращает, через сколько секунд он появится."""
+        self.tokens = min(burst, self.tokens + (now - self.updated_at) * rate)
+        self.updated_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / rate
+
+
+class AdmissionControl:
+    """Отказ в обработке запроса до любой работы с базой.
+
+    Включается через ADMISSION_CONTROL. У каждого клиента (адрес или
+    заголовок ADMISSION_CLIENT_HEADER) своё ведро токенов на
+    ADMISSION_CLIENT_RATE запросов в секунду с запасом
+    ADMISSION_CLIENT_BURST; пустое ведро даёт 429. Кроме того, число
+    одновременно обрабатываемых запросов процесса ограничено по классам
+    ручек из ADMISSION_CONCURRENCY: 'order' (оформление заказа), 'read' и
+    'write'. Соотношение лимитов задаёт, кого пропускать под нагрузкой:
+    чтения или заказы. Лимиты, которых нет в ADMISSION_CONCURRENCY,
+    выводятся из числа потоков процесса SERVER_THREADS и размера пула
+    соединений (concurrency()). И вёдра, и лимиты свои в каждом процессе:
+    при SERVER_WORKERS воркерах gunicorn сервер в целом пропускает в
+    SERVER_WORKERS раз больше. Если свободного места нет, ответ 503 возвращается
+    сразу, а не после ожидания соединения из пула. Оба ответа несут
+    Retry-After. Пакетные ручки (ADMISSION_BATCH_ENDPOINTS) сами по себе
+    не учитываются: токен и место своего класса берёт каждый вложенный
+    запрос пакета через admit().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.enabled = False
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._buckets: Dict[str, TokenBucket] = {}
+            self._slots: Dict[str, threading.BoundedSemaphore] = {}
+            self.throttled = 0
+            self.shed = 0
+
+    def init_app(self, app) -> None:
+        self.reset()
+        self.enabled = app.config.get('ADMISSION_CONTROL', False)
+        self.rate = app.config.get('ADMISSION_CLIENT_RATE', 50)
+        self.burst = app.config.get('ADMISSION_CLIENT_BURST', 100)
+        self.client_header = app.config.get('ADMISSION_CLIENT_HEADER')
+        self.max_clients = app.config.get('ADMISSION_MAX_CLIENTS', 10000)
+        self.order_endpoints = frozenset(
+            app.config.get('ADMISSION_ORDER_ENDPOINTS', ('shop.add_order',))
+        )
+        self.batch_endpoints = frozenset(
+            app.config.get('ADMISSION_BATCH_ENDPOINTS', ('shop.run_batch',))
+        )
+        self.retry_after = app.config.get('ADMISSION_RETRY_AFTER', 1)
+        self.configure_slots(app.config)
+        if self.enabled:
+            app.before_request(self.admit)
+            app.teardown_request(self.release)
+
+    @staticmethod
+    def concurrency(config) -> Dict[str, int]:
+        """Лимиты одновременных запросов одного процесса по классам ручек.
+
+        Больше SERVER_THREADS запросов процесс всё равно не обрабатывает,
+        поэтому лимит, равный числу потоков, никогда не срабатывает. Чтения
+        получают на поток меньше, но не больше размера пула соединений:
+        лишние ждали бы соединение, а не отказывались сразу. Записи и
+        заказы — каждый не больше половины потоков. ADMISSION_CONCURRENCY
+        переопределяет лимиты отдельных классов.
+        """
+        threads = config.get('SERVER_THREADS', 4)
+        pool_size = config.get('SQLALCHEMY_ENGINE_OPTIONS', {}).get(
+            'pool_size', config.get('SQLALCHEMY_POOL_SIZE') or 5,
+        )
+        limits = {
+            'read': max(1, min(threads - 1, pool_size)),
+            'write': max(1, threads // 2),
+            'order': max(1, threads // 2),
+        }
+        limits.update(config.get('ADMISSION_CONCURRENCY') or {})
+        return limits
+
+    def configure_slots(self, config) -> None:
+        """Создаёт места по concurrency(); сервер вызывает его снова в
+        процессе-воркере, когда SERVER_THREADS уже взят из командной строки."""
+        with self._lock:
+            self._slots = {
+                route_class: threading.BoundedSemaphore(limit)
+                for route_class, limit in self.concurrency(config).items()
+            }
+
+    def route_class(self) -> str:
+        if request.endpoint in self.order_endpoints:
+            return 'order'
+        return 'read' if request.method in READ_METHODS else 'write'
+
+    def client(self) -> str:
+        if self.client_header:
+            forwarded = request.headers.get(self.client_header)
+            if forwarded:
+                return forwarded.split(',')[0].strip()
+        return request.remote_addr or ''
+
+    def _prune(self, now: float) -> None:
+        # Ведро, простоявшее дольше времени полного пополнения, ничем не
+        # отличается от нового.
+        idle = self.burst / self.rate
+        stale: List[str] = [
+            client for client, bucket in self._buckets.items()
+            if now - bucket.updated_at >= idle
+        ]
+        for client in stale:
+            del self._buckets[client]
+        while len(self._buckets) >= self.max_clients:
+            self._buckets.pop(next(iter(self._buckets)))
+
+    def _wait(self, client: str) -> float:
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                if len(self._buckets) >= self.max_clients:
+                    self._prune(now)
+                bucket = self._buckets[client] = TokenBucket(self.burst, now)
+            return bucket.take(self.rate, self.burst, now)
+
+    def admit(self, client: Optional[str] = None) -> None:
+        """Пропускает текущий запрос или отклоняет его с 429 или 503.
+
+        `client` передаёт пакет для вложенных запросов: их контекст
+        создаётся заново и не знает адреса клиента.
+        """
+        if request.endpoint in EXEMPT_ENDPOINTS or request.endpoint in self.batch_endpoints:
+            return
+        wait = self._wait(self.client() if client is None else client)
+        if wait:
+            with self._lock:
+                self.throttled += 1
+            retry_after = max(1, math.ceil(wait))
+            raise ServiceOverloaded(
+                code=HttpStatus.HTTP_429_TOO_MANY_REQUESTS,
+                error_text=ErrorMessages.TOO_MANY_REQUESTS.format(retry_after),
+                retry_after=retry_after,
+            )
+        slots = self._slots.get(self.route_class())
+        if slots is None:
+            return
+        if not slots.acquire(blocking=False):
+            with self._lock:
+                self.shed += 1
+            raise ServiceOverloaded(
+                code=HttpStatus.HTTP_503_SERVICE_UNAVAILABLE,
+                error_text=ErrorMessages.SERVICE_OVERLOADED.format(self.retry_after),
+                retry_after=self.retry_after,
+            )
+        # В environ, а не в g: g общий для вложенных запросов пакета
+        # (/store/batch), и их завершение не должно освобождать место.
+        request.environ[SLOTS_KEY] = slots
+
+    @staticmethod
+    def release(error: Optional[BaseException] = None) -> None:
+        slots = request.environ.pop(SLOTS_KEY, None)
+        if slots is not None:
+            slots.release()
+
+
+admission = AdmissionControl()
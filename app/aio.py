@@ -0,0 +1,107 @@
+import asyncio
+import functools
+import threading
+from typing import Any, Awaitable, Callable, Optional
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+
+
+ASYNC_DRIVERS = {
+    'mysql': 'mysql+aiomysql',
+    'mysql+pymysql': 'mysql+aiomysql',
+    'sqlite': 'sqlite+aiosqlite',
+    'sqlite+pysqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+    'postgresql+psycopg2': 'postgresql+asyncpg',
+}
+
+
+def async_uri(uri: str) -> str:
+    url = make_url(uri)
+    return str(url.set(drivername=ASYNC_DRIVERS.get(url.drivername, url.drivername)))
+
+
+class AsyncDatabase:
+    """Асинхронный движок SQLAlchemy на отдельном потоке с event loop.
+
+    Включается через ASYNC_PARALLEL_READS и касается только методов с
+    offload(): чтений книги, магазина, пользователя, остатков и продаж
+    магазина. Поток воркера по-прежнему ждёт результат, поэтому число
+    одновременно обрабатываемых запросов так и ограничено SERVER_THREADS;
+    выигрыш в том, что независимые запросы одного обращения (например,
+    проверки магазина и книги) идут параллельно. Остальные ручки читают
+    синхронно. URI берётся из ASYNC_SQLALCHEMY_DATABASE_URI или выводится
+    из SQLALCHEMY_DATABASE_URI заменой драйвера.
+    """
+
+    def __init__(self):
+        self.engine = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.engine is not None
+
+    def init_app(self, app) -> None:
+        self.close()
+        if not app.config.get('ASYNC_PARALLEL_READS', False):
+            return
+        uri = (
+            app.config.get('ASYNC_SQLALCHEMY_DATABASE_URI')
+            or async_uri(app.config['SQLALCHEMY_DATABASE_URI'])
+        )
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self.loop.run_forever, name='async-db', daemon=True,
+        )
+        self._thread.start()
+        self.engine = create_async_engine(uri, **app.config.get('ASYNC_ENGINE_OPTIONS', {}))
+
+    def close(self) -> None:
+        if self.engine is not None:
+            self.run(self.engine.dispose())
+            self.engine = None
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join()
+            self.loop.close()
+            self.loop = None
+
+    def after_fork(self, app) -> None:
+        """Запускает свой цикл в дочернем процессе: поток родителя в нём не живёт."""
+        self.engine = None
+        self.loop = None
+        self._thread = None
+        self.init_app(app)
+
+    def run(self, coroutine: Awaitable) -> Any:
+        """Выполняет корутину в цикле движка и ждёт результат в текущем потоке."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    async def all(self, statement) -> list:
+        async with self.engine.connect() as connection:
+            return (await connection.execute(statement)).all()
+
+    async def first(self, statement) -> Any:
+        async with self.engine.connect() as connection:
+            return (await connection.execute(statement)).first()
+
+    async def scalar(self, statement) -> Any:
+        async with self.engine.connect() as connection:
+            return await connection.scalar(statement)
+
+    def offload(self, coroutine_function: Callable[..., Awaitable]) -> Callable:
+        """С ASYNC_PARALLEL_READS выполняет вместо метода `coroutine_function` и ждёт её."""
+        def decorator(func: Callable) -> Callable:
+            @functools.wraps(func)
+            def wrapped(*args, **kwargs):
+                if self.enabled:
+                    return self.run(coroutine_function(*args, **kwargs))
+                return func(*args, **kwargs)
+            return wrapped
+        return decorator
+
+
+async_db = AsyncDatabase()
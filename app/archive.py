@@ -0,0 +1,77 @@
+from datetime import date, datetime, time, timedelta
+from typing import Optional
+
+from sqlalchemy import and_, delete, func, insert, select
+
+from app import models as mdl
+from app.constants import BULK_CHUNK_SIZE
+
+
+# Горячая таблица и архив. Архив в основном старше горячих заказов, но
+# не целиком: самый новый заказ не архивируется, а загрузчик может
+# добавить в горячую таблицу старые заказы, поэтому списки сливают части
+# по ключу сортировки (paginate_parts).
+ORDER_TABLES = (
+    (mdl.Order, mdl.OrderItem),
+    (mdl.OrderArchive, mdl.OrderItemArchive),
+)
+
+
+def horizon(days: int, today: Optional[date] = None) -> datetime:
+    """Граница архивации: заказы с reg_date раньше неё уходят в архив."""
+    today = today or datetime.utcnow().date()
+    return datetime.combine(today - timedelta(days=days), time())
+
+
+def _copy(source, target, where):
+    columns = [column.name for column in target.__table__.columns]
+    return insert(target.__table__).from_select(
+        columns,
+        select(*[source.__table__.c[name] for name in columns]).where(where),
+    )
+
+
+def archive(before: datetime, chunk_size: int = BULK_CHUNK_SIZE, log=print) -> int:
+    """Переносит заказы с reg_date раньше `before` в архивные таблицы.
+
+    Каждая порция из `chunk_size` заказов копируется и удаляется одной
+    транзакцией, поэтому прерванный перенос можно просто запустить снова.
+    Самый новый заказ остаётся в горячей таблице: MySQL до 8.0 и SQLite
+    выдают следующий id по максимальному, и иначе id архивных заказов
+    могли бы выдаться повторно.
+    """
+    last_id = mdl.db.session.query(func.max(mdl.Order.id)).scalar()
+    moved = 0
+    while last_id is not None:
+        order_ids = [
+            order_id for order_id, in (
+                mdl.db.session.query(mdl.Order.id)
+                    .filter(mdl.Order.reg_date < before, mdl.Order.id < last_id)
+                    .order_by(mdl.Order.id)
+                    .limit(chunk_size)
+            )
+        ]
+        if not order_ids:
+            break
+        # Те же заказы, но диапазоном первичного ключа: длинный IN
+        # SQLite выполняет полным проходом по таблице.
+        chunk = and_(
+            mdl.Order.id.between(order_ids[0], order_ids[-1]),
+            mdl.Order.reg_date < before,
+        )
+        mdl.db.session.execute(_copy(mdl.Order, mdl.OrderArchive, chunk))
+        mdl.db.session.execute(_copy(
+            mdl.OrderItem, mdl.OrderItemArchive, mdl.OrderItem.order_id.in_(order_ids),
+        ))
+        mdl.db.session.execute(
+            delete(mdl.OrderItem).where(mdl.OrderItem.order_id.in_(order_ids)),
+            execution_options={'synchronize_session': False},
+        )
+        mdl.db.session.execute(
+            delete(mdl.Order).where(chunk),
+            execution_options={'synchronize_session': False},
+        )
+        mdl.db.session.commit()
+        moved += len(order_ids)
+        log(f'{moved} orders archived')
+    return moved
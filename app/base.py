@@ -1,26 +1,75 @@
+from typing import Optional
 from flask import Flask
 from app.views import shop_bp
 from init_db import db
 from app import schemas
-from flask_apispec import marshal_with
-from app.exceptions import BookStoreException
+from app.serializers import marshal_with
+from app.exceptions import BookStoreException, ServiceOverloaded
+from app.cache import entity_cache
+from app.search import book_index
+from app.metrics import metrics
+from app.replicas import replicas
+from app.aio import async_db
+from app.snapshots import snapshots
+from app.group_commit import group_commit
+from app.totals import approximate
+from app.admission import admission
+from app.singleflight import single_flight
 
 
 @marshal_with(schemas.Response)
 def handle_book_store_exception(error):
-    return {'code': error.code, 'error_text': error.error_text}
+    return {
+        'code': error.code,
+        'error_text': error.error_text,
+        'error_fields': error.error_fields,
+    }
 
 
 
+def handle_service_overloaded(error):
+    response = handle_book_store_exception(error)
+    response.status_code = error.code
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+
 def add_error_handlers(app):
     app.register_error_handler(BookStoreException, handle_book_store_exception)
+    app.register_error_handler(ServiceOverloaded, handle_service_overloaded)
     
 
 
-def create_app():
+def create_app(config: Optional[dict] = None):
     flask_app = Flask(import_name=__name__)
     flask_app.config.from_pyfile('config.py', silent=True)
+    flask_app.config.from_envvar('BOOKSTORE_SETTINGS', silent=True)
+    flask_app.config.update(config or {})
     db.init_app(flask_app)
+    replicas.init_app(flask_app)
+    async_db.init_app(flask_app)
+    entity_cache.init_app(flask_app)
+    book_index.init_app(flask_app)
+    snapshots.init_app(flask_app)
+    group_commit.init_app(flask_app)
+    approximate.init_app(flask_app)
+    single_flight.init_app(flask_app)
+    metrics.init_app(flask_app)
+    admission.init_app(flask_app)
+    metrics.gauge('bookstore_entity_cache_hits', lambda: entity_cache.hits)
+    metrics.gauge('bookstore_entity_cache_misses', lambda: entity_cache.misses)
+    for name in ('hits', 'misses', 'rebuilds', 'entries', 'bytes'):
+        metrics.gauge(
+            f'bookstore_snapshot_{name}',
+            lambda name=name: snapshots.stats()[name],
+        )
+    metrics.gauge('bookstore_single_flight_leaders', lambda: single_flight.leaders)
+    metrics.gauge('bookstore_single_flight_shared', lambda: single_flight.shared)
+    metrics.gauge('bookstore_single_flight_ratio', lambda: single_flight.ratio)
+    metrics.gauge('bookstore_admission_throttled', lambda: admission.throttled)
+    metrics.gauge('bookstore_admission_shed', lambda: admission.shed)
+    metrics.gauge('bookstore_group_commit_batches', lambda: group_commit.batches)
+    metrics.gauge('bookstore_group_commit_jobs', lambda: group_commit.jobs)
     flask_app.register_blueprint(shop_bp, url_prefix='/store')
     add_error_handlers(flask_app)
     
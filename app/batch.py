@@ -0,0 +1,180 @@
+import functools
+from itertools import takewhile
+from typing import Callable, Dict, Hashable, List, NamedTuple, Optional, Tuple
+from urllib.parse import urlsplit
+
+from flask import current_app, g, has_app_context, request
+from marshmallow import ValidationError
+from werkzeug.exceptions import HTTPException
+
+from app import models as mdl, schemas
+from app.admission import admission
+from app.cache import entity_cache
+from app.constants import ErrorMessages, HttpStatus
+from app.exceptions import BookStoreException
+from app.queries import books_by_ids, shops_by_ids, users_by_ids
+from app.replicas import replicas
+
+
+READ_METHODS = frozenset(('GET',))
+
+
+class Prefetch(NamedTuple):
+    kind: str
+    argument: str
+    query: Callable
+
+
+# Ручки чтения одной сущности: их вызовы в пакете загружаются одним IN.
+PREFETCH = {
+    'shop.get_book': Prefetch('book', 'book_id', books_by_ids),
+    'shop.get_shop': Prefetch('shop', 'shop_id', shops_by_ids),
+    'shop.get_user': Prefetch('user', 'user_id', users_by_ids),
+}
+
+Step = Tuple[dict, Optional[str], dict]
+
+
+def prefetched(kind: str) -> Callable:
+    """Загрузчик сущности, который сначала смотрит в строки, загруженные пакетом."""
+    def decorator(loader: Callable) -> Callable:
+        @functools.wraps(loader)
+        def wrapped(entity_id: Hashable):
+            rows = g.get('batch_rows') if has_app_context() else None
+            if rows and (kind, entity_id) in rows:
+                return rows[kind, entity_id]
+            return loader(entity_id)
+        return wrapped
+    return decorator
+
+
+def _match(operation: dict) -> Step:
+    """Ручка и её аргументы для вложенного запроса; ручки вне блюпринта
+    пакета и сам пакет недоступны."""
+    adapter = current_app.create_url_adapter(request)
+    try:
+        endpoint, view_args = adapter.match(
+            urlsplit(operation['path']).path, method=operation['method'],
+        )
+    except HTTPException:
+        return operation, None, {}
+    if not endpoint.startswith(f'{request.blueprint}.') or endpoint == request.endpoint:
+        return operation, None, {}
+    return operation, endpoint, view_args
+
+
+def _reads(plan: List[Step]) -> List[Step]:
+    return list(takewhile(lambda step: step[0]['method'] in READ_METHODS, plan))
+
+
+def _context(operation: dict):
+    return current_app.test_request_context(
+        operation['path'], method=operation['method'], json=operation['body'],
+    )
+
+
+@replicas.read()
+def _load(prefetch: Prefetch, ids: List[Hashable]) -> Dict[tuple, Optional[dict]]:
+    rows = {(prefetch.kind, entity_id): None for entity_id in ids}
+    for row in mdl.db.session.execute(prefetch.query(ids)):
+        row = dict(row._mapping)
+        rows[prefetch.kind, row.pop('entity_id')] = row
+    return rows
+
+
+def _prefetch(reads: List[Step]) -> Dict[tuple, Optional[dict]]:
+    """Загружает сущности, которые прочитают вызовы из `reads`, по запросу на вид.
+
+    Пропускает то, что уже лежит в кэше сущностей, и то, что читается с
+    основной базы из-за окна read-your-writes.
+    """
+    ids: Dict[str, List[Hashable]] = {}
+    for _, endpoint, view_args in reads:
+        prefetch = PREFETCH.get(endpoint)
+        if prefetch is None:
+            continue
+        entity_id = view_args[prefetch.argument]
+        if (
+                entity_cache.peek(prefetch.kind, entity_id) is None
+                and not replicas.recently_written((prefetch.kind, entity_id))
+        ):
+            ids.setdefault(endpoint, []).append(entity_id)
+    rows = {}
+    for endpoint, entity_ids in ids.items():
+        entity_ids = sorted(set(entity_ids))
+        if len(entity_ids) > 1:
+            rows.update(_load(PREFETCH[endpoint], entity_ids))
+    return rows
+
+
+def _dispatch(operation: dict, endpoint: Optional[str]) -> dict:
+    """Выполняет вложенный запрос; допуск он проходит сам, по своему классу ручки."""
+    app = current_app._get_current_object()
+    client = admission.client() if admission.enabled else None
+    with _context(operation):
+        try:
+            if endpoint is None:
+                raise BookStoreException(
+                    code=HttpStatus.HTTP_404_NOT_FOUND,
+                    error_text=ErrorMessages.BATCH_ROUTE_NOT_FOUND.format(
+                        operation['method'], operation['path'],
+                    ),
+                )
+            if admission.enabled:
+                admission.admit(client)
+            result = app.dispatch_request()
+        except Exception as error:
+            # Сессия общая для всего пакета: упавшая запись не должна
+            # ломать следующие запросы.
+            mdl.db.session.rollback()
+            result = app.handle_user_exception(error)
+        response = app.make_response(result)
+        return {'status': response.status_code, 'body': response.get_json(silent=True)}
+
+
+def run(operations: List[dict]) -> List[dict]:
+    """Выполняет вложенные запросы по порядку в текущем контексте приложения.
+
+    У всех запросов одна сессия базы. Перед каждой серией чтений подряд
+    одиночные чтения книг, магазинов и пользователей загружаются одним
+    IN на вид; запись сбрасывает загруженное и прочитанные версии, чтобы
+    следующие чтения видели её результат.
+    """
+    plan = [_match(operation) for operation in operations]
+    responses = []
+    try:
+        for index, (operation, endpoint, _) in enumerate(plan):
+            read = operation['method'] in READ_METHODS
+            if read and 'batch_rows' not in g:
+                g.batch_rows = _prefetch(_reads(plan[index:]))
+            responses.append(_dispatch(operation, endpoint))
+            if not read:
+                g.pop('batch_rows', None)
+                g.pop('version_state', None)
+    finally:
+        g.pop('batch_rows', None)
+    return responses
+
+
+def budget() -> int:
+    """Бюджет пакета: сумма бюджетов вложенных ручек и загрузок по IN."""
+    try:
+        operations = schemas.BatchRequest().load(request.get_json(silent=True) or {})
+    except ValidationError:
+        return 0
+    plan = [_match(operation) for operation in operations['requests']]
+    total = 0
+    for index, (operation, endpoint, view_args) in enumerate(plan):
+        read = operation['method'] in READ_METHODS
+        if read and (index == 0 or plan[index - 1][0]['method'] not in READ_METHODS):
+            total += len({
+                endpoint for _, endpoint, _ in _reads(plan[index:]) if endpoint in PREFETCH
+            })
+        if endpoint is None:
+            continue
+        limit = getattr(current_app.view_functions[endpoint], 'query_budget', 0)
+        if callable(limit):
+            with _context(operation):
+                limit = limit(**view_args)
+        total += limit
+    return total
@@ -0,0 +1,97 @@
+import functools
+import logging
+import threading
+from typing import Callable, Optional, Union
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.exceptions import QueryBudgetExceeded
+
+
+Limit = Union[int, Callable[..., int]]
+
+_local = threading.local()
+
+
+def _active() -> list:
+    if not hasattr(_local, 'budgets'):
+        _local.budgets = []
+    return _local.budgets
+
+
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    if conn.get_execution_options().get('skip_query_budget'):
+        return
+    for budget in _active():
+        budget.count += 1
+
+
+_listening = False
+
+
+def _listen_engines() -> None:
+    global _listening
+    if not _listening:
+        event.listen(Engine, 'before_cursor_execute', _count_statement)
+        _listening = True
+
+
+def _strict() -> bool:
+    if not has_app_context():
+        return False
+    return current_app.config.get('QUERY_BUDGET_STRICT', current_app.testing)
+
+
+class QueryBudget:
+    """Ограничение на число SQL-запросов внутри блока или функции.
+
+    Считаются все запросы текущего потока, включая ленивые подгрузки при
+    сериализации. При превышении пишет предупреждение в лог, а при
+    QUERY_BUDGET_STRICT (по умолчанию в режиме testing) бросает
+    QueryBudgetExceeded. Бюджеты могут быть вложенными.
+    """
+
+    def __init__(self, limit: Limit, name: Optional[str] = None):
+        self.limit = limit
+        self.name = name
+        self.count = 0
+
+    def __enter__(self) -> 'QueryBudget':
+        _listen_engines()
+        self.count = 0
+        _active().append(self)
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        _active().remove(self)
+        if exc_type is not None or self.count <= self.limit:
+            return
+        if _strict():
+            raise QueryBudgetExceeded(self.name, self.limit, self.count)
+        logging.warning(
+            f'query budget exceeded: {self.name}, '
+            f'{self.count} SQL statements, budget {self.limit}'
+        )
+
+    def __call__(self, func: Callable) -> Callable:
+        name = self.name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapped(*args, **kwargs):
+            limit = self.limit(*args, **kwargs) if callable(self.limit) else self.limit
+            with QueryBudget(limit, name):
+                return func(*args, **kwargs)
+
+        wrapped.query_budget = self.limit
+        return wrapped
+
+
+def query_budget(limit: Limit, name: Optional[str] = None) -> QueryBudget:
+    """Декоратор или контекстный менеджер с бюджетом `limit` запросов.
+
+    Для декоратора `limit` может быть функцией от аргументов вызова,
+    если число запросов законно растёт с размером входа.
+    """
+    return QueryBudget(limit, name)
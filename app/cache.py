@@ -0,0 +1,166 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+
+class CacheBackend:
+    """Интерфейс хранилища кэша. Общий бэкенд (например, redis) реализует те же методы."""
+
+    def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+
+class LRUBackend(CacheBackend):
+    def __init__(self, maxsize: int = 10000, ttl: float = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+class DictBackend(CacheBackend):
+    """Локальная замена общего бэкенда: значения хранятся сериализованными, как в сети."""
+
+    def __init__(self, store: Optional[Dict[str, bytes]] = None):
+        self.store = {} if store is None else store
+
+    def get(self, key: str) -> Optional[Any]:
+        raw = self.store.get(key)
+        return None if raw is None else pickle.loads(raw)
+
+    def set(self, key: str, value: Any) -> None:
+        self.store[key] = pickle.dumps(value)
+
+    def delete(self, key: str) -> None:
+        self.store.pop(key, None)
+
+    def clear(self) -> None:
+        self.store.clear()
+
+
+class EntityCache:
+    def __init__(self, backend: Optional[CacheBackend] = None):
+        self.backend = backend or LRUBackend()
+        self.enabled = True
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, app) -> None:
+        backend = app.config.get('ENTITY_CACHE_BACKEND')
+        if backend is None:
+            backend = LRUBackend(
+                maxsize=app.config.get('ENTITY_CACHE_MAXSIZE', 10000),
+                ttl=app.config.get('ENTITY_CACHE_TTL', 300),
+            )
+        self.backend = backend
+        self.enabled = app.config.get('ENTITY_CACHE_ENABLED', True)
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def _count(self, hit: bool) -> None:
+        # Счётчики меняют потоки воркера одновременно, а += не атомарен.
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    @staticmethod
+    def key(kind: str, entity_id: Hashable) -> str:
+        return f'{kind}:{entity_id}'
+
+    def get_or_load(
+            self,
+            kind: str,
+            entity_id: Hashable,
+            loader: Callable[[Hashable], Optional[Any]],
+    ) -> Optional[Any]:
+        if not self.enabled:
+            return loader(entity_id)
+        key = self.key(kind, entity_id)
+        value = self.backend.get(key)
+        self._count(value is not None)
+        if value is not None:
+            return value
+        value = loader(entity_id)
+        if value is not None:
+            self.backend.set(key, value)
+        return value
+
+    async def get_or_load_async(
+            self,
+            kind: str,
+            entity_id: Hashable,
+            loader: Callable[[Hashable], Awaitable[Optional[Any]]],
+    ) -> Optional[Any]:
+        if not self.enabled:
+            return await loader(entity_id)
+        key = self.key(kind, entity_id)
+        value = self.backend.get(key)
+        self._count(value is not None)
+        if value is not None:
+            return value
+        value = await loader(entity_id)
+        if value is not None:
+            self.backend.set(key, value)
+        return value
+
+    def peek(self, kind: str, entity_id: Hashable) -> Optional[Any]:
+        """Значение из кэша без загрузки и без учёта в статистике."""
+        if not self.enabled:
+            return None
+        return self.backend.get(self.key(kind, entity_id))
+
+    def prime(self, kind: str, entity_id: Hashable, value: Any) -> None:
+        if self.enabled:
+            self.backend.set(self.key(kind, entity_id), value)
+
+    def invalidate(self, kind: str, entity_id: Hashable) -> None:
+        self.backend.delete(self.key(kind, entity_id))
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+
+entity_cache = EntityCache()
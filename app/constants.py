@@ -7,12 +7,43 @@ class ErrorMessages:
     USER_ALREADY_EXISTS = 'Пользователь с такими данными уже существует'
     SHOP_ALREADY_EXISTS = 'Магазин с такими данными уже существует'
     CAN_NOT_ADD_ORDER = 'Не удалось добавить заказ в базу'
+    ORDER_HAS_INVALID_ITEMS = 'Заказ содержит несуществующие книги или магазины'
     CAN_NOT_ADD_BOOK = 'Не удалось добавить книгу в базу'
     CAN_NOT_ADD_SHOP = 'Не удалось добавить магазин в базу'
+    BOOK_ALREADY_EXISTS = 'Книга с такими данными уже существует'
+    NOT_ENOUGH_STOCK = 'Недостаточно экземпляров книги {} в магазине {}'
+    INVALID_DATE_RANGE = 'Некорректный период: от {} до {}'
+    INVALID_CURSOR = 'Некорректный курсор пагинации'
+    ORDER_QUEUE_FULL = 'Слишком много заказов, повторите попытку позже'
+    ORDER_COMMIT_TIMEOUT = 'Заказ не подтверждён вовремя, проверьте заказы перед повтором'
+    TOO_MANY_REQUESTS = 'Слишком много запросов, повторите попытку через {} с'
+    SERVICE_OVERLOADED = 'Сервис перегружен, повторите попытку через {} с'
+    BATCH_ROUTE_NOT_FOUND = 'Ручка {} {} не существует или недоступна в пакете'
 
 
 MAX_ROWS = 100
 
+BOOK_SORT_KEYS = ('id', 'name', 'release_date')
+
+BULK_MAX_ROWS = 10000
+BULK_CHUNK_SIZE = 500
+LOAD_CHUNK_SIZE = 5000
+
+SEARCH_MIN_PREFIX = 2
+SEARCH_MAX_QUERY = 200
+
+MAX_STOCK_SHARDS = 64
+STOCK_RETRIES = 3
+
+SALES_SHARDS = 8
+TOTAL_SHARDS = 8
+SALES_MAX_DAYS = 366
+SALES_DEFAULT_DAYS = 30
+TOP_BOOKS_DEFAULT_DAYS = 7
+
+BATCH_MAX_REQUESTS = 50
+BATCH_METHODS = ('GET', 'POST', 'PUT')
+
 
 class HttpStatus:
     HTTP_100_CONTINUE = 100
@@ -1,12 +1,29 @@
 from app.constants import HttpStatus
-from typing import Optional
+from typing import List, Optional
 
 class BookStoreException(Exception):
     def __init__(
             self,
             code: Optional[int] = None,
             error_text: Optional[str] = None,
+            error_fields: Optional[List[dict]] = None,
     ):
         self.code = code or HttpStatus.HTTP_200_OK
         self.error_text = error_text or ''
+        self.error_fields = error_fields or []
 
+
+class ServiceOverloaded(BookStoreException):
+    """Запрос отклонён до обработки; клиенту стоит повторить его через `retry_after` секунд."""
+
+    def __init__(self, code: int, error_text: str, retry_after: int = 1):
+        super().__init__(code=code, error_text=error_text)
+        self.retry_after = retry_after
+
+
+class QueryBudgetExceeded(Exception):
+    def __init__(self, name: str, limit: int, count: int):
+        super().__init__(f'{name}: {count} SQL statements, budget {limit}')
+        self.name = name
+        self.limit = limit
+        self.count = count
@@ -0,0 +1,186 @@
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, List, Optional
+
+from app import models as mdl
+from app.constants import ErrorMessages, HttpStatus
+from app.exceptions import BookStoreException, ServiceOverloaded
+
+
+class _Job:
+    __slots__ = ('func', 'args', 'done', 'result', 'error', 'started', 'cancelled')
+
+    def __init__(self, func: Callable, args: tuple):
+        self.func = func
+        self.args = args
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.started = False
+        self.cancelled = False
+
+
+_STOP = object()
+
+
+class GroupCommitter:
+    """Общий коммит для записей, пришедших почти одновременно.
+
+    Включается через GROUP_COMMIT. Запросы кладут работу в ограниченную
+    очередь и ждут; отдельный поток собирает пачку за GROUP_COMMIT_WINDOW_MS
+    (не больше GROUP_COMMIT_MAX_BATCH), выполняет каждую работу в своей
+    точке сохранения и фиксирует пачку одним коммитом. Ошибка одной работы
+    откатывает только её точку сохранения. Если не удался сам коммит,
+    работы пачки повторяются по одной. Переполненная очередь
+    (GROUP_COMMIT_QUEUE_SIZE) даёт ответ 503. Работа, которую не взяли
+    за GROUP_COMMIT_TIMEOUT секунд, снимается с очереди с тем же ответом;
+    если же её уже выполняют, а коммита нет ещё столько же, запрос
+    получает 504 без гарантии, что заказ не записан.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.enabled = False
+        self.batches = 0
+        self.jobs = 0
+        self._queue: Optional[queue.Queue] = None
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app) -> None:
+        self.close()
+        self.app = app
+        self.enabled = app.config.get('GROUP_COMMIT', False)
+        self.window = app.config.get('GROUP_COMMIT_WINDOW_MS', 5) / 1000
+        self.max_batch = app.config.get('GROUP_COMMIT_MAX_BATCH', 50)
+        self._queue = queue.Queue(app.config.get('GROUP_COMMIT_QUEUE_SIZE', 500))
+        self.timeout = app.config.get('GROUP_COMMIT_TIMEOUT', 10)
+        self.retry_after = app.config.get('GROUP_COMMIT_RETRY_AFTER', 1)
+        self.batches = 0
+        self.jobs = 0
+
+    def close(self) -> None:
+        with self._lock:
+            worker, self._worker = self._worker, None
+        if worker is not None:
+            self._queue.put(_STOP)
+            worker.join()
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._worker is not None:
+                return
+            self._worker = threading.Thread(
+                target=self._work, name='group-commit', daemon=True,
+            )
+            self._worker.start()
+
+    def run(self, func: Callable, *args) -> Any:
+        """Выполняет `func(*args)` в общей транзакции и ждёт её коммита."""
+        self._start()
+        job = _Job(func, args)
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            raise self._overloaded()
+        if not job.done.wait(self.timeout):
+            with self._lock:
+                job.cancelled = not job.started
+            if job.cancelled:
+                raise self._overloaded()
+            if not job.done.wait(self.timeout):
+                raise BookStoreException(
+                    code=HttpStatus.HTTP_504_GATEWAY_TIMEOUT,
+                    error_text=ErrorMessages.ORDER_COMMIT_TIMEOUT,
+                )
+        if job.error is not None:
+            raise job.error
+        return job.result
+
+    def _overloaded(self) -> ServiceOverloaded:
+        return ServiceOverloaded(
+            code=HttpStatus.HTTP_503_SERVICE_UNAVAILABLE,
+            error_text=ErrorMessages.ORDER_QUEUE_FULL,
+            retry_after=self.retry_after,
+        )
+
+    def _claim(self, job: _Job) -> bool:
+        """Отмечает работу начатой, если запрос ещё ждёт её."""
+        with self._lock:
+            if job.cancelled:
+                return False
+            job.started = True
+            return True
+
+    def _collect(self, first: _Job) -> List[_Job]:
+        batch = [first]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                job = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if job is _STOP:
+                self._queue.put(_STOP)
+                break
+            batch.append(job)
+        return batch
+
+    def _work(self) -> None:
+        while True:
+            job = self._queue.get()
+            if job is _STOP:
+                return
+            batch = [job for job in self._collect(job) if self._claim(job)]
+            if not batch:
+                continue
+            with self.app.app_context():
+                try:
+                    self._commit(batch)
+                except Exception as error:
+                    logging.exception('group commit failed')
+                    for job in batch:
+                        if not job.done.is_set():
+                            job.error = error
+                            job.done.set()
+
+    @staticmethod
+    def _execute(job: _Job) -> bool:
+        try:
+            with mdl.db.session.begin_nested():
+                job.result = job.func(*job.args)
+        except Exception as error:
+            job.error = error
+        return job.error is None
+
+    def _commit(self, batch: List[_Job]) -> None:
+        session = mdl.db.session
+        for job in batch:
+            self._execute(job)
+        try:
+            session.commit()
+        except Exception:
+            session.rollback()
+            logging.exception(f'group commit of {len(batch)} jobs failed, retrying one by one')
+            for job in batch:
+                job.result = job.error = None
+                try:
+                    if self._execute(job):
+                        session.commit()
+                    else:
+                        session.rollback()
+                except Exception as error:
+                    session.rollback()
+                    job.error = error
+        self.batches += 1
+        self.jobs += len(batch)
+        for job in batch:
+            job.done.set()
+
+
+group_commit = GroupCommitter()
@@ -0,0 +1,242 @@
+import random
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import and_, case, func, insert, select, update
+
+from app import models as mdl
+from app.constants import BULK_CHUNK_SIZE, MAX_ROWS, STOCK_RETRIES
+from app.pagination import Page, page, seek
+from app.queries import keys_in
+
+
+StockKey = Tuple[int, int]
+# (shop_id, book_id, shard)
+ShardKey = Tuple[int, int, int]
+
+
+def _chunks(keys: Iterable) -> Iterator[list]:
+    # OR из равенств keys_in SQLite разбирает в дерево глубиной в число
+    # ключей и глубже 1000 не принимает, поэтому ключи идут порциями.
+    keys = list(keys)
+    for start in range(0, len(keys), BULK_CHUNK_SIZE):
+        yield keys[start:start + BULK_CHUNK_SIZE]
+
+
+def read_shards(keys: Iterable[StockKey]) -> Dict[StockKey, Dict[int, int]]:
+    """Остатки по шардам для пар (shop_id, book_id), без блокировок."""
+    stock = mdl.ShopStock
+    shards = {}
+    for chunk in _chunks(keys):
+        rows = (
+            mdl.db.session.query(
+                stock.shop_id, stock.book_id, stock.shard, stock.quantity,
+            )
+                .filter(keys_in((stock.shop_id, stock.book_id), chunk))
+                .all()
+        )
+        for row in rows:
+            shards.setdefault((row.shop_id, row.book_id), {})[row.shard] = row.quantity
+    return shards
+
+
+def _decrement(key: StockKey, shard: int, quantity: int) -> bool:
+    stock = mdl.ShopStock
+    shop_id, book_id = key
+    result = mdl.db.session.execute(
+        update(stock)
+            .where(
+                stock.shop_id == shop_id,
+                stock.book_id == book_id,
+                stock.shard == shard,
+                stock.quantity >= quantity,
+            )
+            .values(quantity=stock.quantity - quantity)
+            .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def _plan(quantity: int, shards: Dict[int, int]) -> Optional[List[Tuple[int, int]]]:
+    """Шарды и сколько списать с каждого; None, если остатка не хватает."""
+    candidates = [shard for shard, left in shards.items() if left >= quantity]
+    if candidates:
+        return [(random.choice(candidates), quantity)]
+    if sum(shards.values()) < quantity:
+        return None
+    parts = []
+    for shard in sorted(shards):
+        part = min(shards[shard], quantity)
+        if part:
+            parts.append((shard, part))
+            quantity -= part
+        if not quantity:
+            break
+    return parts
+
+
+def _take(key: StockKey, quantity: int, shards: Dict[int, int]) -> bool:
+    for _ in range(STOCK_RETRIES):
+        parts = _plan(quantity, shards)
+        if parts is None:
+            return False
+        for shard, part in parts:
+            if _decrement(key, shard, part):
+                quantity -= part
+        if not quantity:
+            return True
+        shards = read_shards([key]).get(key, {})
+    return False
+
+
+def _shift(parts: Dict[ShardKey, int], sign: int) -> int:
+    """Меняет остатки шардов `parts` на `sign * часть`, UPDATE на порцию шардов."""
+    stock = mdl.ShopStock
+    columns = (stock.shop_id, stock.book_id, stock.shard)
+    rowcount = 0
+    for chunk in _chunks(parts.items()):
+        amount = case(
+            *[
+                (and_(*[column == value for column, value in zip(columns, shard_key)]), part)
+                for shard_key, part in chunk
+            ],
+            else_=0,
+        )
+        result = mdl.db.session.execute(
+            update(stock)
+                .where(keys_in(columns, [shard_key for shard_key, _ in chunk]))
+                .values(quantity=stock.quantity + sign * amount)
+                .execution_options(synchronize_session=False)
+        )
+        rowcount += result.rowcount
+    return rowcount
+
+
+def _take_all(parts: Dict[ShardKey, int]) -> Dict[StockKey, int]:
+    """Списывает части UPDATE на порцию; возвращает, сколько не списалось по парам.
+
+    UPDATE без условия на остаток, поэтому после него строки читаются с
+    блокировкой: шард, ушедший в минус, значит, что остаток успел забрать
+    другой заказ. Такие части возвращаются вторым UPDATE, остальные уже
+    списаны.
+    """
+    stock = mdl.ShopStock
+    columns = (stock.shop_id, stock.book_id, stock.shard)
+    _shift(parts, -1)
+    left = {}
+    for chunk in _chunks(parts):
+        rows = mdl.db.session.execute(
+            select(*columns, stock.quantity)
+                .where(keys_in(columns, chunk))
+                .with_for_update()
+        ).all()
+        left.update({(row.shop_id, row.book_id, row.shard): row.quantity for row in rows})
+    overdrawn = {
+        shard_key: part for shard_key, part in parts.items()
+        if left.get(shard_key, 0) < 0
+    }
+    if overdrawn:
+        _shift(overdrawn, 1)
+    short: Dict[StockKey, int] = {}
+    for shard_key, part in parts.items():
+        if shard_key in overdrawn or shard_key not in left:
+            key = shard_key[:2]
+            short[key] = short.get(key, 0) + part
+    return short
+
+
+def reserve(quantities: Dict[StockKey, int]) -> List[StockKey]:
+    """Списывает остатки в текущей транзакции.
+
+    Пары без строк в shop_stock не учитываются и считаются неограниченными:
+    остатки заводятся через PUT .../stock/<book_id> только для тех книг,
+    которые нужно ограничить. Строки заказа списываются одним UPDATE на
+    порцию из BULK_CHUNK_SIZE по прочитанным остаткам; пары, которые за это время разобрали другие
+    заказы, повторяются по одной условными UPDATE. Возвращает пары,
+    которых не хватило; в этом случае транзакцию нужно откатить, чтобы
+    вернуть уже списанное по остальным строкам.
+    """
+    keys = sorted(quantities)
+    shards = read_shards(keys)
+    missing = []
+    parts: Dict[ShardKey, int] = {}
+    for key in keys:
+        if key not in shards:
+            continue
+        plan = _plan(quantities[key], shards[key])
+        if plan is None:
+            missing.append(key)
+            continue
+        for shard, part in plan:
+            parts[(*key, shard)] = part
+    if not parts:
+        return missing
+    short = _take_all(parts)
+    if short:
+        fresh = read_shards(short)
+        missing.extend(
+            key for key in sorted(short)
+            if not _take(key, short[key], fresh.get(key, {}))
+        )
+    return sorted(missing)
+
+
+def set_stock(shop_id: int, book_id: int, quantity: int, shards: int = 1) -> None:
+    stock = mdl.ShopStock
+    mdl.db.session.query(stock).filter_by(
+        shop_id=shop_id, book_id=book_id,
+    ).delete(synchronize_session=False)
+    base, extra = divmod(quantity, shards)
+    mdl.db.session.execute(
+        insert(stock).values([
+            {
+                'shop_id': shop_id,
+                'book_id': book_id,
+                'shard': shard,
+                'quantity': base + (shard < extra),
+            }
+            for shard in range(shards)
+        ])
+    )
+    mdl.db.session.commit()
+
+
+STOCK_PAGE_KEY = (mdl.ShopStock.book_id,)
+
+
+def stock_query(shop_id: int):
+    stock = mdl.ShopStock
+    return (
+        select(stock.book_id, func.sum(stock.quantity).label('quantity'))
+            .where(stock.shop_id == shop_id)
+            .group_by(stock.book_id)
+    )
+
+
+def book_stock_query(shop_id: int, book_id: int):
+    stock = mdl.ShopStock
+    return select(func.sum(stock.quantity)).where(
+        stock.shop_id == shop_id,
+        stock.book_id == book_id,
+    )
+
+
+def get_stock(
+        shop_id: int,
+        limit: int = MAX_ROWS,
+        offset: int = 0,
+        cursor: Optional[str] = None,
+) -> Page:
+    query = seek(
+        stock_query(shop_id),
+        columns=STOCK_PAGE_KEY,
+        limit=limit,
+        offset=offset,
+        cursor=cursor,
+        descending=False,
+    )
+    return page(mdl.db.session.execute(query).all(), STOCK_PAGE_KEY, limit)
+
+
+def get_book_stock(shop_id: int, book_id: int) -> int:
+    quantity = mdl.db.session.execute(book_stock_query(shop_id, book_id)).scalar()
+    return quantity or 0
@@ -0,0 +1,259 @@
+import csv
+import gzip
+import json
+import os
+import time
+from collections import Counter
+from datetime import date, datetime
+from itertools import islice
+from typing import IO, Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import delete, inspect as sa_inspect, insert, select, text
+from sqlalchemy.schema import AddConstraint
+
+from app import models as mdl, sales, totals, versions
+from app.constants import LOAD_CHUNK_SIZE
+from app.queries import increment
+
+
+FORMATS = ('csv', 'ndjson')
+
+_EXTENSIONS = {'.csv': 'csv', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}
+
+
+class Kind(NamedTuple):
+    model: Any
+    # Поле записи и разбор его значения; значения из CSV приходят строками.
+    columns: Dict[str, Callable[[Any], Any]]
+    required: frozenset
+    # Прибавки к счётчикам строк (app.totals) для порции строк.
+    counts: Callable[[List[dict]], Dict[str, int]]
+    # Версии (app.versions), которые меняет порция строк, кроме версий
+    # таблиц: их поднимает сама вставка.
+    version_keys: Callable[[List[dict]], Iterable[str]] = lambda rows: ()
+    # Записи по порции строк до её вставки в той же транзакции, например
+    # сводки продаж (app.sales).
+    record: Callable[[List[dict]], None] = lambda rows: None
+
+
+KINDS = {
+    'users': Kind(
+        mdl.User,
+        {'id': int, 'first_name': str, 'last_name': str, 'email': str},
+        frozenset(('first_name', 'last_name', 'email')),
+        lambda rows: {'user': len(rows)},
+    ),
+    'shops': Kind(
+        mdl.Shop,
+        {'id': int, 'name': str, 'address': str},
+        frozenset(('name', 'address')),
+        lambda rows: {'shop': len(rows)},
+    ),
+    'books': Kind(
+        mdl.Book,
+        {'id': int, 'name': str, 'author': str, 'release_date': date.fromisoformat},
+        frozenset(('name', 'author', 'release_date')),
+        lambda rows: {'book': len(rows)},
+    ),
+    # id заказа обязателен: по нему на заказ ссылаются строки order_items.
+    'orders': Kind(
+        mdl.Order,
+        {'id': int, 'user_id': int, 'reg_date': datetime.fromisoformat},
+        frozenset(('id', 'user_id', 'reg_date')),
+        lambda rows: Counter(versions.orders_key(row['user_id']) for row in rows),
+        lambda rows: {versions.orders_key(row['user_id']) for row in rows},
+    ),
+    'order_items': Kind(
+        mdl.OrderItem,
+        {'id': int, 'order_id': int, 'book_id': int, 'shop_id': int, 'book_quantity': int},
+        frozenset(('order_id', 'book_id', 'shop_id', 'book_quantity')),
+        lambda rows: Counter(totals.order_items_key(row['order_id']) for row in rows),
+        record=sales.record_items,
+    ),
+}
+
+
+class LoadReport(NamedTuple):
+    loaded: int
+    skipped: int
+    seconds: float
+
+    @property
+    def rate(self) -> float:
+        return self.loaded / self.seconds if self.seconds else 0.0
+
+
+def detect_format(path: str) -> str:
+    name = path[:-len('.gz')] if path.endswith('.gz') else path
+    extension = os.path.splitext(name)[1].lower()
+    if extension not in _EXTENSIONS:
+        raise ValueError(f'{path}: unknown format, expected one of {", ".join(FORMATS)}')
+    return _EXTENSIONS[extension]
+
+
+def _open(path: str) -> IO[str]:
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, encoding='utf-8', newline='')
+
+
+def _records(file: IO[str], format: str) -> Iterator[dict]:
+    if format == 'csv':
+        yield from csv.DictReader(file)
+        return
+    for line in file:
+        if line.strip():
+            yield json.loads(line)
+
+
+def _parse(kind: Kind, record: dict, number: int, path: str) -> dict:
+    row = {}
+    for column, parse in kind.columns.items():
+        value = record.get(column)
+        if value is None or value == '':
+            if column in kind.required:
+                raise ValueError(f'{path}: record {number}: {column} is missing')
+            row[column] = None
+            continue
+        try:
+            row[column] = parse(value)
+        except (TypeError, ValueError):
+            raise ValueError(f'{path}: record {number}: invalid {column} {value!r}')
+    return row
+
+
+def _chunks(items: Iterable, size: int) -> Iterator[list]:
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def source_key(kind: str, path: str) -> str:
+    return f'{kind}:{os.path.abspath(path)}'
+
+
+def progress(source: str) -> int:
+    """Сколько записей источника уже загружено."""
+    rows = mdl.db.session.execute(
+        select(mdl.LoadProgress.rows).where(mdl.LoadProgress.source == source)
+    ).scalar()
+    return rows or 0
+
+
+def reset(source: str) -> None:
+    mdl.db.session.execute(delete(mdl.LoadProgress).where(mdl.LoadProgress.source == source))
+    mdl.db.session.commit()
+
+
+def secondary_indexes(model) -> list:
+    """Индексы таблицы, которые можно снять на время загрузки.
+
+    Уникальные индексы остаются, потому что проверяют данные.
+    """
+    return [index for index in model.__table__.indexes if not index.unique]
+
+
+def _foreign_keys(indexes: list) -> list:
+    """Внешние ключи, которые MySQL держит на индексах `indexes`.
+
+    Индекс, который начинается с колонки внешнего ключа, MySQL не удаляет,
+    пока ключ существует, поэтому такой ключ снимается вместе с индексом.
+    """
+    if mdl.db.engine.dialect.name != 'mysql':
+        return []
+    return [
+        constraint
+        for index in indexes
+        for constraint in index.table.foreign_key_constraints
+        if list(constraint.columns)[0] is list(index.columns)[0]
+    ]
+
+
+def _drop_foreign_key(constraint) -> None:
+    # Ключи в моделях без имён: имя, которое дал MySQL, берётся из схемы.
+    columns = [column.name for column in constraint.columns]
+    preparer = mdl.db.engine.dialect.identifier_preparer
+    for key in sa_inspect(mdl.db.engine).get_foreign_keys(constraint.table.name):
+        if key['constrained_columns'] == columns:
+            with mdl.db.engine.begin() as connection:
+                connection.execute(text(
+                    f'ALTER TABLE {preparer.format_table(constraint.table)}'
+                    f' DROP FOREIGN KEY {preparer.quote(key["name"])}'
+                ))
+
+
+def load(
+        kind: str,
+        path: str,
+        format: Optional[str] = None,
+        chunk_size: int = LOAD_CHUNK_SIZE,
+        rebuild_indexes: bool = False,
+        log=print,
+) -> LoadReport:
+    """Загружает записи `kind` из CSV или NDJSON (можно .gz) порциями по `chunk_size`.
+
+    Файл читается потоком, в памяти держится одна порция. Порция
+    вставляется одним executemany и фиксируется одной транзакцией вместе
+    со счётчиками строк и числом загруженных записей файла, поэтому
+    повторный запуск после сбоя продолжает с первой незагруженной записи.
+    С `rebuild_indexes` вторичные индексы таблицы снимаются на время
+    загрузки и строятся заново в конце, в том числе после ошибки; если
+    процесс убит, их восстанавливает init_db.py. На MySQL вместе с ними
+    снимаются опирающиеся на них внешние ключи: при возврате MySQL
+    проверяет ими все строки таблицы.
+    """
+    spec = KINDS[kind]
+    format = format or detect_format(path)
+    source = source_key(kind, path)
+    skipped = progress(source)
+    if skipped:
+        log(f'{kind}: resuming after {skipped} records')
+    indexes = secondary_indexes(spec.model) if rebuild_indexes else []
+    foreign_keys = _foreign_keys(indexes)
+    for constraint in foreign_keys:
+        log(f'dropping foreign key {spec.model.__tablename__}.{constraint.column_keys[0]}')
+        _drop_foreign_key(constraint)
+    for index in indexes:
+        log(f'dropping index {index.name}')
+        index.drop(bind=mdl.db.engine, checkfirst=True)
+
+    started = time.perf_counter()
+    loaded = 0
+    try:
+        with _open(path) as file:
+            records: Iterator[Tuple[int, dict]] = islice(
+                enumerate(_records(file, format), 1), skipped, None,
+            )
+            for chunk in _chunks(records, chunk_size):
+                rows = [_parse(spec, record, number, path) for number, record in chunk]
+                try:
+                    spec.record(rows)
+                    mdl.db.session.execute(insert(spec.model.__table__), rows)
+                    totals.add(spec.counts(rows))
+                    keys = spec.version_keys(rows)
+                    if keys:
+                        versions.bump(keys)
+                    increment(mdl.LoadProgress, [{
+                        'source': source,
+                        'rows': len(rows),
+                        'updated_at': datetime.utcnow(),
+                    }], ('rows',), assign=('updated_at',))
+                    mdl.db.session.commit()
+                except Exception:
+                    mdl.db.session.rollback()
+                    raise
+                loaded += len(rows)
+                elapsed = time.perf_counter() - started
+                log(f'{kind}: {skipped + loaded} records, {loaded / elapsed:.0f} rows/s')
+    finally:
+        for index in indexes:
+            log(f'creating index {index.name}')
+            index.create(bind=mdl.db.engine, checkfirst=True)
+        for constraint in foreign_keys:
+            log(f'creating foreign key {spec.model.__tablename__}.{constraint.column_keys[0]}')
+            with mdl.db.engine.begin() as connection:
+                connection.execute(AddConstraint(constraint))
+    return LoadReport(loaded, skipped, time.perf_counter() - started)
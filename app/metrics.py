@@ -0,0 +1,162 @@
+import bisect
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Sequence, Tuple
+
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.total += 1
+        self.sum += value
+
+    def lines(self, name: str, labels: str) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.total}')
+        lines.append(f'{name}_sum{{{labels}}} {self.sum}')
+        lines.append(f'{name}_count{{{labels}}} {self.total}')
+        return lines
+
+
+def _label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+
+class Metrics:
+    """Счётчики запросов, гистограммы задержек и стоимость SQL по ручкам.
+
+    Данные живут в памяти процесса; при нескольких воркерах каждый
+    отдаёт на /metrics свои значения.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.requests: Dict[Tuple[str, str, int], int] = defaultdict(int)
+            self.latency: Dict[str, Histogram] = {}
+            self.queries: Dict[str, Histogram] = {}
+            self.sql_seconds: Dict[str, float] = defaultdict(float)
+            self.gauges = {}
+
+    def init_app(self, app) -> None:
+        self.reset()
+        if not app.config.get('METRICS_ENABLED', True):
+            return
+        _listen_engines()
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.add_url_rule('/metrics', 'metrics', self.render)
+
+    def gauge(self, name: str, read) -> None:
+        """Значение, которое считывается при каждом запросе /metrics."""
+        self.gauges[name] = read
+
+    @staticmethod
+    def _start_request() -> None:
+        g.metrics_started = time.perf_counter()
+        g.sql_queries = 0
+        g.sql_seconds = 0.0
+
+    def _finish_request(self, response):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        endpoint = request.endpoint or 'unmatched'
+        with self._lock:
+            self.requests[(endpoint, request.method, response.status_code)] += 1
+            latency = self.latency.get(endpoint)
+            if latency is None:
+                latency = self.latency[endpoint] = Histogram(LATENCY_BUCKETS)
+            latency.observe(elapsed)
+            queries = self.queries.get(endpoint)
+            if queries is None:
+                queries = self.queries[endpoint] = Histogram(QUERY_BUCKETS)
+            queries.observe(g.sql_queries)
+            self.sql_seconds[endpoint] += g.sql_seconds
+        return response
+
+    def render(self) -> Response:
+        lines = ['# TYPE bookstore_requests_total counter']
+        with self._lock:
+            for (endpoint, method, status), count in sorted(self.requests.items()):
+                lines.append(
+                    f'bookstore_requests_total{{endpoint="{_label(endpoint)}",'
+                    f'method="{method}",status="{status}"}} {count}'
+                )
+            lines.append('# TYPE bookstore_request_duration_seconds histogram')
+            for endpoint, histogram in sorted(self.latency.items()):
+                lines.extend(histogram.lines(
+                    'bookstore_request_duration_seconds', f'endpoint="{_label(endpoint)}"',
+                ))
+            lines.append('# TYPE bookstore_sql_queries_per_request histogram')
+            for endpoint, histogram in sorted(self.queries.items()):
+                lines.extend(histogram.lines(
+                    'bookstore_sql_queries_per_request', f'endpoint="{_label(endpoint)}"',
+                ))
+            lines.append('# TYPE bookstore_sql_seconds_total counter')
+            for endpoint, seconds in sorted(self.sql_seconds.items()):
+                lines.append(
+                    f'bookstore_sql_seconds_total{{endpoint="{_label(endpoint)}"}} {seconds}'
+                )
+        for name, read in sorted(self.gauges.items()):
+            lines.append(f'# TYPE {name} gauge')
+            lines.append(f'{name} {read()}')
+        return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_started'].pop()
+    if has_request_context() and 'sql_queries' in g:
+        g.sql_queries += 1
+        g.sql_seconds += time.perf_counter() - started
+
+
+def _handle_error(context):
+    if context.connection is not None:
+        started = context.connection.info.get('query_started')
+        if started:
+            started.pop()
+
+
+_listening = False
+
+
+def _listen_engines() -> None:
+    global _listening
+    if not _listening:
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
+        _listening = True
+
+
+metrics = Metrics()
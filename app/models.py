@@ -1,10 +1,11 @@
 
-from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import UniqueConstraint 
+from sqlalchemy import Index, UniqueConstraint
 import inspect
 import sys
 
-db = SQLAlchemy()
+from app.replicas import RoutingSQLAlchemy
+
+db = RoutingSQLAlchemy()
 
 
 class User(db.Model):
@@ -18,7 +19,10 @@ class Order(db.Model):
     __tablename__ = 'order'
     id = db.Column(db.Integer, primary_key=True)
     reg_date = db.Column(db.DateTime)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    __table_args__ = (
+        Index('ix_order_user_id_reg_date', 'user_id', 'reg_date'),
+    )
 
 class OrderItem(db.Model):
     __tablename__ = 'order_item'
@@ -27,6 +31,33 @@ class OrderItem(db.Model):
     book_id = db.Column(db.Integer, db.ForeignKey('book.id'))
     shop_id = db.Column(db.Integer, db.ForeignKey('shop.id'))
     book_quantity = db.Column(db.Integer)
+    __table_args__ = (
+        Index('ix_order_item_order_id_shop_id_book_id', 'order_id', 'shop_id', 'book_id'),
+    )
+
+# Заказы старше горизонта архивации, перенесённые из order/order_item.
+class OrderArchive(db.Model):
+    __tablename__ = 'order_archive'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    reg_date = db.Column(db.DateTime)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    __table_args__ = (
+        Index('ix_order_archive_user_id_reg_date', 'user_id', 'reg_date'),
+    )
+
+class OrderItemArchive(db.Model):
+    __tablename__ = 'order_item_archive'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('order_archive.id'))
+    book_id = db.Column(db.Integer, db.ForeignKey('book.id'))
+    shop_id = db.Column(db.Integer, db.ForeignKey('shop.id'))
+    book_quantity = db.Column(db.Integer)
+    __table_args__ = (
+        Index(
+            'ix_order_item_archive_order_id_shop_id_book_id',
+            'order_id', 'shop_id', 'book_id',
+        ),
+    )
 
 class Shop(db.Model):
     __tablename__ = 'shop'
@@ -40,5 +71,61 @@ class Book(db.Model):
     name = db.Column(db.String(60))
     author = db.Column(db.String(60))
     release_date = db.Column(db.DateTime)
-    __table_args__ = (UniqueConstraint('author', 'name', 'release_date'),)
+    __table_args__ = (
+        UniqueConstraint('author', 'name', 'release_date'),
+        Index('ix_book_name', 'name'),
+        Index('ix_book_release_date', 'release_date'),
+        Index('ix_book_author_release_date', 'author', 'release_date'),
+    )
+
+
+class ShopStock(db.Model):
+    __tablename__ = 'shop_stock'
+    shop_id = db.Column(db.Integer, db.ForeignKey('shop.id'), primary_key=True)
+    book_id = db.Column(db.Integer, db.ForeignKey('book.id'), primary_key=True)
+    shard = db.Column(db.Integer, primary_key=True, autoincrement=False, default=0)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+
+
+class ShopSales(db.Model):
+    __tablename__ = 'shop_sales'
+    shop_id = db.Column(db.Integer, db.ForeignKey('shop.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    shard = db.Column(db.Integer, primary_key=True, autoincrement=False, default=0)
+    copies = db.Column(db.Integer, nullable=False, default=0)
+    orders = db.Column(db.Integer, nullable=False, default=0)
+
+
+class BookSales(db.Model):
+    __tablename__ = 'book_sales'
+    book_id = db.Column(db.Integer, db.ForeignKey('book.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    shard = db.Column(db.Integer, primary_key=True, autoincrement=False, default=0)
+    copies = db.Column(db.Integer, nullable=False, default=0)
+    __table_args__ = (
+        Index('ix_book_sales_day_book_id', 'day', 'book_id', 'copies'),
+    )
+
+
+class Version(db.Model):
+    __tablename__ = 'version'
+    key = db.Column(db.String(100), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime)
+
+
+class RowCount(db.Model):
+    __tablename__ = 'row_count'
+    key = db.Column(db.String(100), primary_key=True)
+    # Общие счётчики каталога разложены по TOTAL_SHARDS строкам.
+    shard = db.Column(db.Integer, primary_key=True, autoincrement=False, default=0)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
 
+# Сколько записей файла уже загружено (load_data.py), чтобы прерванную
+# загрузку можно было продолжить.
+class LoadProgress(db.Model):
+    __tablename__ = 'load_progress'
+    source = db.Column(db.String(255), primary_key=True)
+    rows = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime)
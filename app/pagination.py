@@ -0,0 +1,177 @@
+import base64
+import binascii
+import heapq
+from datetime import date, datetime
+from itertools import islice
+from typing import Any, List, NamedTuple, Optional, Sequence, Tuple
+
+import ujson
+from sqlalchemy import and_, desc, false, or_
+
+from app.constants import HttpStatus, ErrorMessages
+from app.exceptions import BookStoreException
+
+
+class Page(NamedTuple):
+    items: list
+    next_cursor: Optional[str]
+    total: Optional[int] = None
+
+
+def _dump_value(value: Any) -> Any:
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def _load_value(column, value: Any) -> Any:
+    """Значение курсора для колонки `column` (колонка или тип Python).
+
+    Значение должно иметь тип колонки, иначе сравнение с ним падает уже в
+    базе; None допустим только для колонок, где бывает NULL.
+    """
+    if isinstance(column, type):
+        python_type, nullable = column, False
+    else:
+        python_type, nullable = column.type.python_type, column.expression.nullable
+    if value is None:
+        if not nullable:
+            raise ValueError(value)
+        return value
+    if python_type in (date, datetime):
+        if not isinstance(value, str):
+            raise TypeError(value)
+        return datetime.fromisoformat(value)
+    if not isinstance(value, python_type) or isinstance(value, bool):
+        raise TypeError(value)
+    return value
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    raw = ujson.dumps([_dump_value(value) for value in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str, columns: Sequence) -> List[Any]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = ujson.loads(raw)
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError(cursor)
+        return [
+            _load_value(column, value)
+            for column, value in zip(columns, values)
+        ]
+    except (ValueError, TypeError, binascii.Error):
+        raise BookStoreException(
+            code=HttpStatus.HTTP_400_BAD_REQUEST,
+            error_text=ErrorMessages.INVALID_CURSOR,
+        )
+
+
+def _beyond(column, value: Any, descending: bool):
+    # NULL в MySQL и SQLite меньше любого значения: при сортировке по
+    # возрастанию такие строки идут первыми, по убыванию последними.
+    if value is None:
+        return false() if descending else column.isnot(None)
+    if descending and column.expression.nullable:
+        return or_(column < value, column.is_(None))
+    return column < value if descending else column > value
+
+
+def _after(columns: Sequence, values: Sequence[Any], descending: bool):
+    column, value = columns[0], values[0]
+    beyond = _beyond(column, value, descending)
+    if len(columns) == 1:
+        return beyond
+    same = column.is_(None) if value is None else column == value
+    return or_(
+        beyond,
+        and_(same, _after(columns[1:], values[1:], descending)),
+    )
+
+
+def seek(
+        query,
+        columns: Sequence,
+        limit: int,
+        offset: int = 0,
+        cursor: Optional[str] = None,
+        descending: bool = True,
+):
+    """Запрос страницы по ключу `columns`: ORM Query или Core select.
+
+    Выбирает на одну строку больше `limit`, чтобы page() понял,
+    есть ли следующая страница.
+    """
+    query = query.order_by(
+        *[desc(column) if descending else column for column in columns]
+    )
+    if cursor is not None:
+        query = query.filter(
+            _after(columns, decode_cursor(cursor, columns), descending)
+        )
+    elif offset:
+        query = query.offset(offset)
+    return query.limit(limit + 1)
+
+
+def page(rows: list, columns: Sequence, limit: int) -> Page:
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(
+            [getattr(rows[-1], column.key) for column in columns]
+        )
+    return Page(rows, next_cursor)
+
+
+def paginate(
+        query,
+        columns: Sequence,
+        limit: int,
+        offset: int = 0,
+        cursor: Optional[str] = None,
+        descending: bool = True,
+) -> Page:
+    """Страница по ключу сортировки `columns`.
+
+    С курсором запрос продолжается с места, где закончилась прошлая
+    страница (seek), поэтому стоимость не зависит от глубины. Без курсора
+    работает обычный offset. Последняя колонка должна делать ключ уникальным.
+    """
+    rows = seek(query, columns, limit, offset, cursor, descending).all()
+    return page(rows, columns, limit)
+
+
+def _sort_key(columns: Sequence):
+    # NULL идёт раньше любого значения, как в MySQL и SQLite.
+    names = [column.key for column in columns]
+    return lambda row: tuple(
+        (value is not None, value)
+        for value in (getattr(row, name) for name in names)
+    )
+
+
+def paginate_parts(
+        parts: Sequence[Tuple[Any, Sequence]],
+        limit: int,
+        offset: int = 0,
+        cursor: Optional[str] = None,
+        descending: bool = True,
+) -> Page:
+    """Страница по нескольким запросам `(query, columns)` с одним ключом сортировки.
+
+    Части (горячая таблица и архив) могут перемежаться по ключу: из каждой
+    читается до страницы строк после курсора, и строки сливаются по
+    ключу, поэтому курсор общий для всех частей. Без курсора из каждой
+    части читается `offset + limit` строк.
+    """
+    if cursor is not None:
+        offset = 0
+    found = [
+        seek(query, columns, offset + limit, 0, cursor, descending).all()
+        for query, columns in parts
+    ]
+    merged = heapq.merge(*found, key=_sort_key(parts[0][1]), reverse=descending)
+    return page(list(islice(merged, offset, offset + limit + 1)), parts[0][1], limit)
@@ -0,0 +1,146 @@
+from typing import Iterable, List, Sequence
+
+from sqlalchemy import and_, false, or_, select
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+
+from app import models as mdl
+
+
+def keys_in(columns: Sequence, keys: Iterable[Sequence]):
+    """`(a, b) IN ((..), (..))` в виде OR из равенств.
+
+    SQLite не использует составной индекс для row value IN, а OR из
+    равенств разворачивается в поиск по индексу и в SQLite, и в MySQL.
+    """
+    clauses = [
+        and_(*[column == value for column, value in zip(columns, key)])
+        for key in keys
+    ]
+    return or_(*clauses) if clauses else false()
+
+
+def increment(
+        model,
+        rows: List[dict],
+        counters: Sequence[str],
+        assign: Sequence[str] = (),
+) -> None:
+    """INSERT ... ON DUPLICATE/CONFLICT, прибавляющий `counters` к существующей строке.
+
+    Колонки из `assign` в существующей строке заменяются новыми значениями.
+    Строки передаются одним executemany: текст запроса не зависит от их
+    числа, поэтому компилируется один раз и берётся из кэша SQLAlchemy, а
+    MySQL-драйвер сам склеивает строки в один INSERT.
+    """
+    if not rows:
+        return
+    table = model.__table__
+    dialect = mdl.db.session().get_bind(model.__mapper__).dialect.name
+    if dialect == 'mysql':
+        statement = mysql.insert(table)
+        statement = statement.on_duplicate_key_update({
+            **{column: statement.inserted[column] for column in assign},
+            **{
+                counter: table.c[counter] + statement.inserted[counter]
+                for counter in counters
+            },
+        })
+    elif dialect in ('sqlite', 'postgresql'):
+        insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        statement = insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=[column.name for column in table.primary_key],
+            set_={
+                **{column: statement.excluded[column] for column in assign},
+                **{
+                    counter: table.c[counter] + statement.excluded[counter]
+                    for counter in counters
+                },
+            },
+        )
+    else:
+        _update_or_insert(table, rows, counters, assign)
+        return
+    mdl.db.session.execute(statement, rows)
+
+
+def _update_or_insert(
+        table,
+        rows: List[dict],
+        counters: Sequence[str],
+        assign: Sequence[str],
+) -> None:
+    """increment() для диалектов без upsert: UPDATE, а если строки нет, INSERT.
+
+    Запрос на строку. Если ту же строку одновременно создаёт другая
+    транзакция, второй INSERT получит IntegrityError, как при любом
+    конфликте записи.
+    """
+    keys = [column.name for column in table.primary_key]
+    for row in rows:
+        result = mdl.db.session.execute(
+            table.update()
+                .where(*[table.c[key] == row[key] for key in keys])
+                .values({
+                    **{column: row[column] for column in assign},
+                    **{counter: table.c[counter] + row[counter] for counter in counters},
+                })
+        )
+        if not result.rowcount:
+            mdl.db.session.execute(table.insert().values(row))
+
+
+def book_by_id(book_id: int):
+    return select(
+        mdl.Book.id,
+        mdl.Book.name,
+        mdl.Book.author,
+        mdl.Book.release_date,
+    ).where(mdl.Book.id == book_id)
+
+
+def shop_by_id(shop_id: int):
+    return select(
+        mdl.Shop.id,
+        mdl.Shop.name,
+        mdl.Shop.address,
+    ).where(mdl.Shop.id == shop_id)
+
+
+def user_by_id(user_id: int):
+    return select(
+        mdl.User.first_name,
+        mdl.User.last_name,
+        mdl.User.email,
+    ).where(mdl.User.id == user_id)
+
+
+# Те же строки для списка id (пакетные запросы, app.batch); `entity_id`
+# связывает строку с запрошенным id.
+
+def books_by_ids(book_ids: Iterable[int]):
+    return select(
+        mdl.Book.id.label('entity_id'),
+        mdl.Book.id,
+        mdl.Book.name,
+        mdl.Book.author,
+        mdl.Book.release_date,
+    ).where(mdl.Book.id.in_(book_ids))
+
+
+def shops_by_ids(shop_ids: Iterable[int]):
+    return select(
+        mdl.Shop.id.label('entity_id'),
+        mdl.Shop.id,
+        mdl.Shop.name,
+        mdl.Shop.address,
+    ).where(mdl.Shop.id.in_(shop_ids))
+
+
+def users_by_ids(user_ids: Iterable[int]):
+    return select(
+        mdl.User.id.label('entity_id'),
+        mdl.User.first_name,
+        mdl.User.last_name,
+        mdl.User.email,
+    ).where(mdl.User.id.in_(user_ids))
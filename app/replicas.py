@@ -0,0 +1,163 @@
+import contextlib
+import functools
+import logging
+import threading
+import time
+from typing import Callable, Dict, Hashable, List, Optional
+
+from flask import current_app
+from flask_sqlalchemy import SignallingSession, SQLAlchemy
+from sqlalchemy import create_engine, orm, text
+from sqlalchemy.exc import OperationalError
+
+
+class Replica:
+    def __init__(self, engine):
+        self.engine = engine
+        self.healthy = True
+        self.checked_at = float('-inf')
+
+
+class ReplicaRouter:
+    """Раздаёт чтения по репликам из SQLALCHEMY_REPLICA_URIS по кругу.
+
+    Реплика проверяется запросом SELECT 1 не чаще раза в
+    REPLICA_HEALTH_INTERVAL секунд; недоступные пропускаются, а если
+    живых нет, чтение идёт в основную базу. После записи по ключу
+    (например, заказа пользователя) чтения с тем же ключом в течение
+    READ_YOUR_WRITES_SECONDS идут в основную базу. Окно хранится в
+    памяти процесса.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.replicas: List[Replica] = []
+        self.health_interval = 5.0
+        self.read_your_writes = 0.0
+        self._next = 0
+        self._written: Dict[Hashable, float] = {}
+
+    def init_app(self, app) -> None:
+        for replica in self.replicas:
+            replica.engine.dispose()
+        options = app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+        self.replicas = [
+            Replica(create_engine(uri, **options))
+            for uri in app.config.get('SQLALCHEMY_REPLICA_URIS', ())
+        ]
+        self.health_interval = app.config.get('REPLICA_HEALTH_INTERVAL', 5.0)
+        self.read_your_writes = app.config.get('READ_YOUR_WRITES_SECONDS', 0)
+        self._next = 0
+        self._written = {}
+
+    def after_fork(self) -> None:
+        """Забывает соединения, открытые родительским процессом."""
+        for replica in self.replicas:
+            replica.engine.dispose(close=False)
+
+    @property
+    def current(self) -> Optional[Replica]:
+        """Реплика, на которую сейчас направлены чтения потока."""
+        return getattr(self._local, 'replica', None)
+
+    def _check(self, replica: Replica) -> bool:
+        now = time.monotonic()
+        if now - replica.checked_at < self.health_interval:
+            return replica.healthy
+        replica.checked_at = now
+        try:
+            with replica.engine.connect() as connection:
+                connection.execution_options(skip_query_budget=True).execute(text('SELECT 1'))
+            replica.healthy = True
+        except OperationalError:
+            logging.warning(f'replica {replica.engine.url!r} is unavailable')
+            replica.healthy = False
+        return replica.healthy
+
+    def choose(self) -> Optional[Replica]:
+        with self._lock:
+            start = self._next
+            self._next = (self._next + 1) % max(len(self.replicas), 1)
+        for offset in range(len(self.replicas)):
+            replica = self.replicas[(start + offset) % len(self.replicas)]
+            if self._check(replica):
+                return replica
+        return None
+
+    @contextlib.contextmanager
+    def primary(self):
+        """Все чтения потока внутри блока, в том числе методов с read(), идут в основную базу."""
+        previous = getattr(self._local, 'primary', False)
+        self._local.primary = True
+        try:
+            yield
+        finally:
+            self._local.primary = previous
+
+    def mark_written(self, key: Hashable) -> None:
+        if not self.read_your_writes:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._written[key] = now + self.read_your_writes
+            if len(self._written) > 10000:
+                self._written = {
+                    key: until for key, until in self._written.items() if until > now
+                }
+
+    def recently_written(self, key: Optional[Hashable]) -> bool:
+        if key is None or not self.read_your_writes:
+            return False
+        until = self._written.get(key)
+        return until is not None and until > time.monotonic()
+
+    def read(self, key: Optional[Callable[..., Hashable]] = None) -> Callable:
+        """Декоратор метода только на чтение: его запросы уходят на реплику.
+
+        `key` по аргументам вызова возвращает ключ для окна
+        read-your-writes. Если реплика отвалилась посреди чтения, она
+        помечается недоступной, и вызов повторяется на основной базе.
+        """
+        def decorator(func: Callable) -> Callable:
+            @functools.wraps(func)
+            def wrapped(*args, **kwargs):
+                if (
+                        not self.replicas
+                        or self.current is not None
+                        or getattr(self._local, 'primary', False)
+                        or self.recently_written(key and key(*args, **kwargs))
+                ):
+                    return func(*args, **kwargs)
+                replica = self.choose()
+                if replica is None:
+                    return func(*args, **kwargs)
+                self._local.replica = replica
+                try:
+                    return func(*args, **kwargs)
+                except OperationalError:
+                    logging.warning(f'read from replica {replica.engine.url!r} failed')
+                    replica.healthy = False
+                    replica.checked_at = time.monotonic()
+                finally:
+                    self._local.replica = None
+                current_app.extensions['sqlalchemy'].db.session.rollback()
+                return func(*args, **kwargs)
+            return wrapped
+        return decorator
+
+
+replicas = ReplicaRouter()
+
+
+class RoutingSession(SignallingSession):
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        replica = replicas.current
+        if replica is not None and not self._flushing:
+            return replica.engine
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
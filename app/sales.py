@@ -0,0 +1,224 @@
+import random
+from collections import defaultdict
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, select
+
+from app import models as mdl
+from app.archive import ORDER_TABLES
+from app.constants import BULK_CHUNK_SIZE, SALES_SHARDS
+from app.queries import increment
+
+
+def record_order(
+        day: date,
+        quantities: Dict[Tuple[int, int], int],
+        shard: Optional[int] = None,
+) -> None:
+    """Добавляет заказ в сводные таблицы в текущей транзакции.
+
+    Строка сводки выбирается из SALES_SHARDS шардов случайно, чтобы
+    заказы одного магазина за день не выстраивались в очередь за одной
+    строкой. При чтении шарды суммируются.
+    """
+    if shard is None:
+        shard = random.randrange(SALES_SHARDS)
+    shops = defaultdict(int)
+    books = defaultdict(int)
+    for (book_id, shop_id), copies in quantities.items():
+        shops[shop_id] += copies
+        books[book_id] += copies
+    increment(mdl.ShopSales, [
+        {'shop_id': shop_id, 'day': day, 'shard': shard, 'copies': copies, 'orders': 1}
+        for shop_id, copies in sorted(shops.items())
+    ], ('copies', 'orders'))
+    increment(mdl.BookSales, [
+        {'book_id': book_id, 'day': day, 'shard': shard, 'copies': copies}
+        for book_id, copies in sorted(books.items())
+    ], ('copies',))
+
+
+def shop_sales_query(shop_id: int, date_from: date, date_to: date):
+    sales = mdl.ShopSales
+    return (
+        select(
+            sales.day,
+            func.sum(sales.copies).label('copies'),
+            func.sum(sales.orders).label('orders'),
+        )
+            .where(
+                sales.shop_id == shop_id,
+                sales.day >= date_from,
+                sales.day <= date_to,
+            )
+            .group_by(sales.day)
+            .order_by(sales.day)
+    )
+
+
+def shop_sales(shop_id: int, date_from: date, date_to: date) -> list:
+    return mdl.db.session.execute(shop_sales_query(shop_id, date_from, date_to)).all()
+
+
+def top_books(date_from: date, date_to: date, limit: int) -> list:
+    sales = mdl.BookSales
+    top = (
+        mdl.db.session.query(
+            sales.book_id,
+            func.sum(sales.copies).label('copies'),
+        )
+            .filter(sales.day >= date_from, sales.day <= date_to)
+            .group_by(sales.book_id)
+            .order_by(func.sum(sales.copies).desc(), sales.book_id)
+            .limit(limit)
+            .subquery()
+    )
+    return (
+        mdl.db.session.query(
+            mdl.Book.id.label('book_id'),
+            mdl.Book.name,
+            mdl.Book.author,
+            top.c.copies,
+        )
+            .join(top, top.c.book_id == mdl.Book.id)
+            .order_by(top.c.copies.desc(), mdl.Book.id)
+            .all()
+    )
+
+
+class _Totals:
+    """Сводки по строкам заказов до записи в shop_sales и book_sales."""
+
+    def __init__(self):
+        self.shops = defaultdict(lambda: [0, set()])
+        self.books = defaultdict(int)
+
+    def add(self, order_id: int, day: date, book_id: int, shop_id: int, copies: int,
+            new_order: bool = True) -> None:
+        shop = self.shops[(shop_id, day)]
+        shop[0] += copies
+        if new_order:
+            shop[1].add(order_id)
+        self.books[(book_id, day)] += copies
+
+    def write(self) -> None:
+        shop_rows = [
+            {'shop_id': shop_id, 'day': day, 'shard': 0, 'copies': copies, 'orders': len(ids)}
+            for (shop_id, day), (copies, ids) in self.shops.items()
+        ]
+        book_rows = [
+            {'book_id': book_id, 'day': day, 'shard': 0, 'copies': copies}
+            for (book_id, day), copies in self.books.items()
+        ]
+        increment(mdl.ShopSales, shop_rows, ('copies', 'orders'))
+        increment(mdl.BookSales, book_rows, ('copies',))
+
+
+def _in_range(column, ids: List[int]):
+    # Диапазон первичного ключа вместо длинного IN: его SQLite выполняет
+    # полным проходом по таблице.
+    return column.between(ids[0], ids[-1])
+
+
+def record_items(rows: Iterable[dict]) -> None:
+    """Добавляет в сводки строки order_item, которые сейчас будут вставлены.
+
+    Для загрузчика: вызывается в той же транзакции до вставки, поэтому
+    заказ прибавляется к числу заказов магазина, только если строк этого
+    магазина у заказа ещё нет. Строки заказов без даты пропускаются.
+    """
+    rows = list(rows)
+    order_ids = sorted({row['order_id'] for row in rows})
+    if not order_ids:
+        return
+    wanted = set(order_ids)
+    days = {
+        order_id: reg_date.date()
+        for order_id, reg_date in (
+            mdl.db.session.query(mdl.Order.id, mdl.Order.reg_date)
+                .filter(_in_range(mdl.Order.id, order_ids))
+        )
+        if order_id in wanted and reg_date is not None
+    }
+    known = {
+        (order_id, shop_id)
+        for order_id, shop_id in (
+            mdl.db.session.query(mdl.OrderItem.order_id, mdl.OrderItem.shop_id)
+                .filter(_in_range(mdl.OrderItem.order_id, order_ids))
+                .distinct()
+        )
+    }
+    totals = _Totals()
+    for row in rows:
+        day = days.get(row['order_id'])
+        if day is None:
+            continue
+        totals.add(
+            row['order_id'], day, row['book_id'], row['shop_id'], row['book_quantity'],
+            new_order=(row['order_id'], row['shop_id']) not in known,
+        )
+    totals.write()
+
+
+def rebuild(chunk_size: int = BULK_CHUNK_SIZE, log=print) -> int:
+    """Пересчитывает сводки из order/order_item и архива порциями по `chunk_size` заказов.
+
+    Очистка и пересчёт идут одной транзакцией: если пересчёт упадёт,
+    останутся прежние сводки, а не пустые. Заказы без даты, как и в
+    record_items, пропускаются. Заказы, добавленные во время пересчёта,
+    могут учесться дважды или потеряться, поэтому запускать его стоит без
+    входящего трафика.
+    """
+    try:
+        total = _recompute(chunk_size, log)
+        mdl.db.session.commit()
+    except Exception:
+        mdl.db.session.rollback()
+        raise
+    return total
+
+
+def _recompute(chunk_size: int, log) -> int:
+    mdl.db.session.query(mdl.ShopSales).delete(synchronize_session=False)
+    mdl.db.session.query(mdl.BookSales).delete(synchronize_session=False)
+    total = 0
+    for orders, items in ORDER_TABLES:
+        last_id = 0
+        while True:
+            order_ids = [
+                order_id for order_id, in (
+                    mdl.db.session.query(orders.id)
+                        .filter(orders.id > last_id)
+                        .order_by(orders.id)
+                        .limit(chunk_size)
+                )
+            ]
+            if not order_ids:
+                break
+            rows = (
+                mdl.db.session.query(
+                    items.order_id,
+                    orders.reg_date,
+                    items.book_id,
+                    items.shop_id,
+                    items.book_quantity,
+                )
+                    .join(orders, orders.id == items.order_id)
+                    .filter(
+                        items.order_id >= order_ids[0],
+                        items.order_id <= order_ids[-1],
+                        orders.reg_date.isnot(None),
+                    )
+                    .all()
+            )
+            totals = _Totals()
+            for row in rows:
+                totals.add(
+                    row.order_id, row.reg_date.date(), row.book_id, row.shop_id, row.book_quantity,
+                )
+            totals.write()
+            total += len(order_ids)
+            last_id = order_ids[-1]
+            log(f'{total} orders')
+    return total
@@ -1,42 +1,42 @@
-from marshmallow import Schema, fields, validate, pre_dump, post_dump
-from app.constants import HttpStatus, MAX_ROWS
+from marshmallow import Schema, fields, validate, post_dump
+from app.constants import (
+    HttpStatus, MAX_ROWS, BOOK_SORT_KEYS, BULK_MAX_ROWS, MAX_STOCK_SHARDS, SEARCH_MAX_QUERY,
+    SALES_MAX_DAYS, TOP_BOOKS_DEFAULT_DAYS, BATCH_MAX_REQUESTS, BATCH_METHODS,
+)
 from app import models as mdl
-from copy import deepcopy
 
 
 class Response(Schema):
-    error_text = None
-    error_fields = None
 
-    @pre_dump
-    def extract_data(self, response, **kwargs):
-        if isinstance(response, dict):
-            self.error_text = response.pop('error_text', None)
-            self.error_fields = response.pop('error_fields', [])
-        return response
-
-    @post_dump
-    def add_error_info(self, data, **kwargs):
+    @post_dump(pass_original=True)
+    def add_error_info(self, data, response, **kwargs):
         result = {
             'code': HttpStatus.HTTP_200_OK,
             'data': data,
         }
-        if self.error_text is not None:
-            result.update({'errorText': self.error_text})
-        if self.error_fields:
-            result.update({'errorFields': deepcopy(self.error_fields)})
-            
-        self.error_text = None
-        self.error_fields = None
+        if isinstance(response, dict):
+            error_text = response.get('error_text')
+            error_fields = response.get('error_fields')
+            if error_text is not None:
+                result.update({'errorText': error_text})
+            if error_fields:
+                result.update({'errorFields': error_fields})
         return result
 
 
 class LimitOffset(Schema):
     limit = fields.Integer(validate=validate.Range(min=1, max=MAX_ROWS), missing=MAX_ROWS)
     offset = fields.Integer(validate=validate.Range(min=0), missing=0)
+    cursor = fields.String(missing=None)
+
+
+class CountedLimitOffset(LimitOffset):
+    with_total = fields.Boolean(missing=False)
+
 
 class LimitOffsetResponse(Response, LimitOffset):
-    pass
+    next_cursor = fields.String(allow_none=True)
+    total = fields.Integer()
 
 
 class User(Schema):
@@ -59,7 +59,7 @@ class User(Schema):
 
 
 
-class UsersResponse(Response):
+class UsersResponse(LimitOffsetResponse):
     users = fields.Nested(User, many=True)
 
 
@@ -92,7 +92,11 @@ class OrderItem(Schema):
 
 class AddOrderItem(Schema):
     book_id = fields.Integer(required=True, allow_none=False)
-    book_quantity = fields.Integer(required=True, allow_none=False)
+    book_quantity = fields.Integer(
+        validate=validate.Range(min=1),
+        required=True,
+        allow_none=False,
+    )
     shop_id = fields.Integer(required=True, allow_none=False)
 
 
@@ -124,10 +128,71 @@ class ShopResponse(Response, Shop):
     pass
 
 
-class ShopsResponse(Response):
+class ShopsResponse(LimitOffsetResponse):
     shops = fields.Nested(Shop, many=True, required=True)
 
 
+class Stock(Schema):
+    book_id = fields.Integer(required=True, allow_none=False)
+    quantity = fields.Integer(required=True, allow_none=False)
+
+
+class StockRequest(Schema):
+    quantity = fields.Integer(
+        validate=validate.Range(min=0),
+        required=True,
+        allow_none=False,
+    )
+    shards = fields.Integer(
+        validate=validate.Range(min=1, max=MAX_STOCK_SHARDS),
+        missing=1,
+    )
+
+
+class StockResponse(Response, Stock):
+    shop_id = fields.Integer(required=True, allow_none=False)
+
+
+class ShopStockResponse(LimitOffsetResponse):
+    shop_id = fields.Integer(required=True, allow_none=False)
+    stock = fields.Nested(Stock, many=True, required=True)
+
+
+class SalesRequest(Schema):
+    date_from = fields.Date(missing=None)
+    date_to = fields.Date(missing=None)
+
+
+class DailySales(Schema):
+    day = fields.Date(required=True, allow_none=False)
+    copies = fields.Integer(required=True, allow_none=False)
+    orders = fields.Integer(required=True, allow_none=False)
+
+
+class ShopSalesResponse(Response):
+    shop_id = fields.Integer(required=True, allow_none=False)
+    sales = fields.Nested(DailySales, many=True, required=True)
+
+
+class TopBooksRequest(Schema):
+    days = fields.Integer(
+        validate=validate.Range(min=1, max=SALES_MAX_DAYS),
+        missing=TOP_BOOKS_DEFAULT_DAYS,
+    )
+    limit = fields.Integer(validate=validate.Range(min=1, max=MAX_ROWS), missing=10)
+
+
+class TopBook(Schema):
+    book_id = fields.Integer(required=True, allow_none=False)
+    name = fields.String(required=True, allow_none=False)
+    author = fields.String(required=True, allow_none=False)
+    copies = fields.Integer(required=True, allow_none=False)
+
+
+class TopBooksResponse(Response):
+    books = fields.Nested(TopBook, many=True, required=True)
+
+
 class Book(Schema):
     id = fields.Integer(required=False, nullable=False)
     name = fields.String(required=True, nullable=False)
@@ -138,23 +203,78 @@ class BookRequest(Book):
     pass
 
 
+class BooksRequest(CountedLimitOffset):
+    author = fields.String(missing=None)
+    released_from = fields.Date(missing=None)
+    released_to = fields.Date(missing=None)
+    sort = fields.String(
+        validate=validate.OneOf(BOOK_SORT_KEYS),
+        missing=BOOK_SORT_KEYS[0],
+    )
+
+
 class BookResponse(Response, Book):
     pass
 
 
-class BooksResponse(Response):
+class BookSearchRequest(CountedLimitOffset):
+    q = fields.String(
+        validate=validate.Length(min=1, max=SEARCH_MAX_QUERY),
+        required=True,
+        allow_none=False,
+    )
+
+
+class BooksResponse(LimitOffsetResponse):
     books = fields.Nested(Book, many=True, required=True)
 
 class AddBookResponse(Response):
     book_id = fields.Integer(required=True, nullable=False)
 
 
+class AddBooksRequest(Schema):
+    books = fields.Nested(
+        BookRequest,
+        many=True,
+        required=True,
+        validate=validate.Length(min=1, max=BULK_MAX_ROWS),
+    )
+
+
+class AddedBook(Schema):
+    index = fields.Integer(required=True)
+    book_id = fields.Integer(required=True)
+
+
+class BookConflict(Schema):
+    index = fields.Integer(required=True)
+    error_text = fields.String(required=True)
 
 
+class AddBooksResponse(Response):
+    books = fields.Nested(AddedBook, many=True)
+    conflicts = fields.Nested(BookConflict, many=True)
 
 
+class BatchOperation(Schema):
+    method = fields.String(validate=validate.OneOf(BATCH_METHODS), missing='GET')
+    path = fields.String(required=True, allow_none=False)
+    body = fields.Dict(missing=None)
 
 
+class BatchRequest(Schema):
+    requests = fields.Nested(
+        BatchOperation,
+        many=True,
+        required=True,
+        validate=validate.Length(min=1, max=BATCH_MAX_REQUESTS),
+    )
+
 
+class BatchResult(Schema):
+    status = fields.Integer(required=True)
+    body = fields.Raw(allow_none=True)
 
 
+class BatchResponse(Response):
+    responses = fields.Nested(BatchResult, many=True, required=True)
@@ -0,0 +1,185 @@
+import bisect
+import heapq
+import re
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import func
+
+from app import models as mdl, versions
+from app.constants import BULK_CHUNK_SIZE, SEARCH_MIN_PREFIX
+
+
+NAME_WEIGHT = 2
+AUTHOR_WEIGHT = 1
+
+_TOKEN = re.compile(r'\w+')
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    return _TOKEN.findall((text or '').lower().replace('ё', 'е'))
+
+
+class BookSearchIndex:
+    """Инвертированный индекс по словам названия и автора книги.
+
+    Словарь хранится отсортированным, поэтому поиск по префиксу идёт
+    бинарным поиском и не зависит от размера каталога. Индекс строится
+    из базы при первом поиске и сверяется с таблицей по версии 'book'
+    (refresh()), так что изменения из других процессов тоже видны.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._names: Dict[str, Set[int]] = {}
+            self._authors: Dict[str, Set[int]] = {}
+            self._vocabulary: List[str] = []
+            self._ids: Set[int] = set()
+            self.max_id = 0
+            # Версия 'book', с которой индекс сверен последний раз.
+            self.state: Optional[str] = None
+            self.built = False
+
+    def init_app(self, app) -> None:
+        self.reset()
+
+    @staticmethod
+    def _collect(rows: Iterable[Tuple[int, str, str]]) -> Tuple[dict, dict, Set[int]]:
+        """Словари слов для строк (id, name, author) и id этих строк."""
+        names: Dict[str, Set[int]] = {}
+        authors: Dict[str, Set[int]] = {}
+        ids: Set[int] = set()
+        for book_id, name, author in rows:
+            for postings, text in ((names, name), (authors, author)):
+                for token in tokenize(text):
+                    postings.setdefault(token, set()).add(book_id)
+            ids.add(book_id)
+        return names, authors, ids
+
+    def _merge(self, names: dict, authors: dict, ids: Set[int]) -> None:
+        """Добавляет собранные слова в индекс; вызывается под блокировкой.
+
+        Новые слова досортировываются в словарь одной сортировкой: два
+        упорядоченных куска timsort сливает за линейное время.
+        """
+        fresh = (names.keys() | authors.keys()) - self._names.keys() - self._authors.keys()
+        for postings, loaded in ((self._names, names), (self._authors, authors)):
+            for token, book_ids in loaded.items():
+                postings.setdefault(token, set()).update(book_ids)
+        if fresh:
+            self._vocabulary = sorted(self._vocabulary + list(fresh))
+        self._ids.update(ids)
+        self.max_id = max(self.max_id, max(ids, default=0))
+
+    def add(self, book_id: int, name: str, author: str) -> None:
+        self.add_many([(book_id, name, author)])
+
+    def add_many(self, rows: Iterable[Tuple[int, str, str]]) -> None:
+        """Добавляет книги (id, name, author), только что записанные в базу."""
+        with self._lock:
+            if not self.built:
+                return
+            self._merge(*self._collect(rows))
+
+    def _load(self, after_id: int) -> Tuple[dict, dict, Set[int]]:
+        rows = (
+            mdl.Book.query
+                .filter(mdl.Book.id > after_id)
+                .with_entities(mdl.Book.id, mdl.Book.name, mdl.Book.author)
+                .order_by(mdl.Book.id)
+                .yield_per(BULK_CHUNK_SIZE)
+        )
+        return self._collect(rows)
+
+    def refresh(self) -> None:
+        """Сверяет индекс с таблицей book.
+
+        Пока версия 'book' прежняя, таблица не менялась и не читается.
+        Иначе дочитываются книги с id больше последнего известного, а число
+        книг до него сравнивается с числом книг в индексе. Расхождение дают
+        книга, закоммиченная позже книги с большим id, вставка загрузчика с
+        явным id и удаление; тогда индекс строится заново. Запросы к базе
+        идут без блокировки, чтобы не задерживать поиски в других потоках;
+        блокировка берётся только на слияние прочитанного.
+        """
+        state, _ = versions.read(['book'])
+        with self._lock:
+            if self.built and state == self.state:
+                return
+            after_id, known = self.max_id, len(self._ids)
+        full = not after_id or mdl.db.session.query(
+            func.count(mdl.Book.id)
+        ).filter(mdl.Book.id <= after_id).scalar() != known
+        loaded = self._load(0 if full else after_id)
+        with self._lock:
+            if full:
+                self.reset()
+            self._merge(*loaded)
+            self.state = state
+            self.built = True
+
+    def _expand(self, token: str) -> Iterable[str]:
+        if len(token) < SEARCH_MIN_PREFIX:
+            return [token]
+        start = bisect.bisect_left(self._vocabulary, token)
+        end = bisect.bisect_left(self._vocabulary, token + '\uffff', start)
+        return self._vocabulary[start:end]
+
+    def _score_token(self, token: str) -> Dict[int, int]:
+        scores = {}
+        for candidate in self._expand(token):
+            bonus = 2 if candidate == token else 1
+            for postings, weight in (
+                    (self._names, NAME_WEIGHT),
+                    (self._authors, AUTHOR_WEIGHT),
+            ):
+                for book_id in postings.get(candidate, ()):
+                    score = weight * bonus
+                    if score > scores.get(book_id, 0):
+                        scores[book_id] = score
+        return scores
+
+    def _scores(self, query: str) -> Dict[int, int]:
+        scores: Dict[int, int] = {}
+        with self._lock:
+            for index, token in enumerate(tokenize(query)):
+                token_scores = self._score_token(token)
+                if not index:
+                    scores = token_scores
+                else:
+                    scores = {
+                        book_id: scores[book_id] + score
+                        for book_id, score in token_scores.items()
+                        if book_id in scores
+                    }
+                if not scores:
+                    break
+        return scores
+
+    def count(self, query: str) -> int:
+        """Число книг, подходящих под запрос."""
+        return len(self._scores(query))
+
+    def search(
+            self,
+            query: str,
+            limit: int,
+            after: Optional[Tuple[int, int]] = None,
+            offset: int = 0,
+    ) -> List[Tuple[int, int]]:
+        """Возвращает до `limit` пар (score, book_id) по убыванию релевантности."""
+        scores = self._scores(query)
+        if not scores:
+            return []
+        ranked = ((-score, book_id) for book_id, score in scores.items())
+        if after is not None:
+            ranked = (key for key in ranked if key > (-after[0], after[1]))
+        top = heapq.nsmallest(offset + limit, ranked)[offset:]
+        return [(-score, book_id) for score, book_id in top]
+
+
+book_index = BookSearchIndex()
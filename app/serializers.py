@@ -0,0 +1,122 @@
+import functools
+from datetime import date
+from typing import Any, Callable, List, Tuple
+
+import flask
+import ujson
+import werkzeug
+from flask_apispec import marshal_with as apispec_marshal_with
+from marshmallow import fields
+
+from app.constants import HttpStatus
+from app.schemas import Response
+
+
+_MISSING = object()
+
+
+def _get(obj: Any, attribute: str) -> Any:
+    if isinstance(obj, dict):
+        return obj.get(attribute, _MISSING)
+    return getattr(obj, attribute, _MISSING)
+
+
+def _nested(compiled: 'CompiledSchema', many: bool) -> Callable[[Any], Any]:
+    if many:
+        return lambda value: [compiled.dump(item) for item in value]
+    return compiled.dump
+
+
+def _formatter(name: str, field: fields.Field) -> Callable[[Any], Any]:
+    if isinstance(field, fields.Nested):
+        return _nested(CompiledSchema(field.nested), field.many)
+    if isinstance(field, fields.Date) and field.format in (None, 'iso'):
+        return date.isoformat
+    if isinstance(field, fields.DateTime) and field.format in (None, 'iso'):
+        return lambda value: value.isoformat()
+    if isinstance(field, fields.Integer) and not field.as_string:
+        return int
+    if isinstance(field, fields.String):
+        return str
+    return lambda value: field._serialize(value, name, None)
+
+
+class CompiledSchema:
+    """Сериализатор, собранный один раз по полям marshmallow-схемы.
+
+    Не хранит состояния между вызовами и повторяет вывод `Schema.dump`
+    для полей, которые используются в схемах магазина.
+    """
+
+    def __init__(self, schema):
+        if not isinstance(schema, type):
+            schema = type(schema)
+        self.enveloped = issubclass(schema, Response)
+        self.fields: List[Tuple[str, str, Callable[[Any], Any]]] = [
+            (
+                field.data_key or name,
+                field.attribute or name,
+                _formatter(name, field),
+            )
+            for name, field in schema._declared_fields.items()
+            if not field.load_only
+        ]
+
+    def dump(self, obj: Any) -> dict:
+        result = {}
+        for key, attribute, formatter in self.fields:
+            value = _get(obj, attribute)
+            if value is _MISSING:
+                continue
+            result[key] = None if value is None else formatter(value)
+        return result
+
+    def envelope(self, response: Any) -> dict:
+        if not self.enveloped:
+            return self.dump(response)
+        result = {
+            'code': HttpStatus.HTTP_200_OK,
+            'data': self.dump(response),
+        }
+        if isinstance(response, dict):
+            error_text = response.get('error_text')
+            error_fields = response.get('error_fields')
+            if error_text is not None:
+                result['errorText'] = error_text
+            if error_fields:
+                result['errorFields'] = error_fields
+        return result
+
+    def response(self, response: Any) -> werkzeug.Response:
+        envelope = self.envelope(response)
+        app = flask.current_app
+        if app.debug:
+            return flask.jsonify(envelope)
+        body = ujson.dumps(
+            envelope,
+            ensure_ascii=True,
+            sort_keys=True,
+            escape_forward_slashes=False,
+        )
+        if '\x7f' in body:
+            body = body.replace('\x7f', '\\u007f')
+        return app.response_class(body + '\n', mimetype='application/json')
+
+
+def marshal_with(schema, code='default', description=''):
+    """`flask_apispec.marshal_with`, который при COMPILED_SERIALIZATION
+    отдаёт готовый ответ собранным сериализатором в обход `Schema.dump`."""
+    compiled = CompiledSchema(schema)
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapped(*args, **kwargs):
+            result = func(*args, **kwargs)
+            if (
+                    isinstance(result, (tuple, werkzeug.Response))
+                    or not flask.current_app.config.get('COMPILED_SERIALIZATION', True)
+            ):
+                return result
+            return compiled.response(result)
+        return apispec_marshal_with(schema, code=code, description=description)(wrapped)
+    return decorator
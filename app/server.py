@@ -0,0 +1,143 @@
+import logging
+import os
+import time
+from typing import Iterable, Optional
+
+from gunicorn.app.base import BaseApplication
+from sqlalchemy import orm, text
+from sqlalchemy.pool import QueuePool
+
+from app import models as mdl
+from app.admission import admission
+from app.aio import async_db
+from app.group_commit import group_commit
+from app.metrics import metrics
+from app.replicas import replicas
+
+
+def _warm_engine(engine, connections: int) -> None:
+    if isinstance(engine.pool, QueuePool):
+        connections = min(connections, engine.pool.size())
+    held = []
+    try:
+        for _ in range(max(connections, 1)):
+            connection = engine.connect()
+            held.append(connection)
+            connection.execute(text('SELECT 1'))
+    finally:
+        for connection in held:
+            connection.close()
+
+
+def warm_up(app, connections: int, paths: Iterable[str] = ()) -> None:
+    """Готовит процесс к первому запросу.
+
+    Настраивает мапперы, открывает `connections` соединений в пулах
+    основной базы и реплик и прогоняет GET-запросы `paths`, чтобы
+    собрать схемы разбора аргументов и закэшировать SQL.
+    """
+    orm.configure_mappers()
+    with app.app_context():
+        _warm_engine(mdl.db.engine, connections)
+        for replica in replicas.replicas:
+            try:
+                _warm_engine(replica.engine, connections)
+            except Exception:
+                logging.warning(f'replica {replica.engine.url!r} is unavailable')
+    client = app.test_client()
+    for path in paths:
+        response = client.get(path)
+        if response.status_code >= 500:
+            logging.warning(f'warm-up request {path} failed: {response.status_code}')
+
+
+class Server(BaseApplication):
+    """Gunicorn с заранее созданным приложением.
+
+    Приложение создаётся в главном процессе до запуска воркеров,
+    каждый воркер после fork сбрасывает унаследованные соединения и
+    прогревается до того, как начнёт принимать запросы. По SIGTERM
+    воркеры дорабатывают текущие запросы и очередь общего коммита в
+    пределах SERVER_GRACEFUL_TIMEOUT.
+    """
+
+    def __init__(self, app, started: Optional[float] = None):
+        self.application = app
+        self.started = time.monotonic() if started is None else started
+        self.created = time.monotonic()
+        self.ready: Optional[float] = None
+        self.served_first = False
+        super().__init__()
+
+    def load_config(self) -> None:
+        config = self.application.config
+        threads = config.get('SERVER_THREADS', 4)
+        options = {
+            'bind': config.get('SERVER_BIND', '0.0.0.0:5000'),
+            'workers': config.get('SERVER_WORKERS', (os.cpu_count() or 1) + 1),
+            'threads': threads,
+            'worker_class': 'gthread' if threads > 1 else 'sync',
+            'timeout': config.get('SERVER_TIMEOUT', 30),
+            'graceful_timeout': config.get('SERVER_GRACEFUL_TIMEOUT', 30),
+            'keepalive': config.get('SERVER_KEEPALIVE', 5),
+            'accesslog': config.get('SERVER_ACCESS_LOG'),
+            'errorlog': '-',
+            'loglevel': config.get('SERVER_LOG_LEVEL', 'info'),
+            'preload_app': True,
+            'post_fork': self.post_fork,
+            'post_worker_init': self.post_worker_init,
+            'pre_request': self.pre_request,
+            'post_request': self.post_request,
+            'worker_exit': self.worker_exit,
+        }
+        for key, value in options.items():
+            if value is not None:
+                self.cfg.set(key, value)
+
+    def load(self):
+        return self.application
+
+    def post_fork(self, server, worker) -> None:
+        with self.application.app_context():
+            mdl.db.engine.dispose(close=False)
+        replicas.after_fork()
+        async_db.after_fork(self.application)
+        group_commit.init_app(self.application)
+        admission.configure_slots(self.application.config)
+
+    def post_worker_init(self, worker) -> None:
+        config = self.application.config
+        began = time.monotonic()
+        warm_up(
+            self.application,
+            config.get('SERVER_WARM_CONNECTIONS', config.get('SERVER_THREADS', 4)),
+            config.get('SERVER_WARMUP_PATHS', ()),
+        )
+        self.ready = time.monotonic()
+        metrics.gauge('bookstore_startup_seconds', lambda: self.ready - self.started)
+        worker.log.info(
+            f'worker {worker.pid} ready in {self.ready - self.started:.3f}s:'
+            f' app {self.created - self.started:.3f}s,'
+            f' warm-up {self.ready - began:.3f}s'
+        )
+
+    @staticmethod
+    def pre_request(worker, req) -> None:
+        req.started = time.monotonic()
+
+    def post_request(self, worker, req, environ, resp) -> None:
+        if self.served_first:
+            return
+        self.served_first = True
+        took = time.monotonic() - req.started
+        metrics.gauge('bookstore_first_request_seconds', lambda: took)
+        worker.log.info(
+            f'worker {worker.pid} served first request in {took * 1000:.1f} ms,'
+            f' {time.monotonic() - self.started:.3f}s after start'
+        )
+
+    def worker_exit(self, server, worker) -> None:
+        group_commit.close()
+        async_db.close()
+        with self.application.app_context():
+            mdl.db.engine.dispose()
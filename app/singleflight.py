@@ -0,0 +1,140 @@
+import copy
+import functools
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from sqlalchemy import event
+
+from app import models as mdl
+from app.replicas import RoutingSession, replicas
+
+
+# Ключ в session.info: транзакция сессии что-то записала.
+WROTE_KEY = 'single_flight_wrote'
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Склеивает одновременные одинаковые вызовы чтения в процессе.
+
+    Пока вызов метода с теми же аргументами выполняется в одном потоке,
+    остальные ждут его и получают тот же результат или ту же ошибку,
+    не обращаясь к базе. Ключ включает роль базы, с которой идёт чтение
+    (реплика или основная), поэтому чтения с основной базы (окно
+    read-your-writes) не получают результат реплики, а чтения с разных
+    реплик склеиваются. Ключ включает и номер записи (generation): после
+    каждой зафиксированной в процессе записи вызовы начинаются заново,
+    так что чтение после своей записи не получит результат вызова,
+    начатого до неё. Транзакция, которая сама уже писала, не склеивается
+    вовсе: её незафиксированных изменений чужой вызов не видит. Кэша нет:
+    после завершения вызова следующий снова идёт в базу. Результат отдаётся нескольким потокам, поэтому склеивать
+    можно только методы, возвращающие строки и словари, а не объекты ORM.
+    Выключается через SINGLE_FLIGHT_ENABLED.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self.enabled = True
+        self.generation = 0
+        self.leaders = 0
+        self.shared = 0
+
+    def init_app(self, app) -> None:
+        self.enabled = app.config.get('SINGLE_FLIGHT_ENABLED', True)
+        self.leaders = 0
+        self.shared = 0
+
+    def written(self) -> None:
+        """Отмечает зафиксированную запись: начатые до неё вызовы больше не склеиваются."""
+        with self._lock:
+            self.generation += 1
+
+    @property
+    def ratio(self) -> float:
+        """Доля вызовов, получивших чужой результат вместо запроса в базу."""
+        total = self.leaders + self.shared
+        return self.shared / total if total else 0.0
+
+    def _lead(self, key: Hashable, call: _Call, func: Callable, args, kwargs) -> Any:
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except BaseException as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def _follow(self, call: _Call) -> Any:
+        call.done.wait()
+        if call.error is not None:
+            raise copy.copy(call.error)
+        return call.result
+
+    def coalesce(self, func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapped(*args, **kwargs):
+            if not self.enabled or mdl.db.session.info.get(WROTE_KEY):
+                return func(*args, **kwargs)
+            key = (
+                func.__qualname__,
+                args,
+                tuple(sorted(kwargs.items())),
+                'primary' if replicas.current is None else 'replica',
+                self.generation,
+            )
+            try:
+                hash(key)
+            except TypeError:
+                return func(*args, **kwargs)
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call()
+                    self.leaders += 1
+                else:
+                    self.shared += 1
+            if leader:
+                return self._lead(key, call, func, args, kwargs)
+            return self._follow(call)
+        return wrapped
+
+
+single_flight = SingleFlight()
+
+
+def _after_flush(session, flush_context) -> None:
+    if session.new or session.dirty or session.deleted:
+        session.info[WROTE_KEY] = True
+
+
+def _do_orm_execute(state) -> None:
+    if state.is_insert or state.is_update or state.is_delete:
+        state.session.info[WROTE_KEY] = True
+
+
+def _after_commit(session) -> None:
+    if session.info.pop(WROTE_KEY, False):
+        single_flight.written()
+
+
+def _after_rollback(session, previous_transaction) -> None:
+    session.info.pop(WROTE_KEY, None)
+
+
+event.listen(RoutingSession, 'after_flush', _after_flush)
+event.listen(RoutingSession, 'do_orm_execute', _do_orm_execute)
+event.listen(RoutingSession, 'after_commit', _after_commit)
+event.listen(RoutingSession, 'after_soft_rollback', _after_rollback)
@@ -0,0 +1,216 @@
+import functools
+import gzip
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, NamedTuple, Optional, Set, Tuple
+
+from flask import make_response, request
+from sqlalchemy import event
+from werkzeug.wrappers import Response
+
+from app import versions
+from app.replicas import RoutingSession, replicas
+
+
+Key = Tuple[str, str, bytes]
+
+
+class Snapshot(NamedTuple):
+    state: str
+    status: int
+    mimetype: str
+    body: bytes
+    compressed: bytes
+    # Чем пересобрать снимок в фоне.
+    func: Callable
+    view_args: dict
+    keys: Tuple[str, ...]
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + len(self.compressed)
+
+
+class ResponseSnapshots:
+    """Готовые байты ответов списочных ручек, обычные и сжатые gzip.
+
+    Снимок действителен, пока не изменились версии его ключей, и
+    отдаётся без обращения к данным и без сериализации. После коммита,
+    поменявшего версии, затронутые снимки пересобираются в фоновом
+    потоке. Общий размер ограничен SNAPSHOT_MAX_BYTES, лишнее
+    вытесняется по давности использования.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: Set[str] = set()
+        self._worker: Optional[threading.Thread] = None
+        self.app = None
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._entries: 'OrderedDict[Key, Snapshot]' = OrderedDict()
+            self.size = 0
+            self.hits = 0
+            self.misses = 0
+            self.rebuilds = 0
+
+    def init_app(self, app) -> None:
+        self.reset()
+        self.app = app
+        self.enabled = app.config.get('SNAPSHOTS_ENABLED', True)
+        self.max_bytes = app.config.get('SNAPSHOT_MAX_BYTES', 16 * 1024 * 1024)
+        self.level = app.config.get('SNAPSHOT_GZIP_LEVEL', 6)
+        self.background = app.config.get('SNAPSHOT_BACKGROUND_REBUILD', True)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'rebuilds': self.rebuilds,
+                'entries': len(self._entries),
+                'bytes': self.size,
+            }
+
+    def _count(self, counter: str) -> None:
+        # Счётчики меняют потоки запросов и поток пересборки одновременно,
+        # а += не атомарен.
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _store(self, key: Key, snapshot: Snapshot) -> None:
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= previous.size
+            if snapshot.size > self.max_bytes:
+                return
+            self._entries[key] = snapshot
+            self.size += snapshot.size
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= evicted.size
+
+    def _get(self, key: Key, state: str) -> Optional[Snapshot]:
+        with self._lock:
+            snapshot = self._entries.get(key)
+            if snapshot is None or snapshot.state != state:
+                return None
+            self._entries.move_to_end(key)
+            return snapshot
+
+    def _build(self, func: Callable, view_args: dict, keys: Tuple[str, ...], state: str):
+        response = make_response(func(**view_args))
+        if response.status_code != 200:
+            return response, None
+        body = response.get_data()
+        return response, Snapshot(
+            state=state,
+            status=response.status_code,
+            mimetype=response.mimetype,
+            body=body,
+            compressed=gzip.compress(body, self.level),
+            func=func,
+            view_args=view_args,
+            keys=keys,
+        )
+
+    @staticmethod
+    def _respond(snapshot: Snapshot) -> Response:
+        response = Response(status=snapshot.status, mimetype=snapshot.mimetype)
+        if request.accept_encodings['gzip']:
+            response.set_data(snapshot.compressed)
+            response.headers['Content-Encoding'] = 'gzip'
+        else:
+            response.set_data(snapshot.body)
+        response.vary.add('Accept-Encoding')
+        return response
+
+    def cached(self, keys: Callable[..., Iterable[str]]) -> Callable:
+        """Отдаёт ответ GET-ручки из снимка, действительного при текущих версиях `keys`."""
+        def decorator(func: Callable) -> Callable:
+            @functools.wraps(func)
+            def wrapped(**view_args):
+                if not self.enabled:
+                    return func(**view_args)
+                version_keys = tuple(sorted(set(keys(**view_args))))
+                state = versions.known_state(version_keys)
+                if state is None:
+                    state, _ = versions.read(version_keys)
+                key = (request.endpoint, request.full_path, request.get_data())
+                snapshot = self._get(key, state)
+                if snapshot is not None:
+                    self._count('hits')
+                    return self._respond(snapshot)
+                self._count('misses')
+                response, snapshot = self._build(func, view_args, version_keys, state)
+                if snapshot is None:
+                    return response
+                self._store(key, snapshot)
+                return self._respond(snapshot)
+            return wrapped
+        return decorator
+
+    def _rebuild(self, key: Key, snapshot: Snapshot) -> None:
+        # Версии и данные читаются с основной базы: реплика может ещё не
+        # получить запись, из-за которой началась пересборка, и тогда
+        # старые данные легли бы в снимок под новыми версиями.
+        endpoint, path, body = key
+        with self.app.test_request_context(
+                path, method='GET', data=body, content_type='application/json',
+        ), replicas.primary():
+            state, _ = versions.read(snapshot.keys)
+            if state == snapshot.state:
+                return
+            _, fresh = self._build(snapshot.func, snapshot.view_args, snapshot.keys, state)
+        if fresh is not None:
+            self._store(key, fresh)
+            self._count('rebuilds')
+
+    def _work(self) -> None:
+        while True:
+            with self._lock:
+                changed, self._pending = self._pending, set()
+                if not changed:
+                    self._worker = None
+                    return
+                stale = [
+                    (key, snapshot) for key, snapshot in self._entries.items()
+                    if changed.intersection(snapshot.keys)
+                ]
+            for key, snapshot in reversed(stale):
+                try:
+                    self._rebuild(key, snapshot)
+                except Exception:
+                    logging.exception(f'snapshot rebuild failed: {key[1]}')
+
+    def changed(self, keys: Iterable[str]) -> None:
+        """Планирует фоновую пересборку снимков, зависящих от `keys`."""
+        if self.app is None or not self.enabled or not self.background:
+            return
+        with self._lock:
+            self._pending.update(keys)
+            if self._worker is not None:
+                return
+            self._worker = threading.Thread(target=self._work, name='snapshots', daemon=True)
+        self._worker.start()
+
+
+snapshots = ResponseSnapshots()
+
+
+def _after_commit(session) -> None:
+    keys = session.info.pop('bumped_versions', None)
+    if keys:
+        snapshots.changed(keys)
+
+
+def _after_rollback(session, previous_transaction) -> None:
+    session.info.pop('bumped_versions', None)
+
+
+event.listen(RoutingSession, 'after_commit', _after_commit)
+event.listen(RoutingSession, 'after_soft_rollback', _after_rollback)
@@ -0,0 +1,107 @@
+import random
+from typing import Dict, Optional
+
+from sqlalchemy import func, select
+
+from app import models as mdl
+from app.archive import ORDER_TABLES
+from app.cache import LRUBackend
+from app.constants import BULK_CHUNK_SIZE, TOTAL_SHARDS
+from app.queries import increment
+from app.versions import orders_key
+
+
+# Счётчики строк каталога хранятся под именами таблиц. Их меняет каждый
+# писатель, поэтому прибавка идёт в случайный из TOTAL_SHARDS шардов, а
+# чтение складывает шарды. Кроме них есть счётчики заказов пользователя
+# (versions.orders_key) и строк заказа (order_items_key); их пишет один
+# заказ, поэтому шард у них один.
+CATALOG = {
+    'user': mdl.User,
+    'shop': mdl.Shop,
+    'book': mdl.Book,
+}
+
+
+def order_items_key(order_id: int) -> str:
+    return f'order_items:{order_id}'
+
+
+def add(counts: Dict[str, int]) -> None:
+    """Прибавляет к счётчикам строк в текущей транзакции одним запросом."""
+    increment(mdl.RowCount, [
+        {
+            'key': key,
+            'shard': random.randrange(TOTAL_SHARDS) if key in CATALOG else 0,
+            'count': count,
+        }
+        for key, count in sorted(counts.items())
+        if count
+    ], ('count',))
+
+
+def get(key: str) -> int:
+    count = mdl.db.session.execute(
+        select(func.sum(mdl.RowCount.count)).where(mdl.RowCount.key == key)
+    ).scalar()
+    return count or 0
+
+
+class ApproximateCounts:
+    """COUNT(*) для отфильтрованных списков, закэшированный в процессе.
+
+    Значение живёт не дольше TOTAL_MAX_AGE секунд. Если вызывающий
+    передаёт состояние версий, после записи в таблицу счёт пересчитывается
+    сразу, а не по истечении срока.
+    """
+
+    def __init__(self):
+        self.backend = LRUBackend(maxsize=1000, ttl=60)
+
+    def init_app(self, app) -> None:
+        self.backend = LRUBackend(
+            maxsize=app.config.get('TOTAL_CACHE_MAXSIZE', 1000),
+            ttl=app.config.get('TOTAL_MAX_AGE', 60),
+        )
+
+    def get(self, key: tuple, query, state: Optional[str] = None) -> int:
+        cache_key = repr((key, state))
+        count = self.backend.get(cache_key)
+        if count is None:
+            count = query.order_by(None).count()
+            self.backend.set(cache_key, count)
+        return count
+
+
+approximate = ApproximateCounts()
+
+
+def rebuild(chunk_size: int = BULK_CHUNK_SIZE, log=print) -> int:
+    """Пересчитывает счётчики строк из таблиц, возвращает их число.
+
+    Как и пересчёт продаж, запускать его стоит без входящего трафика.
+    """
+    mdl.db.session.query(mdl.RowCount).delete(synchronize_session=False)
+    counts = {
+        key: mdl.db.session.query(func.count(model.id)).scalar()
+        for key, model in CATALOG.items()
+    }
+    for orders, _ in ORDER_TABLES:
+        for user_id, count in (
+                mdl.db.session.query(orders.user_id, func.count(orders.id))
+                    .group_by(orders.user_id)
+        ):
+            key = orders_key(user_id)
+            counts[key] = counts.get(key, 0) + count
+    for _, items in ORDER_TABLES:
+        for order_id, count in (
+                mdl.db.session.query(items.order_id, func.count(items.id))
+                    .group_by(items.order_id)
+        ):
+            counts[order_items_key(order_id)] = count
+    keys = sorted(counts)
+    for start in range(0, len(keys), chunk_size):
+        add({key: counts[key] for key in keys[start:start + chunk_size]})
+        log(f'{min(start + chunk_size, len(keys))} counters')
+    mdl.db.session.commit()
+    return len(keys)
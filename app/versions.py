@@ -0,0 +1,129 @@
+import functools
+import hashlib
+from datetime import datetime, timezone
+from itertools import chain
+from typing import Callable, Iterable, Optional, Tuple
+
+from flask import g, has_request_context, make_response, request
+from sqlalchemy import event
+
+from app import models as mdl
+from app.constants import HttpStatus
+from app.queries import increment
+from app.replicas import RoutingSession
+
+
+# Таблицы, любая запись в которые меняет версию с тем же именем.
+TRACKED_TABLES = frozenset(('book', 'shop'))
+
+
+def orders_key(user_id: int) -> str:
+    return f'orders:{user_id}'
+
+
+def bump(keys: Iterable[str]) -> None:
+    """Увеличивает счётчики версий в текущей транзакции."""
+    keys = sorted(set(keys))
+    now = datetime.utcnow()
+    increment(
+        mdl.Version,
+        [{'key': key, 'version': 1, 'updated_at': now} for key in keys],
+        ('version',),
+        assign=('updated_at',),
+    )
+    mdl.db.session.info.setdefault('bumped_versions', set()).update(keys)
+
+
+def read(keys: Iterable[str]) -> Tuple[str, Optional[datetime]]:
+    """Состояние версий `keys` одной строкой и время последнего изменения.
+
+    Прочитанное состояние запоминается в `g` на время запроса.
+    """
+    keys = tuple(sorted(set(keys)))
+    rows = (
+        mdl.db.session.query(
+            mdl.Version.key, mdl.Version.version, mdl.Version.updated_at,
+        )
+            .filter(mdl.Version.key.in_(keys))
+            .all()
+    )
+    versions = {row.key: row.version for row in rows}
+    modified = max((row.updated_at for row in rows if row.updated_at), default=None)
+    state = ','.join(f'{key}={versions.get(key, 0)}' for key in keys)
+    if has_request_context():
+        g.setdefault('version_state', {})[keys] = state, modified
+    return state, modified
+
+
+def _known(keys: Iterable[str]) -> Optional[Tuple[str, Optional[datetime]]]:
+    if not has_request_context():
+        return None
+    return g.get('version_state', {}).get(tuple(sorted(set(keys))))
+
+
+def known_state(keys: Iterable[str]) -> Optional[str]:
+    """Состояние версий `keys`, если его уже прочитали в этом запросе."""
+    known = _known(keys)
+    return None if known is None else known[0]
+
+
+def _after_flush(session, flush_context) -> None:
+    tables = {
+        instance.__table__.name
+        for instance in chain(session.new, session.dirty, session.deleted)
+    }
+    if tables & TRACKED_TABLES:
+        bump(tables & TRACKED_TABLES)
+
+
+def _do_orm_execute(state) -> None:
+    if not (state.is_insert or state.is_update or state.is_delete):
+        return
+    table = getattr(state.statement, 'table', None)
+    if table is not None and table.name in TRACKED_TABLES:
+        bump([table.name])
+
+
+event.listen(RoutingSession, 'after_flush', _after_flush)
+event.listen(RoutingSession, 'do_orm_execute', _do_orm_execute)
+
+
+def _etag(state: str) -> str:
+    raw = '\n'.join((request.full_path, request.get_data(as_text=True), state))
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def _not_modified(etag: str, modified: Optional[datetime]) -> bool:
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and modified is not None:
+        modified = modified.replace(microsecond=0, tzinfo=timezone.utc)
+        return modified <= request.if_modified_since
+    return False
+
+
+def conditional(keys: Callable[..., Iterable[str]]) -> Callable:
+    """Условный GET по версиям `keys(**аргументы ручки)`.
+
+    ETag складывается из версий, пути и тела запроса, поэтому для ответа
+    304 нужен один запрос к таблице версий, без чтения самих данных.
+    Версии, уже прочитанные в этом запросе, повторно не читаются.
+    Версии должны читаться с той же базы, что и данные ответа, поэтому
+    ручку с репликами оборачивают в replicas.read() выше этого декоратора.
+    """
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapped(*args, **kwargs):
+            version_keys = keys(*args, **kwargs)
+            state, modified = _known(version_keys) or read(version_keys)
+            etag = _etag(state)
+            if _not_modified(etag, modified):
+                response = make_response('', HttpStatus.HTTP_304_NOT_MODIFIED)
+            else:
+                response = make_response(func(*args, **kwargs))
+            response.set_etag(etag, weak=True)
+            if modified is not None:
+                response.last_modified = modified.replace(tzinfo=timezone.utc)
+            return response
+        return wrapped
+    return decorator
@@ -1,16 +1,34 @@
-from flask_apispec import doc, use_kwargs, marshal_with
-from sqlalchemy import desc
-from datetime import datetime, date
+from flask_apispec import doc, use_kwargs
+from app.serializers import marshal_with
+from sqlalchemy import desc, insert, literal, select, union_all
+from datetime import datetime, date, time, timedelta
 
-from typing import Callable, Dict, List
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
 from app import models as mdl
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, current_app, request, jsonify
 
-from app import schemas, constants
+from app import archive, batch, inventory, sales, schemas, constants, totals, versions
 from app.exceptions import BookStoreException
-from app.constants import HttpStatus, MAX_ROWS, ErrorMessages
-from app.types import User, Order, OrderItem
+from app.constants import (
+    HttpStatus, MAX_ROWS, BULK_CHUNK_SIZE, ErrorMessages, STOCK_RETRIES,
+    SALES_DEFAULT_DAYS, SALES_MAX_DAYS, TOP_BOOKS_DEFAULT_DAYS,
+)
+from app.types import User, Order, OrderItem, Book
+from app.pagination import (
+    Page, decode_cursor, encode_cursor, page, paginate, paginate_parts, seek,
+)
+from app.queries import book_by_id, keys_in, shop_by_id, user_by_id
+from app.cache import entity_cache
+from app.search import book_index
+from app.budget import query_budget
+from app.replicas import replicas
+from app.aio import async_db
+from app.snapshots import snapshots
+from app.group_commit import group_commit
+from app.singleflight import single_flight
 from sqlalchemy.exc import IntegrityError
+import asyncio
+import functools
 import logging
 
 
@@ -35,21 +53,70 @@ def handle_error(err):
 
 
 def log(func):
+    @functools.wraps(func)
     def wrapped(*args, **kwargs):
         logging.info(
             f'{request.method}, {request.path}', {'data': request.data}
         )
         response = func(*args, **kwargs)
+        body = response.get_json(silent=True) if hasattr(response, 'get_json') else response
+        body = body if isinstance(body, dict) else {}
         logging.info(
             f'{request.method}, {request.path}', {
-                'code': response['code'],
-                'error_text': response.get('errorText'),
-                'error_fields': response.get('errorFields')
+                'code': body.get('code', getattr(response, 'status_code', None)),
+                'error_text': body.get('errorText'),
+                'error_fields': body.get('errorFields')
             }
         )
+        return response
     return wrapped
 
 
+def _request_rows(key: str) -> int:
+    payload = request.get_json(silent=True)
+    rows = payload.get(key) if isinstance(payload, dict) else None
+    return len(rows) if isinstance(rows, list) else 0
+
+
+# Заказ без гонки за остатки: проверка id, чтение остатков, списание и
+# проверка списанного, заказ, продажи магазинов и книг, первая порция
+# строк, счётчики строк и версии.
+ORDER_QUERIES = 10
+# Гонка за остатки: возврат перерасхода, перечитывание остатков и до
+# STOCK_RETRIES пар из условного UPDATE и нового чтения.
+ORDER_RETRY_QUERIES = 2 + 2 * STOCK_RETRIES
+# Поиск: версия 'book', сверка числа книг с индексом, дочитывание индекса
+# и сами книги.
+SEARCH_QUERIES = 4
+
+
+def _order_budget() -> int:
+    # Каждая следующая порция строк из BULK_CHUNK_SIZE: чтение остатков,
+    # списание, проверка списанного и вставка строк.
+    extra_chunks = max(-(-_request_rows('order_items') // BULK_CHUNK_SIZE) - 1, 0)
+    return ORDER_QUERIES + ORDER_RETRY_QUERIES + 4 * extra_chunks
+
+
+def _requested(key: str) -> bool:
+    payload = request.get_json(silent=True)
+    return isinstance(payload, dict) and bool(payload.get(key))
+
+
+def _listing(name: str, page: Page, **fields) -> dict:
+    result = {name: page.items, 'next_cursor': page.next_cursor, **fields}
+    if page.total is not None:
+        result['total'] = page.total
+    return result
+
+
+def _user_key(user_id: int, *args, **kwargs) -> tuple:
+    return 'user', user_id
+
+
+def _order_key(order_id: int, *args, **kwargs) -> tuple:
+    return 'order', order_id
+
+
 def handle_integrity_error(error_message: str):
     def decorator(funct: Callable):
         def wrapped(*args, **kwargs):
@@ -65,6 +132,108 @@ def handle_integrity_error(error_message: str):
     return decorator
 
 
+def _sales_range(date_from: Optional[date], date_to: Optional[date]) -> Tuple[date, date]:
+    date_to = date_to or datetime.utcnow().date()
+    date_from = date_from or date_to - timedelta(days=SALES_DEFAULT_DAYS - 1)
+    if not timedelta(0) <= date_to - date_from < timedelta(days=SALES_MAX_DAYS):
+        raise BookStoreException(
+            code=HttpStatus.HTTP_400_BAD_REQUEST,
+            error_text=ErrorMessages.INVALID_DATE_RANGE.format(date_from, date_to),
+        )
+    return date_from, date_to
+
+
+class AsyncBookStoreController:
+    """Чтения BookStoreController для ASYNC_PARALLEL_READS: независимые запросы идут параллельно."""
+
+    @staticmethod
+    async def _load(statement) -> Optional[dict]:
+        row = await async_db.first(statement)
+        return None if row is None else dict(row._mapping)
+
+    @staticmethod
+    async def get_book(book_id: int) -> dict:
+        book = await entity_cache.get_or_load_async(
+            'book', book_id,
+            lambda book_id: AsyncBookStoreController._load(book_by_id(book_id)),
+        )
+        if book is None:
+            raise BookStoreException(
+                code=HttpStatus.HTTP_404_NOT_FOUND,
+                error_text=ErrorMessages.BOOK_NOT_FOUND.format(book_id),
+            )
+        return book
+
+    @staticmethod
+    async def get_shop(shop_id: int) -> dict:
+        shop = await entity_cache.get_or_load_async(
+            'shop', shop_id,
+            lambda shop_id: AsyncBookStoreController._load(shop_by_id(shop_id)),
+        )
+        if shop is None:
+            raise BookStoreException(
+                code=HttpStatus.HTTP_404_NOT_FOUND,
+                error_text=ErrorMessages.SHOP_NOT_FOUND.format(shop_id),
+            )
+        return shop
+
+    @staticmethod
+    async def get_user(user_id: int) -> User:
+        user = await entity_cache.get_or_load_async(
+            'user', user_id,
+            lambda user_id: AsyncBookStoreController._load(user_by_id(user_id)),
+        )
+        if user is None:
+            raise BookStoreException(
+                code=HttpStatus.HTTP_404_NOT_FOUND,
+                error_text=ErrorMessages.USER_NOT_FOUND.format(user_id),
+            )
+        return user
+
+    @staticmethod
+    async def get_stock(
+            shop_id: int,
+            limit: int = MAX_ROWS,
+            offset: int = 0,
+            cursor: Optional[str] = None,
+    ) -> Page:
+        query = seek(
+            inventory.stock_query(shop_id),
+            columns=inventory.STOCK_PAGE_KEY,
+            limit=limit,
+            offset=offset,
+            cursor=cursor,
+            descending=False,
+        )
+        _, rows = await asyncio.gather(
+            AsyncBookStoreController.get_shop(shop_id),
+            async_db.all(query),
+        )
+        return page(rows, inventory.STOCK_PAGE_KEY, limit)
+
+    @staticmethod
+    async def get_book_stock(shop_id: int, book_id: int) -> dict:
+        _, _, quantity = await asyncio.gather(
+            AsyncBookStoreController.get_shop(shop_id),
+            AsyncBookStoreController.get_book(book_id),
+            async_db.scalar(inventory.book_stock_query(shop_id, book_id)),
+        )
+        return {'shop_id': shop_id, 'book_id': book_id, 'quantity': quantity or 0}
+
+    @staticmethod
+    async def get_shop_sales(
+            shop_id: int,
+            date_from: Optional[date] = None,
+            date_to: Optional[date] = None,
+    ) -> list:
+        date_from, date_to = _sales_range(date_from, date_to)
+        _, rows = await asyncio.gather(
+            AsyncBookStoreController.get_shop(shop_id),
+            async_db.all(sales.shop_sales_query(shop_id, date_from, date_to)),
+        )
+        return rows
+
+
 class BookStoreController:
 
     @staticmethod
@@ -76,13 +245,114 @@ class BookStoreController:
             release_date = release_date,
         )
         mdl.db.session.add(book)
+        totals.add({'book': 1})
         mdl.db.session.commit()
+        entity_cache.prime('book', book.id, {
+            'id': book.id,
+            'name': book.name,
+            'author': book.author,
+            'release_date': book.release_date,
+        })
+        book_index.add(book.id, book.name, book.author)
         return book.id
 
+    @staticmethod
+    def add_books(books: List[Book]) -> Tuple[List[dict], List[dict]]:
+        added, conflicts = [], []
+        for start in range(0, len(books), BULK_CHUNK_SIZE):
+            chunk_added, chunk_conflicts = BookStoreController._add_books_chunk(
+                enumerate(books[start:start + BULK_CHUNK_SIZE], start)
+            )
+            added.extend(chunk_added)
+            conflicts.extend(chunk_conflicts)
+        return added, conflicts
 
     @staticmethod
+    def _book_ids(keys: Iterable[tuple]) -> Dict[tuple, int]:
+        rows = (
+            mdl.Book.query
+                .filter(keys_in(
+                    (mdl.Book.author, mdl.Book.name, mdl.Book.release_date),
+                    keys,
+                ))
+                .with_entities(
+                    mdl.Book.id,
+                    mdl.Book.author,
+                    mdl.Book.name,
+                    mdl.Book.release_date,
+                )
+                .all()
+        )
+        return {(row.author, row.name, row.release_date): row.id for row in rows}
+
+    @staticmethod
+    def _add_books_chunk(books: Iterable[Tuple[int, Book]]) -> Tuple[List[dict], List[dict]]:
+        conflicted = []
+        pending = {}
+        for index, book in books:
+            key = (
+                book['author'],
+                book['name'],
+                datetime.combine(book['release_date'], time()),
+            )
+            if key in pending:
+                conflicted.append(index)
+            else:
+                pending[key] = index
+
+        for key in BookStoreController._book_ids(pending):
+            conflicted.append(pending.pop(key))
+
+        if pending:
+            values = [
+                {'author': author, 'name': name, 'release_date': release_date}
+                for author, name, release_date in pending
+            ]
+            try:
+                mdl.db.session.execute(insert(mdl.Book).values(values))
+                totals.add({'book': len(values)})
+                mdl.db.session.commit()
+            except IntegrityError:
+                # Кто-то вставил те же книги параллельно: повторяем построчно.
+                mdl.db.session.rollback()
+                for key, row in zip(list(pending), values):
+                    try:
+                        with mdl.db.session.begin_nested():
+                            mdl.db.session.execute(insert(mdl.Book).values(row))
+                    except IntegrityError:
+                        conflicted.append(pending.pop(key))
+                totals.add({'book': len(pending)})
+                mdl.db.session.commit()
+
+        book_ids = BookStoreController._book_ids(pending) if pending else {}
+        book_index.add_many(
+            (book_id, name, author)
+            for (author, name, _), book_id in book_ids.items()
+        )
+        added = [
+            {'index': index, 'book_id': book_ids[key]}
+            for key, index in pending.items()
+        ]
+        conflicts = [
+            {'index': index, 'error_text': ErrorMessages.BOOK_ALREADY_EXISTS}
+            for index in sorted(conflicted)
+        ]
+        return added, conflicts
+
+    @staticmethod
+    @batch.prefetched('book')
+    def _load_book(book_id: int) -> Optional[dict]:
+        book = mdl.db.session.execute(book_by_id(book_id)).one_or_none()
+        return None if book is None else dict(book._mapping)
+
+    @staticmethod
+    @async_db.offload(AsyncBookStoreController.get_book)
+    @replicas.read()
+    @single_flight.coalesce
     def get_book(book_id: int):
-        book = mdl.Book.query.filter_by(id=book_id).one_or_none()
+        book = entity_cache.get_or_load(
+            'book', book_id, BookStoreController._load_book
+        )
         if book is None:
             raise BookStoreException(
                 code=HttpStatus.HTTP_404_NOT_FOUND,
@@ -91,10 +361,83 @@ class BookStoreController:
         return book
 
     @staticmethod
-    def get_books():
-        books = mdl.Book.query.all()
-        return books
+    @replicas.read()
+    def get_books(
+            limit: int = MAX_ROWS,
+            offset: int = 0,
+            cursor: Optional[str] = None,
+            author: Optional[str] = None,
+            released_from: Optional[date] = None,
+            released_to: Optional[date] = None,
+            sort: str = 'id',
+            with_total: bool = False,
+    ) -> Page:
+        query = mdl.Book.query
+        if author is not None:
+            query = query.filter(mdl.Book.author == author)
+        if released_from is not None:
+            query = query.filter(
+                mdl.Book.release_date >= datetime.combine(released_from, time())
+            )
+        if released_to is not None:
+            query = query.filter(
+                mdl.Book.release_date
+                < datetime.combine(released_to + timedelta(days=1), time())
+            )
+        columns = (mdl.Book.id,)
+        if sort != 'id':
+            columns = (getattr(mdl.Book, sort), mdl.Book.id)
+        page = paginate(
+            query,
+            columns=columns,
+            limit=limit,
+            offset=offset,
+            cursor=cursor,
+            descending=False,
+        )
+        if not with_total:
+            return page
+        filters = (author, released_from, released_to)
+        if not any(filters):
+            return page._replace(total=totals.get('book'))
+        return page._replace(total=totals.approximate.get(
+            ('book', *filters), query, versions.known_state(['book']),
+        ))
+
+
 
+    @staticmethod
+    @replicas.read()
+    def search_books(
+            q: str,
+            limit: int = MAX_ROWS,
+            offset: int = 0,
+            cursor: Optional[str] = None,
+            with_total: bool = False,
+    ) -> Page:
+        book_index.refresh()
+        after = decode_cursor(cursor, (int, int)) if cursor is not None else None
+        ranked = book_index.search(
+            q,
+            limit=limit + 1,
+            after=after,
+            offset=0 if after else offset,
+        )
+        next_cursor = None
+        if len(ranked) > limit:
+            ranked = ranked[:limit]
+            next_cursor = encode_cursor(ranked[-1])
+        books = {
+            book.id: book
+            for book in mdl.Book.query.filter(
+                mdl.Book.id.in_([book_id for _, book_id in ranked])
+            )
+        } if ranked else {}
+        return Page(
+            [books[book_id] for _, book_id in ranked if book_id in books],
+            next_cursor,
+            book_index.count(q) if with_total else None,
+        )
 
 
     @staticmethod
@@ -105,19 +448,51 @@ class BookStoreController:
             address = address,
         )
         mdl.db.session.add(shop)
+        totals.add({'shop': 1})
         mdl.db.session.commit()
+        entity_cache.prime('shop', shop.id, {
+            'id': shop.id,
+            'name': shop.name,
+            'address': shop.address,
+        })
         return shop.id
 
 
     @staticmethod
-    def get_shops():
-        shops = mdl.Shop.query.all()
-        return shops
+    @replicas.read()
+    def get_shops(
+            limit: int = MAX_ROWS,
+            offset: int = 0,
+            cursor: Optional[str] = None,
+            with_total: bool = False,
+    ) -> Page:
+        page = paginate(
+            mdl.Shop.query,
+            columns=(mdl.Shop.id,),
+            limit=limit,
+            offset=offset,
+            cursor=cursor,
+            descending=False,
+        )
+        if with_total:
+            page = page._replace(total=totals.get('shop'))
+        return page
 
     
     @staticmethod
+    @batch.prefetched('shop')
+    def _load_shop(shop_id: int) -> Optional[dict]:
+        shop = mdl.db.session.execute(shop_by_id(shop_id)).one_or_none()
+        return None if shop is None else dict(shop._mapping)
+
+    @staticmethod
+    @async_db.offload(AsyncBookStoreController.get_shop)
+    @replicas.read()
+    @single_flight.coalesce
     def get_shop(shop_id: int):
-        shop = mdl.Shop.query.filter_by(id=shop_id).one_or_none()
+        shop = entity_cache.get_or_load(
+            'shop', shop_id, BookStoreController._load_shop
+        )
         if shop is None:
             raise BookStoreException(
                 code=HttpStatus.HTTP_404_NOT_FOUND,
@@ -135,21 +510,28 @@ class BookStoreController:
                 email=email,
             )
         mdl.db.session.add(user)
+        totals.add({'user': 1})
         mdl.db.session.commit()
+        entity_cache.prime('user', user.id, {
+            'first_name': user.first_name,
+            'last_name': user.last_name,
+            'email': user.email,
+        })
         return user.id
 
+    @staticmethod
+    @batch.prefetched('user')
+    def _load_user(user_id: int) -> Optional[User]:
+        user = mdl.db.session.execute(user_by_id(user_id)).one_or_none()
+        return None if user is None else dict(user._mapping)
 
     @staticmethod
+    @async_db.offload(AsyncBookStoreController.get_user)
+    @replicas.read(key=_user_key)
+    @single_flight.coalesce
     def get_user(user_id: int) -> User:
-        user = (
-            mdl.User.query
-                .filter_by(id=user_id)
-                .with_entities(
-                    mdl.User.first_name,
-                    mdl.User.last_name,
-                    mdl.User.email,
-                )
-                .one_or_none()
+        user = entity_cache.get_or_load(
+            'user', user_id, BookStoreController._load_user
         )
         if user is None:
             raise BookStoreException(
@@ -160,8 +542,15 @@ class BookStoreController:
 
 
     @staticmethod
-    def get_users() -> List[User]:
-        users = (
+    @replicas.read()
+    @single_flight.coalesce
+    def get_users(
+            limit: int = MAX_ROWS,
+            offset: int = 0,
+            cursor: Optional[str] = None,
+            with_total: bool = False,
+    ) -> Page:
+        query = (
             mdl.User.query
                 .with_entities(
                 mdl.User.first_name,
@@ -169,97 +558,288 @@ class BookStoreController:
                 mdl.User.email,
                 mdl.User.id,
             )
-                .all()
         )
-        return [
-            {
-                'first_name': user.first_name,
-                'last_name': user.last_name,
-                'email': user.email,
-                'id': user.id,
-            }
-            for user in users
-        ]
+        users = paginate(
+            query,
+            columns=(mdl.User.id,),
+            limit=limit,
+            offset=offset,
+            cursor=cursor,
+            descending=False,
+        )
+        return Page(
+            [
+                {
+                    'first_name': user.first_name,
+                    'last_name': user.last_name,
+                    'email': user.email,
+                    'id': user.id,
+                }
+                for user in users.items
+            ],
+            users.next_cursor,
+            totals.get('user') if with_total else None,
+        )
 
     @staticmethod
-    def get_orders(user_id: int, limit: int=0, offset: int=MAX_ROWS) -> List[Order]:
-        orders = (
-            mdl.Order.query
-                .filter_by(user_id=user_id)
-                .with_entities(
-                    mdl.Order.id,
-                    mdl.Order.reg_date,
+    @replicas.read(key=_user_key)
+    @single_flight.coalesce
+    def get_orders(
+            user_id: int,
+            limit: int = MAX_ROWS,
+            offset: int = 0,
+            cursor: Optional[str] = None,
+            with_total: bool = False,
+    ) -> Page:
+        page = paginate_parts(
+            [
+                (
+                    mdl.db.session.query(orders.id, orders.reg_date)
+                        .filter(orders.user_id == user_id),
+                    (orders.reg_date, orders.id),
                 )
-                .order_by(desc(mdl.Order.reg_date))
-                .limit(limit)
-                .offset(offset)
-                .all()
+                for orders, _ in archive.ORDER_TABLES
+            ],
+            limit=limit,
+            offset=offset,
+            cursor=cursor,
         )
-        return orders
+        if with_total:
+            page = page._replace(total=totals.get(versions.orders_key(user_id)))
+        return page
 
     @staticmethod
-    def get_order_items(order_id: int, limit: int=0, offset: int=MAX_ROWS) -> List[OrderItem]:
-        order_items = (
-            mdl.OrderItem.query
-                .join(
-                    mdl.Book, mdl.Book.id == mdl.OrderItem.book_id
-                ).join(
-                    mdl.Shop, mdl.Shop.id == mdl.OrderItem.shop_id
-                )
-                .filter(mdl.OrderItem.order_id==order_id)
-                .order_by(
-                    desc(mdl.OrderItem.shop_id),
-                    desc(mdl.OrderItem.book_id),
-                )
-                .limit(limit)
-                .offset(offset)
-                .with_entities(
-                    mdl.Shop.name.label('shop_name'),
-                    mdl.Shop.address,
-                    mdl.Book.name.label('book_name'),
-                    mdl.Book.author,
-                    mdl.Book.release_date,
-                    mdl.OrderItem.book_quantity,
-                )
-                .all()
-        )
-        if not order_items:
+    @replicas.read(key=_order_key)
+    @single_flight.coalesce
+    def get_order_items(
+            order_id: int,
+            limit: int = MAX_ROWS,
+            offset: int = 0,
+            cursor: Optional[str] = None,
+            with_total: bool = False,
+    ) -> Page:
+        # Заказ целиком лежит либо в горячей таблице, либо в архиве.
+        for _, items in archive.ORDER_TABLES:
+            query = (
+                mdl.db.session.query(items)
+                    .join(
+                        mdl.Book, mdl.Book.id == items.book_id
+                    ).join(
+                        mdl.Shop, mdl.Shop.id == items.shop_id
+                    )
+                    .filter(items.order_id==order_id)
+                    .with_entities(
+                        mdl.Shop.name.label('shop_name'),
+                        mdl.Shop.address,
+                        mdl.Book.name.label('book_name'),
+                        mdl.Book.author,
+                        mdl.Book.release_date,
+                        items.book_quantity,
+                        items.shop_id,
+                        items.book_id,
+                        items.id,
+                    )
+            )
+            page = paginate(
+                query,
+                columns=(
+                    items.shop_id,
+                    items.book_id,
+                    items.id,
+                ),
+                limit=limit,
+                offset=offset,
+                cursor=cursor,
+            )
+            if page.items:
+                break
+        if not page.items:
             raise BookStoreException(
                 code=HttpStatus.HTTP_404_NOT_FOUND,
                 error_text=ErrorMessages.ORDER_EMPTY_OR_NOT_FOUND.format(order_id),
             )
-        return order_items
+        if with_total:
+            page = page._replace(total=totals.get(totals.order_items_key(order_id)))
+        return page
+
+    @staticmethod
+    def _existing_ids(
+            user_id: int,
+            book_ids: Iterable[int],
+            shop_ids: Iterable[int],
+    ) -> Dict[str, set]:
+        query = union_all(
+            select(literal('user'), mdl.User.id).where(mdl.User.id == user_id),
+            select(literal('book'), mdl.Book.id).where(mdl.Book.id.in_(book_ids)),
+            select(literal('shop'), mdl.Shop.id).where(mdl.Shop.id.in_(shop_ids)),
+        )
+        existing = {'user': set(), 'book': set(), 'shop': set()}
+        for kind, entity_id in mdl.db.session.execute(query):
+            existing[kind].add(entity_id)
+        return existing
+
+    @staticmethod
+    def _reserve_stock(
+            order_items: List[OrderItem],
+            quantities: Dict[tuple, int],
+    ) -> None:
+        missing = inventory.reserve({
+            (shop_id, book_id): book_quantity
+            for (book_id, shop_id), book_quantity in quantities.items()
+        })
+        if not missing:
+            return
+        shop_id, book_id = missing[0]
+        missing = set(missing)
+        raise BookStoreException(
+            code=HttpStatus.HTTP_409_CONFLICT,
+            error_text=ErrorMessages.NOT_ENOUGH_STOCK.format(book_id, shop_id),
+            error_fields=[{'order_items': {
+                str(index): {'book_quantity': [
+                    ErrorMessages.NOT_ENOUGH_STOCK.format(item['book_id'], item['shop_id'])
+                ]}
+                for index, item in enumerate(order_items)
+                if (item['shop_id'], item['book_id']) in missing
+            }}],
+        )
+
+    @staticmethod
+    def set_stock(shop_id: int, book_id: int, quantity: int, shards: int = 1) -> dict:
+        BookStoreController.get_shop(shop_id)
+        BookStoreController.get_book(book_id)
+        inventory.set_stock(shop_id, book_id, quantity, shards)
+        return {'shop_id': shop_id, 'book_id': book_id, 'quantity': quantity}
+
+    @staticmethod
+    @async_db.offload(AsyncBookStoreController.get_stock)
+    @replicas.read()
+    @single_flight.coalesce
+    def get_stock(
+            shop_id: int,
+            limit: int = MAX_ROWS,
+            offset: int = 0,
+            cursor: Optional[str] = None,
+    ) -> Page:
+        BookStoreController.get_shop(shop_id)
+        return inventory.get_stock(shop_id, limit=limit, offset=offset, cursor=cursor)
+
+    @staticmethod
+    @async_db.offload(AsyncBookStoreController.get_book_stock)
+    @replicas.read()
+    @single_flight.coalesce
+    def get_book_stock(shop_id: int, book_id: int) -> dict:
+        BookStoreController.get_shop(shop_id)
+        BookStoreController.get_book(book_id)
+        return {
+            'shop_id': shop_id,
+            'book_id': book_id,
+            'quantity': inventory.get_book_stock(shop_id, book_id),
+        }
+
+    @staticmethod
+    @async_db.offload(AsyncBookStoreController.get_shop_sales)
+    @replicas.read()
+    @single_flight.coalesce
+    def get_shop_sales(
+            shop_id: int,
+            date_from: Optional[date] = None,
+            date_to: Optional[date] = None,
+    ) -> list:
+        BookStoreController.get_shop(shop_id)
+        date_from, date_to = _sales_range(date_from, date_to)
+        return sales.shop_sales(shop_id, date_from, date_to)
+
+    @staticmethod
+    @replicas.read()
+    @single_flight.coalesce
+    def get_top_books(days: int = TOP_BOOKS_DEFAULT_DAYS, limit: int = 10) -> list:
+        date_to = datetime.utcnow().date()
+        return sales.top_books(date_to - timedelta(days=days - 1), date_to, limit)
+
+    @staticmethod
+    @handle_integrity_error(ErrorMessages.CAN_NOT_ADD_ORDER)
+    def add_order(user_id: int, order_items: List[OrderItem]) -> int:
+        if group_commit.enabled:
+            order_id = group_commit.run(
+                BookStoreController._place_order, user_id, order_items,
+            )
+        else:
+            try:
+                order_id = BookStoreController._place_order(user_id, order_items)
+            except BookStoreException:
+                mdl.db.session.rollback()
+                raise
+            mdl.db.session.commit()
+        replicas.mark_written(_user_key(user_id))
+        replicas.mark_written(_order_key(order_id))
+        return order_id
 
     @staticmethod
     @handle_integrity_error(ErrorMessages.CAN_NOT_ADD_ORDER)
-    def add_order(user_id: int, order_items: List[OrderItem]) -> None:
-        order = mdl.Order(
-            reg_date = datetime.utcnow().date(),
-            user_id = user_id,
+    def _place_order(user_id: int, order_items: List[OrderItem]) -> int:
+        """Записывает заказ в текущую транзакцию, не фиксируя её."""
+        quantities = {}
+        for item in order_items:
+            key = (item['book_id'], item['shop_id'])
+            quantities[key] = quantities.get(key, 0) + item['book_quantity']
+
+        existing = BookStoreController._existing_ids(
+            user_id,
+            {book_id for book_id, _ in quantities},
+            {shop_id for _, shop_id in quantities},
         )
-        try:
-            mdl.db.session.add(order)
-        except IntegrityError as error:
+        if user_id not in existing['user']:
+            raise BookStoreException(
+                code=HttpStatus.HTTP_404_NOT_FOUND,
+                error_text=ErrorMessages.USER_NOT_FOUND.format(user_id),
+            )
+
+        invalid_items = {}
+        for index, item in enumerate(order_items):
+            errors = {}
+            if item['book_id'] not in existing['book']:
+                errors['book_id'] = [ErrorMessages.BOOK_NOT_FOUND.format(item['book_id'])]
+            if item['shop_id'] not in existing['shop']:
+                errors['shop_id'] = [ErrorMessages.SHOP_NOT_FOUND.format(item['shop_id'])]
+            if errors:
+                invalid_items[str(index)] = errors
+        if invalid_items:
             raise BookStoreException(
                 code=HttpStatus.HTTP_400_BAD_REQUEST,
-                error_text=str(error)
+                error_text=ErrorMessages.ORDER_HAS_INVALID_ITEMS,
+                error_fields=[{'order_items': invalid_items}],
             )
 
-        mdl.db.session.flush()
+        if current_app.config.get('RESERVE_STOCK', True):
+            BookStoreController._reserve_stock(order_items, quantities)
 
-        mdl.db.session.bulk_save_objects(
-            [
-                mdl.OrderItem(
-                    order_id=order.id,
-                    book_quantity=item['book_quantity'],
-                    book_id=item['book_id'],
-                    shop_id=item['shop_id'],
-                )
-                for item in order_items
-            ]
-        )
-        mdl.db.session.commit()
-        return order.id
+        reg_date = datetime.utcnow().date()
+        order_id = mdl.db.session.execute(
+            insert(mdl.Order).values(
+                reg_date=reg_date,
+                user_id=user_id,
+            )
+        ).inserted_primary_key[0]
+        sales.record_order(reg_date, quantities)
+        rows = [
+            {
+                'order_id': order_id,
+                'book_id': book_id,
+                'shop_id': shop_id,
+                'book_quantity': book_quantity,
+            }
+            for (book_id, shop_id), book_quantity in quantities.items()
+        ]
+        for start in range(0, len(rows), BULK_CHUNK_SIZE):
+            mdl.db.session.execute(
+                insert(mdl.OrderItem).values(rows[start:start + BULK_CHUNK_SIZE])
+            )
+        totals.add({
+            versions.orders_key(user_id): 1,
+            totals.order_items_key(order_id): len(rows),
+        })
+        versions.bump([versions.orders_key(user_id)])
+        return order_id
 
 
 @doc(description='Получить список ручек')
@@ -272,6 +852,7 @@ def get_index():
 
 @doc(description='Добавить юзера')
 @shop_bp.route('/users', methods=['POST'])
+@query_budget(3)
 @use_kwargs(schemas.User())
 @marshal_with(schemas.AddUserResponse, code=constants.HttpStatus.HTTP_200_OK)
 def add_user(first_name: str, last_name: str, email: str):
@@ -284,6 +865,7 @@ def add_user(first_name: str, last_name: str, email: str):
 
 @doc(description='Получить данные юзера')
 @shop_bp.route('/users/<int:user_id>', methods=['GET'])
+@query_budget(1)
 @marshal_with(schemas.UserResponse())
 def get_user(user_id: int):
     return BookStoreController.get_user(user_id)
@@ -291,42 +873,68 @@ def get_user(user_id: int):
 
 @doc(description='Получить список юзеров')
 @shop_bp.route('/users', methods=['GET'])
+@query_budget(lambda **_: 1 + _requested('with_total'))
+@use_kwargs(schemas.CountedLimitOffset())
 @marshal_with(schemas.UsersResponse())
-def get_users():
-    return {'users': BookStoreController.get_users()}
+def get_users(limit: int, offset: int, cursor: Optional[str], with_total: bool):
+    page = BookStoreController.get_users(
+        limit=limit,
+        offset=offset,
+        cursor=cursor,
+        with_total=with_total,
+    )
+    return _listing('users', page)
 
 
 @doc(description='Получить заказы юзера')
 @shop_bp.route('/users/<int:user_id>/orders', methods=['GET'])
-@use_kwargs(schemas.LimitOffset())
+@query_budget(lambda **_: 3 + _requested('with_total') + _requested('offset'))
+@replicas.read(key=_user_key)
+@versions.conditional(lambda user_id: [versions.orders_key(user_id)])
+@use_kwargs(schemas.CountedLimitOffset())
 @marshal_with(schemas.OrdersResponse)
-def get_user_orders(user_id: int, limit: int, offset: int):
-    return {
-        'orders': BookStoreController.get_orders(
-            user_id=user_id, 
-            limit=limit, 
-            offset=offset,
-            )
-        }
+def get_user_orders(
+        user_id: int,
+        limit: int,
+        offset: int,
+        cursor: Optional[str],
+        with_total: bool,
+):
+    page = BookStoreController.get_orders(
+        user_id=user_id, 
+        limit=limit, 
+        offset=offset,
+        cursor=cursor,
+        with_total=with_total,
+        )
+    return _listing('orders', page)
 
 
 @doc(description='Получение данных определенного заказа')
 @shop_bp.route('/orders/<int:order_id>', methods=['GET'])
-@use_kwargs(schemas.LimitOffset())
+@query_budget(lambda **_: 2 + _requested('with_total'))
+@use_kwargs(schemas.CountedLimitOffset())
 @marshal_with(schemas.OrderResponse)
-def get_order_details(order_id: int, limit: int, offset: int):
-    return {
-        'order_id': order_id,
-        'order_items': BookStoreController.get_order_items(
-            order_id=order_id, 
-            limit=limit, 
-            offset=offset,
-        )
-    }
+def get_order_details(
+        order_id: int,
+        limit: int,
+        offset: int,
+        cursor: Optional[str],
+        with_total: bool,
+):
+    page = BookStoreController.get_order_items(
+        order_id=order_id, 
+        limit=limit, 
+        offset=offset,
+        cursor=cursor,
+        with_total=with_total,
+    )
+    return _listing('order_items', page, order_id=order_id)
 
 
 @doc(description='Добавление нового заказа')
 @shop_bp.route('/users/<int:user_id>/orders', methods=['POST'])
+@query_budget(lambda **_: _order_budget())
 @use_kwargs(schemas.AddOrderRequest())
 @marshal_with(schemas.AddOrderResponse)
 def add_order(user_id: int, order_items: List[OrderItem]):
@@ -340,6 +948,7 @@ def add_order(user_id: int, order_items: List[OrderItem]):
 
 @doc(description='Добавление нового магазина')
 @shop_bp.route('/shops', methods=['POST'])
+@query_budget(4)
 @use_kwargs(schemas.ShopRequest())
 @marshal_with(schemas.ShopResponse)
 def add_shop(name: str, address: str):
@@ -348,22 +957,95 @@ def add_shop(name: str, address: str):
 
 @doc(description='Просмотреть все магазины')
 @shop_bp.route('/shops', methods=['GET'])
+@query_budget(lambda **_: 2 + _requested('with_total'))
+@replicas.read()
+@versions.conditional(lambda: ['shop'])
+@snapshots.cached(lambda: ['shop'])
+@use_kwargs(schemas.CountedLimitOffset())
 @marshal_with(schemas.ShopsResponse)
-def get_shops():
-    return {'shops': BookStoreController.get_shops()}
+def get_shops(limit: int, offset: int, cursor: Optional[str], with_total: bool):
+    page = BookStoreController.get_shops(
+        limit=limit,
+        offset=offset,
+        cursor=cursor,
+        with_total=with_total,
+    )
+    return _listing('shops', page)
 
 
 
 @doc(description='Просмотреть магазин')
 @shop_bp.route('/shops/<int:shop_id>', methods=['GET'])
+@query_budget(2)
+@replicas.read()
+@versions.conditional(lambda shop_id: ['shop'])
 @marshal_with(schemas.ShopResponse)
 def get_shop(shop_id: int):
     return BookStoreController.get_shop(shop_id)
 
 
 
+@doc(description='Остатки книг в магазине')
+@shop_bp.route('/shops/<int:shop_id>/stock', methods=['GET'])
+@query_budget(2)
+@use_kwargs(schemas.LimitOffset())
+@marshal_with(schemas.ShopStockResponse)
+def get_shop_stock(shop_id: int, limit: int, offset: int, cursor: Optional[str]):
+    page = BookStoreController.get_stock(
+        shop_id=shop_id,
+        limit=limit,
+        offset=offset,
+        cursor=cursor,
+    )
+    return {
+        'shop_id': shop_id,
+        'stock': page.items,
+        'next_cursor': page.next_cursor,
+    }
+
+
+@doc(description='Остаток книги в магазине')
+@shop_bp.route('/shops/<int:shop_id>/stock/<int:book_id>', methods=['GET'])
+@query_budget(3)
+@marshal_with(schemas.StockResponse)
+def get_book_stock(shop_id: int, book_id: int):
+    return BookStoreController.get_book_stock(shop_id=shop_id, book_id=book_id)
+
+
+@doc(description='Установить остаток книги в магазине')
+@shop_bp.route('/shops/<int:shop_id>/stock/<int:book_id>', methods=['PUT'])
+@query_budget(4)
+@use_kwargs(schemas.StockRequest())
+@marshal_with(schemas.StockResponse)
+def set_book_stock(shop_id: int, book_id: int, quantity: int, shards: int):
+    return BookStoreController.set_stock(
+        shop_id=shop_id,
+        book_id=book_id,
+        quantity=quantity,
+        shards=shards,
+    )
+
+
+
+@doc(description='Продажи магазина по дням')
+@shop_bp.route('/shops/<int:shop_id>/sales', methods=['GET'])
+@query_budget(2)
+@use_kwargs(schemas.SalesRequest())
+@marshal_with(schemas.ShopSalesResponse)
+def get_shop_sales(shop_id: int, date_from: Optional[date], date_to: Optional[date]):
+    return {
+        'shop_id': shop_id,
+        'sales': BookStoreController.get_shop_sales(
+            shop_id=shop_id,
+            date_from=date_from,
+            date_to=date_to,
+        ),
+    }
+
+
 @doc(description='Добавление новой книги')
 @shop_bp.route('/books', methods=['POST'])
+@query_budget(4)
 @use_kwargs(schemas.BookRequest())
 @marshal_with(schemas.AddBookResponse)
 def add_book(author: str, name: str, release_date: str):
@@ -376,8 +1058,46 @@ def add_book(author: str, name: str, release_date: str):
     }
 
 
+@doc(description='Массовое добавление книг')
+@shop_bp.route('/books/bulk', methods=['POST'])
+@query_budget(lambda **_: 5 * -(-_request_rows('books') // BULK_CHUNK_SIZE))
+@use_kwargs(schemas.AddBooksRequest())
+@marshal_with(schemas.AddBooksResponse)
+def add_books(books: List[Book]):
+    added, conflicts = BookStoreController.add_books(books)
+    return {'books': added, 'conflicts': conflicts}
+
+
+@doc(description='Поиск книг по названию и автору')
+@shop_bp.route('/books/search', methods=['GET'])
+@query_budget(SEARCH_QUERIES)
+@use_kwargs(schemas.BookSearchRequest())
+@marshal_with(schemas.BooksResponse)
+def search_books(q: str, limit: int, offset: int, cursor: Optional[str], with_total: bool):
+    page = BookStoreController.search_books(
+        q=q,
+        limit=limit,
+        offset=offset,
+        cursor=cursor,
+        with_total=with_total,
+    )
+    return _listing('books', page)
+
+
+@doc(description='Самые продаваемые книги за период')
+@shop_bp.route('/books/top', methods=['GET'])
+@query_budget(1)
+@use_kwargs(schemas.TopBooksRequest())
+@marshal_with(schemas.TopBooksResponse)
+def get_top_books(days: int, limit: int):
+    return {'books': BookStoreController.get_top_books(days=days, limit=limit)}
+
+
 @doc(description='Просмотр книги')
 @shop_bp.route('/books/<int:book_id>', methods=['GET'])
+@query_budget(2)
+@replicas.read()
+@versions.conditional(lambda book_id: ['book'])
 @marshal_with(schemas.BookResponse)
 def get_book(book_id: int):
     return BookStoreController.get_book(book_id)
@@ -385,6 +1105,39 @@ def get_book(book_id: int):
 
 @doc(description='Просмотр всех книг')
 @shop_bp.route('/books', methods=['GET'])
+@query_budget(lambda **_: 2 + _requested('with_total'))
+@replicas.read()
+@versions.conditional(lambda: ['book'])
+@snapshots.cached(lambda: ['book'])
+@use_kwargs(schemas.BooksRequest())
 @marshal_with(schemas.BooksResponse)
-def get_books():
-    return {'books': BookStoreController.get_books()}
\ No newline at end of file
+def get_books(
+        limit: int,
+        offset: int,
+        cursor: Optional[str],
+        author: Optional[str],
+        released_from: Optional[date],
+        released_to: Optional[date],
+        sort: str,
+        with_total: bool,
+):
+    page = BookStoreController.get_books(
+        limit=limit,
+        offset=offset,
+        cursor=cursor,
+        author=author,
+        released_from=released_from,
+        released_to=released_to,
+        sort=sort,
+        with_total=with_total,
+    )
+    return _listing('books', page)
+
+
+@doc(description='Выполнить несколько запросов к магазину за один вызов')
+@shop_bp.route('/batch', methods=['POST'])
+@query_budget(lambda **_: batch.budget())
+@use_kwargs(schemas.BatchRequest())
+@marshal_with(schemas.BatchResponse)
+def run_batch(requests: List[dict]):
+    return {'responses': batch.run(requests)}
@@ -0,0 +1,15 @@
+import sys
+
+from app import archive
+from app.base import create_app
+from app.constants import BULK_CHUNK_SIZE
+
+
+if __name__ == '__main__':
+    app = create_app()
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else app.config.get('ARCHIVE_AFTER_DAYS', 365)
+    chunk_size = int(sys.argv[2]) if len(sys.argv) > 2 else BULK_CHUNK_SIZE
+    before = archive.horizon(days)
+    with app.app_context():
+        total = archive.archive(before, chunk_size=chunk_size, log=app.logger.info)
+    print(f'Archived {total} orders placed before {before.date()}')
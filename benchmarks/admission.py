@@ -0,0 +1,96 @@
+"""Перегрузка маленького пула соединений с контролем допуска и без него.
+
+    python -m benchmarks.admission --threads 64 --requests 5000
+
+Заполняет файл SQLite и гоняет смесь запросов из benchmarks.endpoints
+через пул из --pool соединений без переполнения, сначала без контроля
+допуска, затем с ADMISSION_CONTROL и лимитами по классам ручек. Печатает
+обе таблицы и сколько запросов отклонено сразу (503), а сколько упало,
+не дождавшись соединения. Отказы вложенных запросов /store/batch
+печатаются отдельно: пакет всё равно отвечает 200. Лимит на клиента отключён: все потоки
+приходят с одного адреса.
+"""
+import os
+import sys
+import tempfile
+import threading
+
+from app import models as mdl, sales, totals
+from app.admission import admission
+from benchmarks.endpoints import SCENARIOS, drive, make_app, parse_args, print_table
+from benchmarks.seed import Volumes, seed
+
+
+def count_rejected(app) -> list:
+    """Счётчик ответов 503 на запросы верхнего уровня; вложенные запросы
+    пакета через after_request не проходят."""
+    rejected = [0]
+    lock = threading.Lock()
+
+    @app.after_request
+    def count(response):
+        if response.status_code == 503:
+            with lock:
+                rejected[0] += 1
+        return response
+
+    return rejected
+
+
+def run(args, pool: int = 4) -> int:
+    volumes = Volumes(
+        users=args.users,
+        books=args.books,
+        shops=args.shops,
+        orders=args.orders,
+        items_per_order=args.items_per_order,
+        stocked_books=min(args.stocked_books, args.books),
+    )
+    scenarios = [scenario for scenario in SCENARIOS if scenario.endpoint != 'shop.get_index']
+    fd, path = tempfile.mkstemp(suffix='.sqlite')
+    os.close(fd)
+    try:
+        app = make_app(args, path)
+        with app.app_context():
+            mdl.db.create_all()
+            seed(volumes, random_seed=args.seed)
+            sales.rebuild(log=lambda message: None)
+            totals.rebuild(log=lambda message: None)
+
+        failed = 0
+        for mode, enabled in (('open', False), ('admission', True)):
+            app = make_app(
+                args, path,
+                SQLALCHEMY_ENGINE_OPTIONS={
+                    'pool_size': pool,
+                    'max_overflow': 0,
+                    'pool_timeout': 1,
+                    'connect_args': {'timeout': 60},
+                },
+                ENTITY_CACHE_ENABLED=False,
+                SNAPSHOTS_ENABLED=False,
+                ADMISSION_CONTROL=enabled,
+                ADMISSION_CLIENT_RATE=10 ** 9,
+                ADMISSION_CLIENT_BURST=10 ** 9,
+                ADMISSION_CONCURRENCY={'read': pool, 'write': 1, 'order': 1},
+            )
+            rejected = count_rejected(app)
+            result = drive(app, scenarios, volumes, args)
+            errors = result['total'].get('errors', 0)
+            print(f'{mode}: {args.requests} requests, {args.threads} threads, pool {pool}')
+            print_table(result)
+            print(
+                f'shed: {rejected[0]}, in batches: {admission.shed - rejected[0]},'
+                f' failed: {errors - rejected[0]}'
+            )
+            print()
+            if enabled:
+                failed = errors - rejected[0]
+        return 1 if failed else 0
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    args = parse_args(sys.argv[1:] or ['--threads', '64'])
+    sys.exit(run(args))
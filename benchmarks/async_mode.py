@@ -0,0 +1,85 @@
+"""Сравнение синхронных чтений и ASYNC_PARALLEL_READS при большом числе клиентов.
+
+    python -m benchmarks.async_mode --threads 64 --requests 5000
+
+Заполняет файл SQLite, затем одним и тем же набором запросов гоняет
+ручки, у которых есть асинхронный вариант (AsyncBookStoreController),
+сначала синхронно, потом через цикл app.aio, и печатает обе таблицы и отношение
+пропускной способности и p95. Кэш сущностей выключен, чтобы запросы
+доходили до базы.
+"""
+import os
+import sys
+import tempfile
+
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app import models as mdl, sales, totals
+from benchmarks.endpoints import SCENARIOS, drive, make_app, parse_args, print_table
+from benchmarks.seed import Volumes, seed
+
+
+ASYNC_ENDPOINTS = (
+    'shop.get_book',
+    'shop.get_shop',
+    'shop.get_user',
+    'shop.get_shop_stock',
+    'shop.get_book_stock',
+    'shop.get_shop_sales',
+)
+
+
+def run(args) -> int:
+    volumes = Volumes(
+        users=args.users,
+        books=args.books,
+        shops=args.shops,
+        orders=args.orders,
+        items_per_order=args.items_per_order,
+        stocked_books=min(args.stocked_books, args.books),
+    )
+    scenarios = [scenario for scenario in SCENARIOS if scenario.endpoint in ASYNC_ENDPOINTS]
+    fd, path = tempfile.mkstemp(suffix='.sqlite')
+    os.close(fd)
+    try:
+        app = make_app(args, path)
+        with app.app_context():
+            mdl.db.create_all()
+            seed(volumes, random_seed=args.seed)
+            sales.rebuild(log=lambda message: None)
+            totals.rebuild(log=lambda message: None)
+
+        results = {}
+        for mode, async_mode in (('sync', False), ('async', True)):
+            app = make_app(
+                args, path,
+                ASYNC_PARALLEL_READS=async_mode,
+                ASYNC_ENGINE_OPTIONS={
+                    'poolclass': AsyncAdaptedQueuePool,
+                    'pool_size': args.threads,
+                },
+                ENTITY_CACHE_ENABLED=False,
+            )
+            results[mode] = drive(app, scenarios, volumes, args)
+            print(f'{mode}: {args.requests} requests, {args.threads} threads')
+            print_table(results[mode])
+            print()
+
+        print(f'{"endpoint":28} {"rps x":>8} {"p95 x":>8}')
+        for endpoint, stats in results['async']['endpoints'].items():
+            base = results['sync']['endpoints'].get(endpoint)
+            if not base or not base.get('count') or not stats.get('count'):
+                continue
+            print(
+                f'{endpoint:28} {stats["rps"] / base["rps"]:8.2f}'
+                f' {stats["p95_ms"] / base["p95_ms"]:8.2f}'
+            )
+        errors = sum(result['total'].get('errors', 0) for result in results.values())
+        return 1 if errors else 0
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    args = parse_args(sys.argv[1:] or ['--threads', '64'])
+    sys.exit(run(args))
@@ -0,0 +1,230 @@
+"""Потоковая загрузка из файлов (load_data.py) с прерыванием и продолжением.
+
+    python -m benchmarks.bulk_load --users 20000 --books 100000 --orders 50000
+
+Пишет во временный каталог пользователей (CSV), магазины (NDJSON), книги
+(CSV.gz), заказы (NDJSON) и строки заказов (CSV) и загружает их в файл
+SQLite через app.loader. Одна запись посередине строк заказов испорчена:
+первая загрузка должна на ней остановиться, а повторная после исправления
+файла продолжить без повторов. Затем все файлы загружаются ещё раз в
+пустую базу с rebuild_indexes. Печатает строки в секунду и завершается с кодом 1, если
+число строк, счётчики app.totals или сводки продаж, которые загрузчик
+ведёт по порциям, не сходятся с полным пересчётом app.sales.rebuild.
+"""
+import argparse
+import csv
+import gzip
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import func
+
+from app import loader, models as mdl, sales, totals, versions
+from app.base import create_app
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--shops', type=int, default=50)
+    parser.add_argument('--books', type=int, default=100000)
+    parser.add_argument('--orders', type=int, default=50000)
+    parser.add_argument('--items-per-order', type=int, default=3)
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def write_csv(path: str, header: list, rows) -> None:
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'wt', encoding='utf-8', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+
+def write_ndjson(path: str, records) -> None:
+    with open(path, 'w', encoding='utf-8') as file:
+        for record in records:
+            file.write(json.dumps(record) + '\n')
+
+
+def broken_record(args) -> int:
+    return args.orders * args.items_per_order // 2
+
+
+def write_items(path: str, args, broken: bool) -> None:
+    rng = random.Random(args.seed)
+    write_csv(path, ['order_id', 'book_id', 'shop_id', 'book_quantity'], (
+        (
+            order_id,
+            rng.randint(1, args.books),
+            rng.randint(1, args.shops),
+            'many' if broken and index == broken_record(args) else rng.randint(1, 3),
+        )
+        for index, (order_id, _) in enumerate(
+            (order_id, item)
+            for order_id in range(1, args.orders + 1)
+            for item in range(args.items_per_order)
+        )
+    ))
+
+
+def write_files(directory: str, args) -> dict:
+    rng = random.Random(args.seed)
+    paths = {
+        'users': os.path.join(directory, 'users.csv'),
+        'shops': os.path.join(directory, 'shops.ndjson'),
+        'books': os.path.join(directory, 'books.csv.gz'),
+        'orders': os.path.join(directory, 'orders.ndjson'),
+        'order_items': os.path.join(directory, 'order_items.csv'),
+    }
+    write_csv(paths['users'], ['first_name', 'last_name', 'email'], (
+        (f'first {i}', f'last {i}', f'user{i}@mail') for i in range(args.users)
+    ))
+    write_ndjson(paths['shops'], (
+        {'name': f'shop {i}', 'address': f'address {i}'} for i in range(args.shops)
+    ))
+    write_csv(paths['books'], ['name', 'author', 'release_date'], (
+        (f'book {i}', f'author {i % 1000}', date(1950 + i % 70, 1 + i % 12, 1).isoformat())
+        for i in range(args.books)
+    ))
+    today = datetime.utcnow().replace(microsecond=0)
+    write_ndjson(paths['orders'], (
+        {
+            'id': order_id,
+            'user_id': rng.randint(1, args.users),
+            'reg_date': (today - timedelta(days=rng.randint(0, 3 * 365))).isoformat(),
+        }
+        for order_id in range(1, args.orders + 1)
+    ))
+    write_items(paths['order_items'], args, broken=True)
+    return paths
+
+
+def make_app(path: str):
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}',
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'SNAPSHOT_BACKGROUND_REBUILD': False,
+    })
+    with app.app_context():
+        mdl.db.create_all()
+    return app
+
+
+def report(kind: str, result: loader.LoadReport) -> None:
+    print(
+        f'{kind:30} {result.loaded:8} {result.skipped:8}'
+        f' {result.seconds:8.2f} {result.rate:10.0f}'
+    )
+
+
+def check(args) -> list:
+    expected = {
+        mdl.User: args.users,
+        mdl.Shop: args.shops,
+        mdl.Book: args.books,
+        mdl.Order: args.orders,
+        mdl.OrderItem: args.orders * args.items_per_order,
+    }
+    problems = []
+    for model, count in expected.items():
+        actual = mdl.db.session.query(func.count(model.id)).scalar()
+        if actual != count:
+            problems.append(f'{model.__tablename__}: {actual} rows, expected {count}')
+    for key, model in totals.CATALOG.items():
+        if totals.get(key) != expected[model]:
+            problems.append(f'row count {key}: {totals.get(key)}, expected {expected[model]}')
+    for user_id, count in (
+            mdl.db.session.query(mdl.Order.user_id, func.count(mdl.Order.id))
+                .group_by(mdl.Order.user_id)
+                .limit(100)
+    ):
+        if totals.get(versions.orders_key(user_id)) != count:
+            problems.append(f'row count {versions.orders_key(user_id)} differs')
+    for order_id, count in (
+            mdl.db.session.query(mdl.OrderItem.order_id, func.count(mdl.OrderItem.id))
+                .group_by(mdl.OrderItem.order_id)
+                .limit(100)
+    ):
+        if totals.get(totals.order_items_key(order_id)) != count:
+            problems.append(f'row count {totals.order_items_key(order_id)} differs')
+    return problems
+
+
+def sales_totals() -> dict:
+    return {
+        'shop': set(
+            mdl.db.session.query(
+                mdl.ShopSales.shop_id, mdl.ShopSales.day,
+                func.sum(mdl.ShopSales.copies), func.sum(mdl.ShopSales.orders),
+            ).group_by(mdl.ShopSales.shop_id, mdl.ShopSales.day)
+        ),
+        'book': set(
+            mdl.db.session.query(
+                mdl.BookSales.book_id, mdl.BookSales.day, func.sum(mdl.BookSales.copies),
+            ).group_by(mdl.BookSales.book_id, mdl.BookSales.day)
+        ),
+    }
+
+
+def check_sales() -> list:
+    loaded = sales_totals()
+    sales.rebuild(log=lambda message: None)
+    rebuilt = sales_totals()
+    return [
+        f'{kind} sales differ from a full rebuild in {len(loaded[kind] ^ rebuilt[kind])} rows'
+        for kind in loaded
+        if loaded[kind] != rebuilt[kind]
+    ]
+
+
+def run(args) -> int:
+    directory = tempfile.mkdtemp()
+    quiet = dict(chunk_size=args.chunk_size, log=lambda message: None)
+    try:
+        paths = write_files(directory, args)
+        print(f'{"kind":30} {"loaded":>8} {"skipped":>8} {"seconds":>8} {"rows/s":>10}')
+
+        app = make_app(os.path.join(directory, 'store.sqlite'))
+        with app.app_context():
+            for kind in ('users', 'shops', 'books', 'orders'):
+                report(kind, loader.load(kind, paths[kind], **quiet))
+            try:
+                loader.load('order_items', paths['order_items'], **quiet)
+                print('order_items: broken record was accepted')
+                return 1
+            except ValueError as error:
+                print(f'interrupted: {error}')
+            write_items(paths['order_items'], args, broken=False)
+            resumed = loader.load('order_items', paths['order_items'], **quiet)
+            report('order_items (resumed)', resumed)
+            report('users (again)', loader.load('users', paths['users'], **quiet))
+            problems = check(args) + check_sales()
+            committed = broken_record(args) // args.chunk_size * args.chunk_size
+            if resumed.skipped != committed:
+                problems.append(f'resumed after {resumed.skipped} records, expected {committed}')
+
+        app = make_app(os.path.join(directory, 'indexes.sqlite'))
+        with app.app_context():
+            for kind in ('users', 'shops', 'books', 'orders', 'order_items'):
+                report(
+                    f'{kind} (rebuild indexes)',
+                    loader.load(kind, paths[kind], rebuild_indexes=True, **quiet),
+                )
+            problems += check(args)
+        for problem in problems:
+            print(problem)
+        return 1 if problems else 0
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    sys.exit(run(parse_args()))
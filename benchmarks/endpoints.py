@@ -0,0 +1,356 @@
+"""Нагрузочный прогон всех ручек shop_bp на синтетических данных.
+
+    python -m benchmarks.endpoints --orders 20000 --requests 5000 --output bench.json
+    python -m benchmarks.endpoints --output new.json --compare bench.json
+
+Заполняет SQLite (файл или память) данными заданного объёма, гоняет
+взвешенную смесь запросов через create_app() и печатает пропускную
+способность и p50/p95/p99 по каждой ручке. С --compare сравнивает с
+сохранённым прогоном и завершается с кодом 1 при регрессии.
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy.pool import StaticPool
+
+from app import models as mdl, sales, totals
+from app.base import create_app
+from benchmarks.seed import Volumes, seed
+
+
+Request = Tuple[str, str, Optional[dict]]
+
+
+class Scenario(NamedTuple):
+    endpoint: str
+    weight: int
+    make: Callable[[random.Random, Volumes], Request]
+
+
+_unique = itertools.count()
+
+
+def _book(rng: random.Random) -> dict:
+    return {
+        'name': f'bench book {next(_unique)}',
+        'author': f'bench author {rng.randint(1, 100)}',
+        'release_date': '2020-01-01',
+    }
+
+
+SCENARIOS = [
+    Scenario('shop.get_index', 1, lambda rng, v: ('GET', '/store/', None)),
+    Scenario('shop.get_book', 200, lambda rng, v: (
+        'GET', f'/store/books/{rng.randint(1, v.books)}', None,
+    )),
+    Scenario('shop.get_books', 60, lambda rng, v: (
+        'GET', '/store/books', {
+            'limit': 20,
+            'offset': rng.randint(0, 10) * 20,
+            'with_total': rng.random() < 0.2,
+        },
+    )),
+    Scenario('shop.search_books', 80, lambda rng, v: (
+        'GET', '/store/books/search', {
+            'q': f'author {rng.randint(1, 99)}', 'limit': 20, 'with_total': rng.random() < 0.5,
+        },
+    )),
+    Scenario('shop.get_top_books', 10, lambda rng, v: (
+        'GET', '/store/books/top', {'days': 7},
+    )),
+    Scenario('shop.get_shop', 60, lambda rng, v: (
+        'GET', f'/store/shops/{rng.randint(1, v.shops)}', None,
+    )),
+    Scenario('shop.get_shops', 20, lambda rng, v: (
+        'GET', '/store/shops', {'limit': 50, 'with_total': rng.random() < 0.5},
+    )),
+    Scenario('shop.get_shop_stock', 10, lambda rng, v: (
+        'GET', f'/store/shops/{rng.randint(1, v.shops)}/stock', {'limit': 50},
+    )),
+    Scenario('shop.get_book_stock', 40, lambda rng, v: (
+        'GET',
+        f'/store/shops/{rng.randint(1, v.shops)}/stock/{rng.randint(1, v.stocked_books)}',
+        None,
+    )),
+    Scenario('shop.get_shop_sales', 5, lambda rng, v: (
+        'GET', f'/store/shops/{rng.randint(1, v.shops)}/sales', None,
+    )),
+    Scenario('shop.get_user', 60, lambda rng, v: (
+        'GET', f'/store/users/{rng.randint(1, v.users)}', None,
+    )),
+    Scenario('shop.get_users', 5, lambda rng, v: (
+        'GET', '/store/users', {'limit': 50, 'with_total': rng.random() < 0.5},
+    )),
+    Scenario('shop.get_user_orders', 120, lambda rng, v: (
+        'GET', f'/store/users/{rng.randint(1, v.users)}/orders', {
+            'limit': 20, 'with_total': rng.random() < 0.5,
+        },
+    )),
+    Scenario('shop.get_order_details', 120, lambda rng, v: (
+        'GET', f'/store/orders/{rng.randint(1, v.orders)}', {
+            'limit': 20, 'with_total': rng.random() < 0.5,
+        },
+    )),
+    Scenario('shop.add_order', 40, lambda rng, v: (
+        'POST',
+        f'/store/users/{rng.randint(1, v.users)}/orders',
+        {'order_items': [
+            {
+                'book_id': book_id,
+                'shop_id': rng.randint(1, v.shops),
+                'book_quantity': rng.randint(1, 3),
+            }
+            for book_id in rng.sample(range(1, v.stocked_books + 1), 3)
+        ]},
+    )),
+    Scenario('shop.add_user', 5, lambda rng, v: ('POST', '/store/users', {
+        'first_name': f'bench {next(_unique)}',
+        'last_name': f'bench {next(_unique)}',
+        'email': f'bench{next(_unique)}@mail',
+    })),
+    Scenario('shop.add_shop', 2, lambda rng, v: ('POST', '/store/shops', {
+        'name': f'bench shop {next(_unique)}',
+        'address': f'bench address {next(_unique)}',
+    })),
+    Scenario('shop.add_book', 5, lambda rng, v: ('POST', '/store/books', _book(rng))),
+    Scenario('shop.add_books', 1, lambda rng, v: (
+        'POST', '/store/books/bulk', {'books': [_book(rng) for _ in range(100)]},
+    )),
+    Scenario('shop.set_book_stock', 2, lambda rng, v: (
+        'PUT',
+        f'/store/shops/{rng.randint(1, v.shops)}/stock/{rng.randint(1, v.stocked_books)}',
+        {'quantity': 10 ** 6},
+    )),
+    Scenario('shop.run_batch', 20, lambda rng, v: ('POST', '/store/batch', {'requests': [
+        {'path': f'/store/users/{rng.randint(1, v.users)}'},
+        {'path': f'/store/users/{rng.randint(1, v.users)}/orders', 'body': {'limit': 5}},
+        *(
+            {'path': f'/store/books/{book_id}'}
+            for book_id in rng.sample(range(1, v.books + 1), 8)
+        ),
+        *(
+            {'path': f'/store/shops/{shop_id}'}
+            for shop_id in rng.sample(range(1, v.shops + 1), min(3, v.shops))
+        ),
+    ]})),
+]
+
+
+def parse_args(argv=None):
+    defaults = Volumes()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', default='file', choices=('file', 'memory'))
+    parser.add_argument('--users', type=int, default=defaults.users)
+    parser.add_argument('--books', type=int, default=defaults.books)
+    parser.add_argument('--shops', type=int, default=defaults.shops)
+    parser.add_argument('--orders', type=int, default=defaults.orders)
+    parser.add_argument('--items-per-order', type=int, default=defaults.items_per_order)
+    parser.add_argument('--stocked-books', type=int, default=defaults.stocked_books)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--only', nargs='*', help='endpoints to run, e.g. shop.get_book')
+    parser.add_argument('--output', help='write results as JSON')
+    parser.add_argument('--compare', help='baseline JSON to compare with')
+    parser.add_argument(
+        '--threshold', type=float, default=0.15,
+        help='relative p95/throughput change reported as a regression',
+    )
+    return parser.parse_args(argv)
+
+
+def make_app(args, path: Optional[str], **overrides):
+    config = {'SQLALCHEMY_TRACK_MODIFICATIONS': False, **overrides}
+    if path is None:
+        config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+            'poolclass': StaticPool,
+            'connect_args': {'check_same_thread': False},
+        }
+    else:
+        config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+        config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': 60}}
+    return create_app(config)
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    index = min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> dict:
+    if not latencies:
+        return {'count': 0, 'errors': errors}
+    return {
+        'count': len(latencies),
+        'errors': errors,
+        'rps': len(latencies) / elapsed,
+        'mean_ms': statistics.mean(latencies) * 1000,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+    }
+
+
+def drive(app, scenarios: List[Scenario], volumes: Volumes, args) -> dict:
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    lock = threading.Lock()
+    weights = [scenario.weight for scenario in scenarios]
+    per_thread = [args.requests // args.threads] * args.threads
+    per_thread[0] += args.requests % args.threads
+
+    def worker(number: int, count: int):
+        rng = random.Random(args.seed * 1000 + number)
+        client = app.test_client()
+        local_latencies = defaultdict(list)
+        local_errors = defaultdict(int)
+        for scenario in rng.choices(scenarios, weights, k=count):
+            method, url, body = scenario.make(rng, volumes)
+            started = time.perf_counter()
+            response = client.open(url, method=method, json=body)
+            local_latencies[scenario.endpoint].append(time.perf_counter() - started)
+            payload = response.get_json(silent=True)
+            if (
+                    response.status_code >= 400
+                    or isinstance(payload, dict) and ('errorText' in payload or 'errorFields' in payload)
+            ):
+                local_errors[scenario.endpoint] += 1
+        with lock:
+            for endpoint, values in local_latencies.items():
+                latencies[endpoint].extend(values)
+            for endpoint, value in local_errors.items():
+                errors[endpoint] += value
+
+    threads = [
+        threading.Thread(target=worker, args=(number, count))
+        for number, count in enumerate(per_thread)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        'elapsed_s': elapsed,
+        'total': summarize(
+            [value for values in latencies.values() for value in values],
+            sum(errors.values()),
+            elapsed,
+        ),
+        'endpoints': {
+            endpoint: summarize(latencies[endpoint], errors[endpoint], elapsed)
+            for endpoint in sorted(latencies)
+        },
+    }
+
+
+def compare(result: dict, baseline: dict, threshold: float) -> List[str]:
+    regressions = []
+    for endpoint, current in result['endpoints'].items():
+        previous = baseline.get('endpoints', {}).get(endpoint)
+        if not previous or not previous.get('count') or not current.get('count'):
+            continue
+        if current['p95_ms'] > previous['p95_ms'] * (1 + threshold):
+            regressions.append(
+                f'{endpoint}: p95 {previous["p95_ms"]:.2f} -> {current["p95_ms"]:.2f} ms'
+            )
+        if current['rps'] < previous['rps'] * (1 - threshold):
+            regressions.append(
+                f'{endpoint}: rps {previous["rps"]:.1f} -> {current["rps"]:.1f}'
+            )
+    return regressions
+
+
+def print_table(result: dict) -> None:
+    print(f'{"endpoint":28} {"count":>6} {"err":>4} {"rps":>8} {"p50":>8} {"p95":>8} {"p99":>8}')
+    rows = list(result['endpoints'].items()) + [('TOTAL', result['total'])]
+    for endpoint, stats in rows:
+        if not stats.get('count'):
+            continue
+        print(
+            f'{endpoint:28} {stats["count"]:6} {stats["errors"]:4} {stats["rps"]:8.1f}'
+            f' {stats["p50_ms"]:8.2f} {stats["p95_ms"]:8.2f} {stats["p99_ms"]:8.2f}'
+        )
+
+
+def run(args) -> int:
+    volumes = Volumes(
+        users=args.users,
+        books=args.books,
+        shops=args.shops,
+        orders=args.orders,
+        items_per_order=args.items_per_order,
+        stocked_books=min(args.stocked_books, args.books),
+    )
+    path = None
+    if args.db == 'file':
+        fd, path = tempfile.mkstemp(suffix='.sqlite')
+        os.close(fd)
+    try:
+        app = make_app(args, path)
+        started = time.perf_counter()
+        with app.app_context():
+            mdl.db.create_all()
+            seed(volumes, random_seed=args.seed)
+            sales.rebuild(log=lambda message: None)
+            totals.rebuild(log=lambda message: None)
+        seeded = time.perf_counter() - started
+
+        routes = {rule.endpoint for rule in app.url_map.iter_rules()} - {'static'}
+        missing = routes - {scenario.endpoint for scenario in SCENARIOS}
+        if missing:
+            print(f'no scenario for: {", ".join(sorted(missing))}')
+        scenarios = [
+            scenario for scenario in SCENARIOS
+            if scenario.endpoint in routes and (not args.only or scenario.endpoint in args.only)
+        ]
+
+        result = drive(app, scenarios, volumes, args)
+        result['config'] = {
+            'db': args.db,
+            'threads': args.threads,
+            'requests': args.requests,
+            'seed': args.seed,
+            'volumes': volumes._asdict(),
+            'seed_s': seeded,
+        }
+        print(f'seeded in {seeded:.1f}s, ran {args.requests} requests in {result["elapsed_s"]:.1f}s')
+        print_table(result)
+
+        if args.output:
+            with open(args.output, 'w') as output:
+                json.dump(result, output, indent=2, sort_keys=True)
+
+        if args.compare:
+            with open(args.compare) as baseline:
+                baseline = json.load(baseline)
+            keys = ('db', 'threads', 'requests', 'seed', 'volumes')
+            if any(baseline.get('config', {}).get(key) != result['config'][key] for key in keys):
+                print('baseline was recorded with a different configuration')
+            regressions = compare(result, baseline, args.threshold)
+            for line in regressions:
+                print(f'REGRESSION {line}')
+            if regressions:
+                return 1
+        return 0
+    finally:
+        if path is not None:
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    sys.exit(run(parse_args()))
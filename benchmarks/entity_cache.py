@@ -0,0 +1,153 @@
+"""Проверка кэша сущностей: попадания, сброс после изменения и общий бэкенд.
+
+    python -m benchmarks.entity_cache
+
+Общий бэкенд (redis и т. п.) заменяет DictBackend над одним словарём:
+два приложения подряд с бэкендами над ним ведут себя как два процесса
+с общим кэшем. Завершается с кодом 1, если какая-то проверка не прошла.
+"""
+import os
+import sys
+import tempfile
+import threading
+from typing import Callable, List, Tuple
+
+from sqlalchemy import event, update
+
+from app import models as mdl
+from app.base import create_app
+from app.cache import DictBackend, entity_cache
+
+
+def make_app(path: str, **config):
+    return create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}',
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'SNAPSHOT_BACKGROUND_REBUILD': False,
+        **config,
+    })
+
+
+class Statements:
+    """Считает SQL-запросы к таблице `table` внутри блока with."""
+
+    def __init__(self, app, table: str):
+        with app.app_context():
+            self.engine = mdl.db.engine
+        self.table = table
+        self.count = 0
+
+    def _count(self, conn, cursor, statement, *args) -> None:
+        if f'FROM {self.table}' in statement:
+            self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._count)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(self.engine, 'before_cursor_execute', self._count)
+
+
+def first_name(client, user_id: int = 1):
+    return client.get(f'/store/users/{user_id}').get_json().get('data', {}).get('first_name')
+
+
+def run() -> int:
+    fd, path = tempfile.mkstemp(suffix='.sqlite')
+    os.close(fd)
+    app = make_app(path)
+    with app.app_context():
+        mdl.db.create_all()
+    app.test_client().post('/store/users', json={
+        'first_name': 'first', 'last_name': 'last', 'email': 'email',
+    })
+
+    checks: List[Tuple[str, Callable[[], bool]]] = []
+
+    def check(name: str):
+        def register(func: Callable[[], bool]):
+            checks.append((name, func))
+            return func
+        return register
+
+    @check('repeated reads are served from the cache')
+    def _():
+        app = make_app(path)
+        client = app.test_client()
+        with Statements(app, 'user') as statements:
+            names = [first_name(client) for _ in range(3)]
+        return (
+            names == ['first'] * 3
+            and statements.count == 1
+            and entity_cache.stats() == {'hits': 2, 'misses': 1}
+        )
+
+    @check('an update is visible after invalidate')
+    def _():
+        app = make_app(path)
+        client = app.test_client()
+        before = first_name(client)
+        with app.app_context():
+            mdl.db.session.execute(
+                update(mdl.User).where(mdl.User.id == 1).values(first_name='renamed')
+            )
+            mdl.db.session.commit()
+        cached = first_name(client)
+        entity_cache.invalidate('user', 1)
+        after = first_name(client)
+        with app.app_context():
+            mdl.db.session.execute(
+                update(mdl.User).where(mdl.User.id == 1).values(first_name='first')
+            )
+            mdl.db.session.commit()
+        entity_cache.invalidate('user', 1)
+        return (before, cached, after) == ('first', 'first', 'renamed')
+
+    @check('processes with a shared backend reuse and invalidate entries')
+    def _():
+        store = {}
+        writer = make_app(path, ENTITY_CACHE_BACKEND=DictBackend(store))
+        shop_id = writer.test_client().post('/store/shops', json={
+            'name': 'shop', 'address': 'address',
+        }).get_json()['data']['id']
+        reader = make_app(path, ENTITY_CACHE_BACKEND=DictBackend(store))
+        with Statements(reader, 'shop') as statements:
+            shop = reader.test_client().get(f'/store/shops/{shop_id}').get_json()['data']
+        entity_cache.invalidate('shop', shop_id)
+        return (
+            shop['name'] == 'shop'
+            and statements.count == 0
+            and entity_cache.key('shop', shop_id) not in store
+        )
+
+    @check('hit and miss counters are exact under concurrent reads')
+    def _():
+        make_app(path)
+        threads, calls = 16, 500
+
+        def worker():
+            for number in range(calls):
+                entity_cache.get_or_load('book', number % 10, lambda entity_id: {'id': entity_id})
+
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        stats = entity_cache.stats()
+        return stats['hits'] + stats['misses'] == threads * calls
+
+    failed = 0
+    try:
+        for name, func in checks:
+            ok = func()
+            failed += not ok
+            print(f'{"ok" if ok else "FAIL":4} {name}')
+    finally:
+        os.remove(path)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(run())
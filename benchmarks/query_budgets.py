@@ -0,0 +1,112 @@
+"""Проверка бюджетов SQL-запросов у ручек shop_bp.
+
+    python -m benchmarks.query_budgets [--runs 20]
+
+Прогоняет сценарии из benchmarks.endpoints в режиме testing, где
+превышение бюджета бросает QueryBudgetExceeded, и печатает наибольшее
+число запросов на вызов рядом с объявленным бюджетом. Кроме того,
+оформляет один заказ из LARGE_ORDER_LINES строк с остатками. Завершается
+с кодом 1, если бюджет превышен, у ручки его нет или большой заказ не
+прошёл.
+"""
+import argparse
+import random
+import sys
+from collections import defaultdict
+from typing import Dict
+
+from app import models as mdl
+from app.base import create_app
+from app.budget import QueryBudget
+from app.exceptions import QueryBudgetExceeded
+from benchmarks.endpoints import SCENARIOS
+from benchmarks.seed import Volumes, seed
+
+# Ручки, которые не ходят в базу и бюджет не объявляют.
+UNBUDGETED = ('shop.get_index', 'metrics', 'static')
+
+# Больше 1000: на столько ключей одно условие OR SQLite уже не разбирает.
+LARGE_ORDER_LINES = 1200
+
+
+def large_order(rng: random.Random, volumes: Volumes) -> dict:
+    pairs = rng.sample([
+        (shop_id, book_id)
+        for shop_id in range(1, volumes.shops + 1)
+        for book_id in range(1, volumes.stocked_books + 1)
+    ], LARGE_ORDER_LINES)
+    return {'order_items': [
+        {'book_id': book_id, 'shop_id': shop_id, 'book_quantity': 1}
+        for shop_id, book_id in pairs
+    ]}
+
+
+def run(runs: int, random_seed: int = 0) -> int:
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+        # Фоновая пересборка снимков открыла бы вторую, пустую базу в памяти.
+        'SNAPSHOT_BACKGROUND_REBUILD': False,
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'TESTING': True,
+    })
+    volumes = Volumes(users=50, books=500, shops=10, orders=500, stocked_books=200)
+    rng = random.Random(random_seed)
+    worst: Dict[str, int] = defaultdict(int)
+    exceeded: Dict[str, str] = {}
+    with app.app_context():
+        mdl.db.create_all()
+        seed(volumes, random_seed)
+        client = app.test_client()
+        for scenario in SCENARIOS:
+            for _ in range(runs):
+                method, url, body = scenario.make(rng, volumes)
+                try:
+                    with QueryBudget(sys.maxsize, scenario.endpoint) as total:
+                        client.open(url, method=method, json=body)
+                except QueryBudgetExceeded as error:
+                    exceeded[scenario.endpoint] = str(error)
+                worst[scenario.endpoint] = max(worst[scenario.endpoint], total.count)
+        large_error = None
+        try:
+            with QueryBudget(sys.maxsize, 'shop.add_order') as total:
+                response = client.post('/store/users/1/orders', json=large_order(rng, volumes))
+            payload = response.get_json(silent=True) or {}
+            if response.status_code != 200 or 'errorText' in payload:
+                large_error = f'{response.status_code} {payload}'
+        except QueryBudgetExceeded as error:
+            exceeded['shop.add_order'] = str(error)
+        except Exception as error:
+            # В режиме testing ошибка ручки доходит сюда, а не до ответа 500.
+            large_error = repr(error)
+        worst['shop.add_order'] = max(worst['shop.add_order'], total.count)
+
+    failed = 0
+    for endpoint, view in sorted(app.view_functions.items()):
+        if endpoint in UNBUDGETED:
+            continue
+        budget = getattr(view, 'query_budget', None)
+        if budget is None:
+            status, failed = 'FAIL', failed + 1
+            note = 'no budget'
+        elif endpoint in exceeded:
+            status, failed = 'FAIL', failed + 1
+            note = exceeded[endpoint]
+        else:
+            status = 'ok'
+            note = f'budget {"dynamic" if callable(budget) else budget}'
+        count = worst.get(endpoint, '-')
+        print(f'{status:4} {endpoint:28} {count:>3} queries, {note}')
+    if large_error:
+        failed += 1
+        print(f'FAIL order of {LARGE_ORDER_LINES} lines: {large_error}')
+    else:
+        print(f'ok   order of {LARGE_ORDER_LINES} lines')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    sys.exit(run(args.runs, args.seed))
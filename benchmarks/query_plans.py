@@ -0,0 +1,175 @@
+"""Проверка планов запросов контроллера на SQLite.
+
+    python -m benchmarks.query_plans [-v]
+
+Для каждого сценария перехватывает SQL, который выполняет BookStoreController,
+снимает EXPLAIN QUERY PLAN и падает (код 1), если запрос сканирует таблицу
+без индекса или сортирует во временном B-дереве.
+"""
+import argparse
+import re
+import sys
+from datetime import date
+from typing import Callable, Dict, List, NamedTuple, Tuple
+
+from sqlalchemy import event
+
+from app import archive, models as mdl
+from app.base import create_app
+from app.views import BookStoreController
+from benchmarks.seed import Volumes, seed
+
+
+class Case(NamedTuple):
+    name: str
+    call: Callable[[], object]
+    # Таблицы, которые можно читать подряд по первичному ключу (страница с LIMIT).
+    pk_scans: Tuple[str, ...] = ()
+    # Ранжирование агрегатов за окно неизбежно сортирует строки этого окна.
+    sorts: bool = False
+
+
+CASES = [
+    Case('get_book', lambda: BookStoreController.get_book(1)),
+    Case('get_shop', lambda: BookStoreController.get_shop(1)),
+    Case('get_user', lambda: BookStoreController.get_user(1)),
+    Case('get_books', lambda: BookStoreController.get_books(limit=10), ('book',)),
+    Case('get_books by author', lambda: BookStoreController.get_books(
+        limit=10, author='author 1', sort='release_date',
+    )),
+    Case('get_books by release date', lambda: BookStoreController.get_books(
+        limit=10,
+        released_from=date(2001, 1, 1),
+        released_to=date(2005, 1, 1),
+        sort='release_date',
+    )),
+    Case('get_books by name', lambda: BookStoreController.get_books(
+        limit=10, sort='name',
+    )),
+    Case('search_books', lambda: BookStoreController.search_books(
+        q='book 1', limit=10,
+    )),
+    Case('get_shops', lambda: BookStoreController.get_shops(limit=10), ('shop',)),
+    Case('get_users', lambda: BookStoreController.get_users(limit=10), ('user',)),
+    Case('get_orders', lambda: BookStoreController.get_orders(user_id=1, limit=10)),
+    Case('get_orders cursor', lambda: BookStoreController.get_orders(
+        user_id=1,
+        limit=10,
+        cursor=BookStoreController.get_orders(user_id=1, limit=10).next_cursor,
+    )),
+    Case('get_orders with archive', lambda: BookStoreController.get_orders(
+        user_id=1, limit=100,
+    )),
+    Case('get_order_items', lambda: BookStoreController.get_order_items(
+        order_id=1, limit=5,
+    )),
+    Case('get_order_items cursor', lambda: BookStoreController.get_order_items(
+        order_id=1,
+        limit=5,
+        cursor=BookStoreController.get_order_items(order_id=1, limit=5).next_cursor,
+    )),
+    Case('get_stock', lambda: BookStoreController.get_stock(shop_id=1, limit=10)),
+    Case('get_shop_sales', lambda: BookStoreController.get_shop_sales(shop_id=1)),
+    Case(
+        'get_top_books',
+        lambda: BookStoreController.get_top_books(days=7),
+        pk_scans=('anon_1',),
+        sorts=True,
+    ),
+    Case('archive', lambda: archive.archive(archive.horizon(180), log=lambda message: None)),
+    Case('add_books', lambda: BookStoreController.add_books([
+        {'name': 'book 1', 'author': 'author 1', 'release_date': date(2001, 1, 1)},
+        {'name': 'new book', 'author': 'author 1', 'release_date': date(2001, 1, 1)},
+    ])),
+    Case('add_order', lambda: BookStoreController.add_order(
+        user_id=1,
+        order_items=[
+            {'book_id': 1, 'shop_id': 1, 'book_quantity': 1},
+            {'book_id': 2, 'shop_id': 2, 'book_quantity': 1},
+        ],
+    )),
+]
+
+_BAD_PLAN = re.compile(r'USE TEMP B-TREE|^SCAN (\w+)(?!.*USING (COVERING )?INDEX)')
+
+
+def capture(engine, call: Callable[[], object]) -> List[Tuple[str, tuple]]:
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE')):
+            statements.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        call()
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+    return statements
+
+
+def explain(engine, statement: str, parameters: tuple) -> List[str]:
+    with engine.connect() as connection:
+        rows = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters)
+        return [row[-1] for row in rows]
+
+
+def problems(plan: List[str], case: Case) -> List[str]:
+    found = []
+    for line in plan:
+        match = _BAD_PLAN.search(line)
+        if match is None:
+            continue
+        if match.group(1) and match.group(1) in case.pk_scans:
+            continue
+        if not match.group(1) and case.sorts:
+            continue
+        found.append(line)
+    return found
+
+
+def run(verbose: bool = False) -> int:
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+        # Фоновая пересборка снимков открыла бы вторую, пустую базу в памяти.
+        'SNAPSHOT_BACKGROUND_REBUILD': False,
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'ENTITY_CACHE_ENABLED': False,
+    })
+    failed = 0
+    with app.app_context():
+        mdl.db.create_all()
+        seed(Volumes(
+            users=20, books=200, shops=10, orders=500,
+            items_per_order=12, stocked_books=200,
+        ))
+        mdl.db.session.execute('ANALYZE')
+        engine = mdl.db.engine
+        for case in CASES:
+            with app.test_request_context():
+                statements = capture(engine, case.call)
+                mdl.db.session.rollback()
+            plans: Dict[str, List[str]] = {
+                statement: explain(engine, statement, parameters)
+                for statement, parameters in statements
+            }
+            bad = {
+                statement: problems(plan, case)
+                for statement, plan in plans.items()
+            }
+            bad = {statement: lines for statement, lines in bad.items() if lines}
+            status = 'FAIL' if bad else 'ok'
+            print(f'{status:4} {case.name} ({len(statements)} queries)')
+            if bad or verbose:
+                for statement, plan in plans.items():
+                    print('     ' + ' '.join(statement.split()))
+                    for line in plan:
+                        print('       ' + line)
+            failed += bool(bad)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-v', '--verbose', action='store_true')
+    sys.exit(run(parser.parse_args().verbose))
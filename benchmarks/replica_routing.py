@@ -0,0 +1,141 @@
+"""Проверка маршрутизации чтений на реплики на двух файлах SQLite.
+
+    python -m benchmarks.replica_routing
+
+Основная база и реплика — разные файлы без репликации между ними,
+поэтому по ответу видно, откуда прочитаны данные. Завершается с кодом 1,
+если какая-то проверка не прошла.
+"""
+import os
+import sys
+import tempfile
+import time
+from typing import Callable, List, Tuple
+
+from sqlalchemy import create_engine, insert
+
+from app import models as mdl, versions
+from app.base import create_app
+from app.snapshots import snapshots
+
+
+def make_app(directory: str, replica_uris: List[str], **config):
+    return create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{directory}/primary.db',
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'SQLALCHEMY_REPLICA_URIS': replica_uris,
+        'ENTITY_CACHE_ENABLED': False,
+        'RESERVE_STOCK': False,
+        **config,
+    })
+
+
+def first_name(client, user_id: int = 1):
+    return client.get(f'/store/users/{user_id}').get_json().get('data', {}).get('first_name')
+
+
+def run() -> int:
+    directory = tempfile.mkdtemp()
+    primary_uri = f'sqlite:///{directory}/primary.db'
+    replica_uri = f'sqlite:///{directory}/replica.db'
+    for uri, name in ((primary_uri, 'primary'), (replica_uri, 'replica')):
+        engine = create_engine(uri)
+        mdl.db.metadata.create_all(engine)
+        engine.execute(insert(mdl.User).values(
+            id=1, first_name=name, last_name=name, email=name,
+        ))
+        engine.dispose()
+    missing_uri = f'sqlite:///{directory}/missing/replica.db'
+    empty_path = os.path.join(directory, 'empty.db')
+    open(empty_path, 'w').close()
+
+    checks: List[Tuple[str, Callable[[], bool]]] = []
+
+    def check(name: str):
+        def register(func: Callable[[], bool]):
+            checks.append((name, func))
+            return func
+        return register
+
+    @check('reads go to the replica')
+    def _():
+        client = make_app(directory, [replica_uri]).test_client()
+        return first_name(client) == 'replica'
+
+    @check('replicas are used round-robin')
+    def _():
+        client = make_app(directory, [replica_uri, primary_uri]).test_client()
+        return [first_name(client) for _ in range(4)] == ['replica', 'primary'] * 2
+
+    @check('unavailable replica is skipped')
+    def _():
+        client = make_app(directory, [missing_uri, replica_uri]).test_client()
+        return [first_name(client) for _ in range(3)] == ['replica'] * 3
+
+    @check('failed replica read falls back to the primary')
+    def _():
+        client = make_app(directory, [f'sqlite:///{empty_path}']).test_client()
+        return first_name(client) == 'primary'
+
+    @check('writes go to the primary')
+    def _():
+        client = make_app(directory, [replica_uri]).test_client()
+        client.post('/store/shops', json={'name': 'shop', 'address': 'address'})
+        engine = create_engine(primary_uri)
+        count = engine.execute('SELECT count(*) FROM shop').scalar()
+        engine.dispose()
+        return count == 1
+
+    @check('orders are read from the primary within the read-your-writes window')
+    def _():
+        client = make_app(
+            directory, [replica_uri], READ_YOUR_WRITES_SECONDS=0.5,
+        ).test_client()
+        client.post('/store/books', json={
+            'name': 'book', 'author': 'author', 'release_date': '2020-01-01',
+        })
+        order_id = client.post('/store/users/1/orders', json={'order_items': [
+            {'book_id': 1, 'shop_id': 1, 'book_quantity': 1},
+        ]}).get_json()['order_id']
+        fresh = client.get('/store/users/1/orders').get_json()['data']['orders']
+        details = client.get(f'/store/orders/{order_id}').get_json()
+        time.sleep(0.6)
+        stale = client.get('/store/users/1/orders').get_json()['data']['orders']
+        return len(fresh) == 1 and 'data' in details and stale == []
+
+    @check('ETag is computed from the replica that served the body')
+    def _():
+        # Основная база уже отличается от реплики версией 'shop'.
+        etag = make_app(directory, [replica_uri]).test_client().get('/store/shops').headers['ETag']
+        replica_only = create_app({
+            'SQLALCHEMY_DATABASE_URI': replica_uri,
+            'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        })
+        return replica_only.test_client().get('/store/shops').headers['ETag'] == etag
+
+    @check('snapshot rebuilds read versions and data from the primary')
+    def _():
+        app = make_app(directory, [replica_uri])
+        client = app.test_client()
+        client.get('/store/shops')
+        client.post('/store/shops', json={'name': 'rebuilt', 'address': 'rebuilt'})
+        deadline = time.monotonic() + 5
+        while not snapshots.rebuilds and time.monotonic() < deadline:
+            time.sleep(0.01)
+        with app.app_context():
+            state, _ = versions.read(['shop'])
+        return [
+            (snapshot.state, b'rebuilt' in snapshot.body)
+            for snapshot in list(snapshots._entries.values())
+        ] == [(state, True)]
+
+    failed = 0
+    for name, func in checks:
+        ok = func()
+        failed += not ok
+        print(f'{"ok" if ok else "FAIL":4} {name}')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(run())
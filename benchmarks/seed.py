@@ -0,0 +1,77 @@
+import random
+from datetime import date, datetime, timedelta
+from typing import Iterable, Iterator, List, NamedTuple
+
+from app import models as mdl
+from app.constants import BULK_CHUNK_SIZE
+
+
+class Volumes(NamedTuple):
+    users: int = 1000
+    books: int = 5000
+    shops: int = 50
+    orders: int = 20000
+    items_per_order: int = 5
+    stocked_books: int = 1000
+
+
+def _chunks(rows: Iterable[dict], size: int = BULK_CHUNK_SIZE * 10) -> Iterator[List[dict]]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _insert(model, rows: Iterable[dict]) -> None:
+    for chunk in _chunks(rows):
+        mdl.db.session.bulk_insert_mappings(model, chunk)
+    mdl.db.session.commit()
+
+
+def seed(volumes: Volumes, random_seed: int = 0) -> None:
+    """Заполняет пустую базу синтетическими данными. Повторяемо при одном `random_seed`."""
+    rng = random.Random(random_seed)
+    today = datetime.utcnow().date()
+
+    _insert(mdl.User, (
+        {'first_name': f'first {i}', 'last_name': f'last {i}', 'email': f'user{i}@mail'}
+        for i in range(volumes.users)
+    ))
+    _insert(mdl.Shop, (
+        {'name': f'shop {i}', 'address': f'address {i}'}
+        for i in range(volumes.shops)
+    ))
+    _insert(mdl.Book, (
+        {
+            'name': f'book {i}',
+            'author': f'author {i % max(volumes.books // 10, 1)}',
+            'release_date': date(1950 + i % 70, 1 + i % 12, 1),
+        }
+        for i in range(volumes.books)
+    ))
+    _insert(mdl.ShopStock, (
+        {'shop_id': shop, 'book_id': book, 'shard': 0, 'quantity': 10 ** 6}
+        for shop in range(1, volumes.shops + 1)
+        for book in range(1, min(volumes.stocked_books, volumes.books) + 1)
+    ))
+    _insert(mdl.Order, (
+        {
+            'user_id': rng.randint(1, volumes.users),
+            'reg_date': today - timedelta(days=rng.randint(0, 365)),
+        }
+        for _ in range(volumes.orders)
+    ))
+    _insert(mdl.OrderItem, (
+        {
+            'order_id': order,
+            'book_id': book,
+            'shop_id': rng.randint(1, volumes.shops),
+            'book_quantity': rng.randint(1, 3),
+        }
+        for order in range(1, volumes.orders + 1)
+        for book in rng.sample(range(1, volumes.books + 1), min(volumes.items_per_order, volumes.books))
+    ))
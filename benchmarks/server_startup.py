@@ -0,0 +1,102 @@
+"""Время запуска и остановки сервера `python main.py` на SQLite.
+
+    python -m benchmarks.server_startup --workers 4 --threads 4
+
+Запускает сервер с настройками из временного файла (BOOKSTORE_SETTINGS),
+опрашивает его до первого ответа, затем останавливает по SIGTERM.
+Печатает время до первого ответа, строки воркеров о прогреве и первом
+запросе и время остановки. Завершается с кодом 1, если сервер не ответил
+или не остановился в срок.
+"""
+import argparse
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from app import models as mdl
+from app.base import create_app
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--timeout', type=float, default=60)
+    return parser.parse_args(argv)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def first_response(url: str, deadline: float) -> bool:
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                return response.status == 200
+        except OSError:
+            time.sleep(0.01)
+    return False
+
+
+def run(args) -> int:
+    directory = tempfile.mkdtemp()
+    database = os.path.join(directory, 'store.sqlite')
+    settings = os.path.join(directory, 'settings.py')
+    with open(settings, 'w') as file:
+        file.write(
+            f'SQLALCHEMY_DATABASE_URI = {f"sqlite:///{database}"!r}\n'
+            'SQLALCHEMY_TRACK_MODIFICATIONS = False\n'
+        )
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{database}',
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+    })
+    with app.app_context():
+        mdl.db.create_all()
+
+    port = free_port()
+    started = time.monotonic()
+    server = subprocess.Popen(
+        [
+            sys.executable, 'main.py', '--bind', f'127.0.0.1:{port}',
+            '--workers', str(args.workers), '--threads', str(args.threads),
+        ],
+        env={**os.environ, 'BOOKSTORE_SETTINGS': settings},
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    answered = first_response(
+        f'http://127.0.0.1:{port}/store/shops', started + args.timeout,
+    )
+    first = time.monotonic() - started
+
+    server.send_signal(signal.SIGTERM)
+    stopping = time.monotonic()
+    try:
+        _, log = server.communicate(timeout=args.timeout)
+        stopped = True
+    except subprocess.TimeoutExpired:
+        server.kill()
+        _, log = server.communicate()
+        stopped = False
+    shutdown = time.monotonic() - stopping
+
+    for line in log.splitlines():
+        if 'ready in' in line or 'first request' in line:
+            print(line.split('] ', 2)[-1])
+    print(f'workers:        {args.workers} x {args.threads} threads')
+    print(f'first response: {first:.3f}s' if answered else 'first response: none')
+    print(f'shutdown:       {shutdown:.3f}s, exit code {server.returncode}')
+    return 0 if answered and stopped else 1
+
+
+if __name__ == '__main__':
+    sys.exit(run(parse_args()))
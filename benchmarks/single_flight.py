@@ -0,0 +1,107 @@
+"""Склеивание одновременных одинаковых чтений (SINGLE_FLIGHT_ENABLED).
+
+    python -m benchmarks.single_flight --threads 32 --rounds 50
+
+На файле SQLite --threads потоков одновременно (через барьер) запрашивают
+одну и ту же книгу, а затем один и тот же заказ, --rounds раз подряд.
+Для режимов без склеивания и со склеиванием печатает число SQL-запросов,
+время и долю склеенных вызовов. Кэш сущностей выключен, чтобы каждый
+вызов доходил до базы. Завершается с кодом 1, если ответы режимов
+различаются.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from sqlalchemy import event
+
+from app import models as mdl
+from app.singleflight import single_flight
+from benchmarks.endpoints import make_app
+from benchmarks.seed import Volumes, seed
+
+
+TARGETS = (
+    ('get_book', '/store/books/1'),
+    ('get_order_details', '/store/orders/1'),
+)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--rounds', type=int, default=50)
+    return parser.parse_args(argv)
+
+
+def hammer(app, url: str, threads: int, rounds: int) -> set:
+    barrier = threading.Barrier(threads)
+    bodies = set()
+    lock = threading.Lock()
+
+    def worker():
+        client = app.test_client()
+        for _ in range(rounds):
+            barrier.wait()
+            body = client.get(url, json={'limit': 20}).get_data(as_text=True)
+            with lock:
+                bodies.add(body)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return bodies
+
+
+def run(args) -> int:
+    fd, path = tempfile.mkstemp(suffix='.sqlite')
+    os.close(fd)
+    try:
+        options = argparse.Namespace()
+        app = make_app(options, path)
+        with app.app_context():
+            mdl.db.create_all()
+            seed(Volumes(users=10, books=100, shops=5, orders=20, stocked_books=50))
+
+        responses = {}
+        print(f'{"endpoint":20} {"mode":10} {"queries":>8} {"seconds":>8} {"shared":>7}')
+        for name, url in TARGETS:
+            for mode, enabled in (('direct', False), ('coalesced', True)):
+                app = make_app(
+                    options, path,
+                    ENTITY_CACHE_ENABLED=False,
+                    SINGLE_FLIGHT_ENABLED=enabled,
+                    SNAPSHOTS_ENABLED=False,
+                )
+                with app.app_context():
+                    engine = mdl.db.engine
+                queries = [0]
+
+                def count(*_):
+                    queries[0] += 1
+
+                event.listen(engine, 'before_cursor_execute', count)
+                started = time.perf_counter()
+                bodies = hammer(app, url, args.threads, args.rounds)
+                elapsed = time.perf_counter() - started
+                event.remove(engine, 'before_cursor_execute', count)
+                responses.setdefault(name, set()).update(bodies)
+                print(
+                    f'{name:20} {mode:10} {queries[0]:8} {elapsed:8.2f}'
+                    f' {single_flight.ratio:7.1%}'
+                )
+        mismatched = [name for name, bodies in responses.items() if len(bodies) != 1]
+        for name in mismatched:
+            print(f'{name}: responses differ between modes')
+        return 1 if mismatched else 0
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    sys.exit(run(parse_args()))
@@ -0,0 +1,116 @@
+"""Конкурентное списание остатков одной книги на SQLite.
+
+    python -m benchmarks.stock_contention --threads 32 --orders 2000 --stock 500
+    python -m benchmarks.stock_contention --group-commit
+
+Проверяет, что продано не больше, чем было на складе, и печатает пропускную
+способность. С --group-commit заказы проводятся общими коммитами
+(GROUP_COMMIT). Завершается с кодом 1, если обнаружена перепродажа.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from sqlalchemy import func
+
+from app import models as mdl
+from app.base import create_app
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--orders', type=int, default=2000)
+    parser.add_argument('--stock', type=int, default=500)
+    parser.add_argument('--shards', type=int, default=8)
+    parser.add_argument('--group-commit', action='store_true')
+    return parser.parse_args(argv)
+
+
+def make_app(path: str, group_commit: bool = False):
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}',
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'SQLALCHEMY_ENGINE_OPTIONS': {'connect_args': {'timeout': 60}},
+        'GROUP_COMMIT': group_commit,
+    })
+    with app.app_context():
+        mdl.db.create_all()
+    return app
+
+
+def run(args) -> int:
+    fd, path = tempfile.mkstemp(suffix='.sqlite')
+    os.close(fd)
+    try:
+        app = make_app(path, args.group_commit)
+        client = app.test_client()
+        client.post('/store/users', json={
+            'first_name': 'bench', 'last_name': 'bench', 'email': 'bench',
+        })
+        client.post('/store/shops', json={'name': 'bench', 'address': 'bench'})
+        client.post('/store/books', json={
+            'name': 'bench', 'author': 'bench', 'release_date': '2000-01-01',
+        })
+        client.put('/store/shops/1/stock/1', json={
+            'quantity': args.stock, 'shards': args.shards,
+        })
+
+        counts = {'placed': 0, 'rejected': 0, 'failed': 0}
+        lock = threading.Lock()
+        per_thread = [args.orders // args.threads] * args.threads
+        per_thread[0] += args.orders % args.threads
+        order = {'order_items': [{'book_id': 1, 'shop_id': 1, 'book_quantity': 1}]}
+
+        def worker(orders: int):
+            local = app.test_client()
+            result = {'placed': 0, 'rejected': 0, 'failed': 0}
+            for _ in range(orders):
+                response = local.post('/store/users/1/orders', json=order)
+                body = response.get_json() or {}
+                if response.status_code != 200:
+                    result['failed'] += 1
+                elif 'order_id' in body:
+                    result['placed'] += 1
+                else:
+                    result['rejected'] += 1
+            with lock:
+                for key, value in result.items():
+                    counts[key] += value
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in per_thread]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        with app.app_context():
+            left = mdl.db.session.query(func.sum(mdl.ShopStock.quantity)).scalar()
+            sold = mdl.db.session.query(func.sum(mdl.OrderItem.book_quantity)).scalar() or 0
+            negative = mdl.ShopStock.query.filter(mdl.ShopStock.quantity < 0).count()
+
+        print(f'orders:     {args.orders} in {args.threads} threads, {args.shards} shards')
+        print(f'placed:     {counts["placed"]}, sold out: {counts["rejected"]}, errors: {counts["failed"]}')
+        print(f'stock:      {args.stock} -> {left}, sold {sold}')
+        print(f'throughput: {args.orders / elapsed:.1f} orders/s ({elapsed:.2f}s)')
+
+        oversold = (
+            negative
+            or sold != counts['placed']
+            or sold + left != args.stock
+        )
+        if oversold:
+            print('OVERSOLD')
+            return 1
+        return 0
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    sys.exit(run(parse_args()))
@@ -1,4 +1,6 @@
 from flask import Flask
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.schema import AddConstraint
 from app.models import *
 
 SQLALCHEMY_DATABASE_URI = (
@@ -11,8 +13,50 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 db.init_app(app)
 
+
+def create_missing_indexes():
+    inspector = sa_inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                app.logger.info('Creating index %s', index.name)
+                index.create(db.engine)
+
+
+def create_missing_foreign_keys():
+    # load_data.py --rebuild-indexes на MySQL снимает внешние ключи вместе
+    # с индексами; если загрузку убили, ключи возвращаются здесь.
+    inspector = sa_inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = [key['constrained_columns'] for key in inspector.get_foreign_keys(table.name)]
+        for constraint in table.foreign_key_constraints:
+            if [column.name for column in constraint.columns] not in existing:
+                app.logger.info('Creating foreign key %s.%s', table.name, constraint.column_keys[0])
+                with db.engine.begin() as connection:
+                    connection.execute(AddConstraint(constraint))
+
+
+def drop_outdated_row_count():
+    # row_count выводится из таблиц: таблицу без шардов проще создать
+    # заново и заполнить через rebuild_totals.py.
+    inspector = sa_inspect(db.engine)
+    if not inspector.has_table(RowCount.__tablename__):
+        return
+    columns = {column['name'] for column in inspector.get_columns(RowCount.__tablename__)}
+    if 'shard' not in columns:
+        app.logger.warning('Recreating row_count, run rebuild_totals.py afterwards')
+        RowCount.__table__.drop(db.engine)
+
+
 if __name__ == '__main__':
     with app.app_context():
+        drop_outdated_row_count()
         db.create_all()
+        create_missing_indexes()
+        create_missing_foreign_keys()
         db.session.commit()
-
@@ -0,0 +1,53 @@
+import argparse
+import sys
+
+from sqlalchemy.exc import IntegrityError
+
+from app import loader, sales
+from app.base import create_app
+from app.constants import LOAD_CHUNK_SIZE
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Загрузка данных магазина из CSV/NDJSON')
+    parser.add_argument('kind', choices=sorted(loader.KINDS))
+    parser.add_argument('path', help='файл .csv, .ndjson или .jsonl, можно сжатый .gz')
+    parser.add_argument('--format', choices=loader.FORMATS, help='по умолчанию по расширению')
+    parser.add_argument('--chunk-size', type=int, default=LOAD_CHUNK_SIZE)
+    parser.add_argument(
+        '--rebuild-indexes', action='store_true',
+        help='снять вторичные индексы таблицы на время загрузки',
+    )
+    parser.add_argument(
+        '--rebuild-sales', action='store_true',
+        help='пересчитать сводки продаж по всем заказам после загрузки',
+    )
+    parser.add_argument(
+        '--restart', action='store_true',
+        help='забыть сохранённый прогресс и загрузить файл с начала',
+    )
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    app = create_app()
+    with app.app_context():
+        if args.restart:
+            loader.reset(loader.source_key(args.kind, args.path))
+        try:
+            report = loader.load(
+                args.kind,
+                args.path,
+                format=args.format,
+                chunk_size=args.chunk_size,
+                rebuild_indexes=args.rebuild_indexes,
+            )
+        except (ValueError, IntegrityError) as error:
+            sys.exit(str(error))
+        if args.rebuild_sales:
+            sales.rebuild(log=app.logger.info)
+    print(
+        f'Loaded {report.loaded} {args.kind} in {report.seconds:.1f}s '
+        f'({report.rate:.0f} rows/s), {report.skipped} loaded earlier'
+    )
@@ -1,11 +1,35 @@
+import argparse
+import time
+
+started = time.monotonic()
+
 from app.base import create_app
 
 
 app = create_app()
 
-if __name__ == 'main':
-    app.run(debug=True)
-    app.logger.info('---------- App is running --------')
-    
-    
 
+def parse_args():
+    parser = argparse.ArgumentParser(description='Магазин книг')
+    parser.add_argument('--debug', action='store_true', help='отладочный сервер Flask')
+    parser.add_argument('--bind')
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--threads', type=int)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.debug:
+        app.run(debug=True)
+    else:
+        from app.server import Server
+
+        for key, value in (
+                ('SERVER_BIND', args.bind),
+                ('SERVER_WORKERS', args.workers),
+                ('SERVER_THREADS', args.threads),
+        ):
+            if value is not None:
+                app.config[key] = value
+        Server(app, started).run()
@@ -0,0 +1,13 @@
+import sys
+
+from app import sales
+from app.base import create_app
+from app.constants import BULK_CHUNK_SIZE
+
+
+if __name__ == '__main__':
+    app = create_app()
+    chunk_size = int(sys.argv[1]) if len(sys.argv) > 1 else BULK_CHUNK_SIZE
+    with app.app_context():
+        total = sales.rebuild(chunk_size=chunk_size, log=app.logger.info)
+    print(f'Rebuilt sales from {total} orders')